@@ -0,0 +1,154 @@
+from datetime import date, datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import stock
+from app.core.deps import require_admin
+from app.core.metrics import DB_POOL_WAIT
+from app.db.models import Product
+from app.db.repositories import AnalyticsRepository
+from app.db.session import get_db, pool_stats
+from app.schemas.admin import DbPoolStats, HotStockRead
+from app.schemas.analytics import AnalyticsSummary, DailySalesRead, SegmentSalesRead, TopProductRead
+
+router = APIRouter(prefix="/api/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def _date_range(date_from: date | None, date_to: date | None) -> tuple[date, date]:
+    date_to = date_to or _today()
+    date_from = date_from or date_to - timedelta(days=29)
+    if date_from > date_to:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid date range")
+    return date_from, date_to
+
+
+@router.get(
+    "/analytics",
+    response_model=AnalyticsSummary,
+    summary="Сводка продаж",
+    description="Читает только агрегаты: стоимость не зависит от количества заказов.",
+)
+async def analytics_summary(db: AsyncSession = Depends(get_db)) -> AnalyticsSummary:
+    repo = AnalyticsRepository(db)
+    today = _today()
+    totals = await repo.summary(today)
+    daily = await repo.daily(today - timedelta(days=29), today)
+    return AnalyticsSummary(
+        total_orders=totals.total_orders,
+        today_orders=totals.today_orders,
+        week_orders=totals.week_orders,
+        month_orders=totals.month_orders,
+        status_counts=await repo.status_counts(),
+        total_revenue=totals.total_revenue,
+        today_revenue=totals.today_revenue,
+        week_revenue=totals.week_revenue,
+        avg_order_value=totals.total_revenue / totals.total_orders if totals.total_orders else 0,
+        daily_orders=[DailySalesRead.model_validate(row) for row in daily],
+    )
+
+
+@router.get(
+    "/analytics/daily",
+    response_model=list[DailySalesRead],
+    summary="Продажи по дням",
+)
+async def analytics_daily(
+    date_from: date | None = None, date_to: date | None = None, db: AsyncSession = Depends(get_db)
+) -> list:
+    return await AnalyticsRepository(db).daily(*_date_range(date_from, date_to))
+
+
+@router.get(
+    "/analytics/categories",
+    response_model=list[SegmentSalesRead],
+    summary="Продажи по категориям",
+)
+async def analytics_categories(
+    date_from: date | None = None, date_to: date | None = None, db: AsyncSession = Depends(get_db)
+) -> list:
+    return await AnalyticsRepository(db).by_segment("category_id", *_date_range(date_from, date_to))
+
+
+@router.get(
+    "/analytics/brands",
+    response_model=list[SegmentSalesRead],
+    summary="Продажи по брендам",
+)
+async def analytics_brands(
+    date_from: date | None = None, date_to: date | None = None, db: AsyncSession = Depends(get_db)
+) -> list:
+    return await AnalyticsRepository(db).by_segment("brand_id", *_date_range(date_from, date_to))
+
+
+@router.get(
+    "/analytics/top-products",
+    response_model=list[TopProductRead],
+    summary="Топ товаров",
+)
+async def analytics_top_products(
+    limit: int = Query(10, ge=1, le=100),
+    by: str = Query("units_sold", pattern="^(units_sold|revenue)$"),
+    db: AsyncSession = Depends(get_db),
+) -> list:
+    return await AnalyticsRepository(db).top_products(limit=limit, by=by)
+
+
+@router.get(
+    "/db/pool",
+    response_model=DbPoolStats,
+    summary="Состояние пула соединений БД",
+    description="Статистика пула текущего процесса (воркера).",
+)
+async def db_pool() -> DbPoolStats:
+    count, total = DB_POOL_WAIT.totals()
+    return DbPoolStats(
+        **pool_stats(),
+        checkout_count=count,
+        checkout_wait_avg_ms=total / count * 1000 if count else 0.0,
+    )
+
+
+@router.get(
+    "/products/{product_id}/hot-stock",
+    response_model=HotStockRead,
+    summary="Hot-режим остатка товара",
+)
+async def get_hot_stock(product_id: int, db: AsyncSession = Depends(get_db)) -> HotStockRead:
+    product = await db.get(Product, product_id)
+    if not product:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    available = await stock.available_stock(product_id) if product.hot_stock else None
+    return HotStockRead(
+        product_id=product_id, hot=product.hot_stock, stock=product.stock if available is None else available
+    )
+
+
+@router.put(
+    "/products/{product_id}/hot-stock",
+    response_model=HotStockRead,
+    summary="Включить hot-режим остатка",
+    description="Остаток переносится в Redis; заказы резервируют его там, не блокируя строку товара.",
+)
+async def enable_hot_stock(product_id: int, db: AsyncSession = Depends(get_db)) -> HotStockRead:
+    available = await stock.enable(db, product_id)
+    if available is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    return HotStockRead(product_id=product_id, hot=True, stock=available)
+
+
+@router.delete(
+    "/products/{product_id}/hot-stock",
+    response_model=HotStockRead,
+    summary="Выключить hot-режим остатка",
+    description="Остаток из Redis записывается в products.stock.",
+)
+async def disable_hot_stock(product_id: int, db: AsyncSession = Depends(get_db)) -> HotStockRead:
+    remaining = await stock.disable(db, product_id)
+    if remaining is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    return HotStockRead(product_id=product_id, hot=False, stock=remaining)
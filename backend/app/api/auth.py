@@ -1,19 +1,19 @@
 import logging
-from datetime import datetime, timezone
 
 from fastapi import APIRouter, Cookie, Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
-from app.core.deps import get_current_user, get_session_expiration
+from app.core.deps import get_current_user, get_session_expiration, set_session_cookie
 from app.core.security import (
     create_access_token,
     generate_session_token,
     hash_password,
     verify_password,
 )
+from app.core.sessions import get_session_store
 from app.db.models import User
-from app.db.repositories import SessionRepository, UserRepository
+from app.db.repositories import UserRepository
 from app.db.session import get_db
 from app.schemas.auth import AuthResponse, LoginRequest, LogoutResponse, RegisterRequest
 from app.schemas.user import UserRead
@@ -62,22 +62,8 @@ async def login(
     access_token = create_access_token(str(user.id))
     session_token = generate_session_token()
     expires_at = get_session_expiration()
-    await SessionRepository(db).create(
-        {
-            "user_id": user.id,
-            "token": session_token,
-            "expires_at": expires_at,
-        }
-    )
-
-    response.set_cookie(
-        settings.session_cookie_name,
-        session_token,
-        httponly=True,
-        max_age=int((expires_at - datetime.now(timezone.utc)).total_seconds()),
-        secure=settings.session_cookie_secure,
-        samesite=settings.session_cookie_samesite,
-    )
+    await get_session_store().create(session_token, user.id, expires_at)
+    set_session_cookie(response, session_token, expires_at)
 
     return AuthResponse(
         access_token=access_token,
@@ -95,15 +81,27 @@ async def login(
 )
 async def logout(
     response: Response,
-    db: AsyncSession = Depends(get_db),
     session_token: str | None = Cookie(default=None, alias=settings.session_cookie_name),
 ) -> LogoutResponse:
     if session_token:
-        await SessionRepository(db).delete_by_token(session_token)
+        await get_session_store().delete(session_token)
         response.delete_cookie(settings.session_cookie_name)
     return LogoutResponse(ok=True)
 
 
+@router.post(
+    "/logout-all",
+    response_model=LogoutResponse,
+    summary="Выход со всех устройств",
+    description="Завершает все сессии текущего пользователя одной операцией.",
+)
+async def logout_all(response: Response, user: User = Depends(get_current_user)) -> LogoutResponse:
+    removed = await get_session_store().delete_user(user.id)
+    response.delete_cookie(settings.session_cookie_name)
+    logger.info("user sessions revoked id=%s count=%s", user.id, removed)
+    return LogoutResponse(ok=True)
+
+
 @router.get(
     "/me",
     response_model=UserRead,
@@ -1,43 +1,168 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import delete, select
+from decimal import Decimal
+
+from fastapi import APIRouter, Cookie, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
 
-from app.core.deps import get_current_user
-from app.db.models import Cart, CartItem, Product, User
-from app.db.repositories import CartItemRepository, CartRepository
+from app.core import cart_store
+from app.core.cache import get_json
+from app.core.cart_store import CartOwner
+from app.core.catalog_cache import product_key
+from app.core.config import settings
+from app.core.deps import get_current_user, get_optional_user
+from app.core.security import generate_session_token
+from app.db.models import Product, User
+from app.db.repositories import CartRepository, CopurchaseRepository
+from app.db.replicas import get_read_db
 from app.db.session import get_db
-from app.schemas.cart import CartItemCreate, CartItemRead, CartItemUpdate, CartRead
+from app.schemas.cart import (
+    CartItemCreate,
+    CartItemRead,
+    CartItemUpdate,
+    CartMerge,
+    CartRead,
+    CartReplace,
+)
+from app.schemas.catalog import ProductRecommendationRead
 
 router = APIRouter(prefix="/api/cart", tags=["cart"])
 
 
-def _get_or_create_cart(user: User, db: AsyncSession) -> Cart:
-    raise RuntimeError("Use async_get_or_create_cart")
+async def get_cart_owner(
+    response: Response,
+    user: User | None = Depends(get_optional_user),
+    cart_token: str | None = Cookie(default=None, alias=settings.cart_cookie_name),
+) -> CartOwner:
+    if user is not None:
+        return CartOwner.for_user(user.id)
+    if not cart_token:
+        cart_token = generate_session_token()
+        response.set_cookie(
+            settings.cart_cookie_name,
+            cart_token,
+            httponly=True,
+            max_age=settings.cart_ttl_seconds,
+            secure=settings.session_cookie_secure,
+            samesite=settings.session_cookie_samesite,
+        )
+    return CartOwner.for_guest(cart_token)
+
+
+async def _get_product_price(product_id: int, db: AsyncSession) -> Decimal:
+    cached = await get_json(product_key(product_id))
+    if cached is not None:
+        return Decimal(str(cached["price"]))
+    product = await db.get(Product, product_id)
+    if not product:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    return Decimal(product.price)
+
+
+async def _resolve_lines(
+    items: list[CartItemCreate], db: AsyncSession
+) -> list[tuple[int, int, Decimal]]:
+    quantities: dict[int, int] = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    if not quantities:
+        return []
+    result = await db.execute(select(Product.id, Product.price).where(Product.id.in_(list(quantities))))
+    prices = {product_id: Decimal(price) for product_id, price in result.all()}
+    if len(prices) != len(quantities):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    return [(product_id, quantity, prices[product_id]) for product_id, quantity in quantities.items()]
 
 
-async def async_get_or_create_cart(user: User, db: AsyncSession) -> Cart:
-    repo = CartRepository(db)
-    cart = await repo.get_active_by_user(user.id)
-    if cart:
-        return cart
-    return await repo.create({"user_id": user.id})
+async def _read_cart(owner: CartOwner, db: AsyncSession) -> dict:
+    cart = await cart_store.get_cart(owner)
+    rows = await CartRepository(db).price_lines(
+        [(item["product_id"], item["quantity"], item["price_snapshot"]) for item in cart["items"]]
+    )
+    cart["items"] = [
+        {
+            "product_id": row.product_id,
+            "quantity": row.quantity,
+            "price_snapshot": row.price_snapshot,
+            "product": row if row.id is not None else None,
+            "line_total": row.line_total or 0,
+            "price_changed": bool(row.price_changed),
+            "in_stock": bool(row.in_stock),
+        }
+        for row in rows
+    ]
+    cart["items_count"] = sum(row.quantity for row in rows)
+    cart["subtotal"] = rows[0].subtotal if rows else 0
+    cart["total"] = rows[0].total if rows else 0
+    cart["has_price_changes"] = any(item["price_changed"] for item in cart["items"])
+    cart["all_in_stock"] = all(item["in_stock"] for item in cart["items"])
+    return cart
 
 
 @router.get(
     "",
     response_model=CartRead,
     summary="Получить корзину",
-    description="Возвращает активную корзину текущего пользователя.",
+    description="Возвращает корзину текущего пользователя или гостя.",
 )
-async def get_cart(user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)) -> Cart:
-    cart = await async_get_or_create_cart(user, db)
-    result = await db.execute(
-        select(Cart)
-        .options(joinedload(Cart.items).joinedload(CartItem.product))
-        .where(Cart.id == cart.id)
-    )
-    return result.scalars().first()
+async def get_cart(owner: CartOwner = Depends(get_cart_owner), db: AsyncSession = Depends(get_db)) -> dict:
+    return await _read_cart(owner, db)
+
+
+@router.get(
+    "/recommendations",
+    response_model=list[ProductRecommendationRead],
+    summary="Рекомендации к корзине",
+    description="Товары, которые чаще всего покупают вместе с содержимым корзины.",
+)
+async def get_cart_recommendations(
+    limit: int = Query(10, ge=1, le=50),
+    owner: CartOwner = Depends(get_cart_owner),
+    db: AsyncSession = Depends(get_read_db),
+) -> list:
+    cart = await cart_store.get_cart(owner)
+    product_ids = [item["product_id"] for item in cart["items"]]
+    return await CopurchaseRepository(db).for_products(product_ids, limit)
+
+
+@router.put(
+    "",
+    response_model=CartRead,
+    summary="Заменить корзину",
+    description="Приводит корзину к переданному набору позиций одним запросом.",
+)
+async def replace_cart(
+    payload: CartReplace,
+    owner: CartOwner = Depends(get_cart_owner),
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    lines = await _resolve_lines(payload.items, db)
+    await cart_store.replace(owner, lines)
+    if owner.user_id is not None:
+        await cart_store.persist_user_cart(owner.user_id)
+    return await _read_cart(owner, db)
+
+
+@router.post(
+    "/merge",
+    response_model=CartRead,
+    summary="Слить гостевую корзину",
+    description="Переносит гостевую корзину (cookie) и локальные позиции в корзину пользователя.",
+)
+async def merge_cart(
+    payload: CartMerge,
+    response: Response,
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    cart_token: str | None = Cookie(default=None, alias=settings.cart_cookie_name),
+) -> dict:
+    owner = CartOwner.for_user(user.id)
+    lines = await _resolve_lines(payload.items, db)
+    guest = CartOwner.for_guest(cart_token) if cart_token else None
+    await cart_store.merge(owner, lines, guest=guest)
+    if guest is not None:
+        response.delete_cookie(settings.cart_cookie_name)
+    await cart_store.persist_user_cart(user.id)
+    return await _read_cart(owner, db)
 
 
 @router.post(
@@ -48,79 +173,38 @@ async def get_cart(user: User = Depends(get_current_user), db: AsyncSession = De
 )
 async def add_item(
     payload: CartItemCreate,
-    user: User = Depends(get_current_user),
+    owner: CartOwner = Depends(get_cart_owner),
     db: AsyncSession = Depends(get_db),
-) -> CartItem:
-    cart = await async_get_or_create_cart(user, db)
-    product_result = await db.execute(select(Product).where(Product.id == payload.product_id))
-    product = product_result.scalars().first()
-    if not product:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-
-    item_repo = CartItemRepository(db)
-    existing = await item_repo.get_by_cart_product(cart.id, payload.product_id)
-    if existing:
-        existing.quantity += payload.quantity
-        db.add(existing)
-        await db.commit()
-        await db.refresh(existing)
-        return existing
-
-    item = await item_repo.create(
-        {
-            "cart_id": cart.id,
-            "product_id": payload.product_id,
-            "quantity": payload.quantity,
-            "price_snapshot": float(product.price),
-        }
-    )
-    return item
+) -> CartItemRead:
+    price = await _get_product_price(payload.product_id, db)
+    quantity, price_snapshot = await cart_store.add_item(owner, payload.product_id, payload.quantity, price)
+    return CartItemRead(product_id=payload.product_id, quantity=quantity, price_snapshot=price_snapshot)
 
 
 @router.patch(
-    "/items/{item_id}",
+    "/items/{product_id}",
     response_model=CartItemRead,
     summary="Обновить количество",
 )
 async def update_item(
-    item_id: int,
+    product_id: int,
     payload: CartItemUpdate,
-    user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
-) -> CartItem:
-    cart = await async_get_or_create_cart(user, db)
-    result = await db.execute(
-        select(CartItem).where(CartItem.id == item_id, CartItem.cart_id == cart.id)
-    )
-    item = result.scalars().first()
-    if not item:
+    owner: CartOwner = Depends(get_cart_owner),
+) -> CartItemRead:
+    price_snapshot = await cart_store.set_quantity(owner, product_id, payload.quantity)
+    if price_snapshot is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cart item not found")
-    item.quantity = payload.quantity
-    db.add(item)
-    await db.commit()
-    await db.refresh(item)
-    return item
+    return CartItemRead(product_id=product_id, quantity=payload.quantity, price_snapshot=price_snapshot)
 
 
 @router.delete(
-    "/items/{item_id}",
+    "/items/{product_id}",
     status_code=status.HTTP_204_NO_CONTENT,
     summary="Удалить позицию",
 )
-async def delete_item(
-    item_id: int,
-    user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
-) -> None:
-    cart = await async_get_or_create_cart(user, db)
-    result = await db.execute(
-        select(CartItem).where(CartItem.id == item_id, CartItem.cart_id == cart.id)
-    )
-    item = result.scalars().first()
-    if not item:
+async def delete_item(product_id: int, owner: CartOwner = Depends(get_cart_owner)) -> None:
+    if not await cart_store.remove_item(owner, product_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cart item not found")
-    await db.delete(item)
-    await db.commit()
     return None
 
 
@@ -129,8 +213,6 @@ async def delete_item(
     status_code=status.HTTP_204_NO_CONTENT,
     summary="Очистить корзину",
 )
-async def clear_cart(user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)) -> None:
-    cart = await async_get_or_create_cart(user, db)
-    await db.execute(delete(CartItem).where(CartItem.cart_id == cart.id))
-    await db.commit()
+async def clear_cart(owner: CartOwner = Depends(get_cart_owner)) -> None:
+    await cart_store.clear(owner)
     return None
@@ -1,18 +1,50 @@
 import logging
+from collections.abc import Awaitable, Callable
+from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
 
-from app.core.cache import get_json, invalidate_prefix, set_json
+from app.core.cache import get_body, get_json, set_body, set_json
+from app.core.catalog_cache import (
+    LIST_LIMIT,
+    PRODUCTS_PAGE_SIZE,
+    ProductChange,
+    brands_key,
+    categories_key,
+    get_product_cards,
+    load_brands,
+    load_categories,
+    load_product_cards,
+    load_products_page,
+    load_search,
+    load_semantic_search,
+    product_changed,
+    product_key,
+    products_page_key,
+    search_key,
+    section_changed,
+    semantic_search_key,
+)
+from app.core.compression import negotiate
 from app.core.deps import require_admin
+from app.core.http_cache import Validators, conditional_get
+from app.core.images import generate_variants, media_url, remove_original, save_upload
+from app.core.neighbors import mark_dirty
+from app.core.stock import adjust as adjust_hot_stock
+from app.core.rate_limit import charge_miss
+from app.core.serialization import dump_products, json_response
 from app.db.models import Brand, Category, Product, ProductImage, ProductSpec
 from app.db.repositories import (
     BrandRepository,
     CategoryRepository,
+    CopurchaseRepository,
+    ProductImageRepository,
+    ProductNeighborRepository,
     ProductRepository,
 )
+from app.db.replicas import get_read_db
 from app.db.session import get_db
 from app.schemas.catalog import (
     BrandCreate,
@@ -22,30 +54,71 @@ from app.schemas.catalog import (
     CategoryRead,
     CategoryUpdate,
     ProductCreate,
+    ProductDetailRead,
+    ProductImageRead,
     ProductRead,
+    ProductRecommendationRead,
     ProductSearchVector,
+    ProductSimilarRead,
     ProductUpdate,
 )
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api", tags=["catalog"])
 
+# Поля, от которых зависят списки похожих товаров.
+NEIGHBOR_FIELDS = {"name_embedding", "is_active", "category_id"}
+
+
+def _parse_ids(raw: str) -> list[int]:
+    try:
+        product_ids = [int(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid ids")
+    product_ids = list(dict.fromkeys(product_ids))
+    if not product_ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Ids are required")
+    if len(product_ids) > LIST_LIMIT:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {LIST_LIMIT} ids")
+    return product_ids
+
+
+async def _cached_json(
+    request: Request,
+    cache_key: str,
+    validators: Validators,
+    load: Callable[[], Awaitable[tuple[bytes, list[str]]]],
+) -> Response:
+    """Отдаёт тело из кэша (сразу в нужной кодировке) или строит его через load и кэширует.
+
+    ``load`` возвращает тело и теги сущностей, из которых оно собрано. Тело,
+    построенное на промахе, уходит несжатым: его сожмёт middleware.
+    """
+    encoding = negotiate(request.headers.get("accept-encoding"))
+    cached = await get_body(cache_key, encoding)
+    if cached is None:
+        payload, tags = await load()
+        await set_body(cache_key, payload, tags=tags, background_variants=True)
+        cached = (payload, None)
+    body, body_encoding = cached
+    return json_response(body, validators.headers, body_encoding)
+
 
 @router.get(
     "/categories",
     response_model=list[CategoryRead],
     summary="Список категорий",
     description="Возвращает список всех категорий.",
+    dependencies=[Depends(conditional_get("categories", "categories"))],
 )
 async def list_categories(
-    offset: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)
+    offset: int = 0, limit: int = LIST_LIMIT, db: AsyncSession = Depends(get_read_db)
 ) -> list[Category] | list[dict]:
-    cache_key = f"catalog:categories:{offset}:{limit}"
+    cache_key = categories_key(offset, limit)
     cached = await get_json(cache_key)
     if cached is not None:
         return cached
-    categories = await CategoryRepository(db).list(offset=offset, limit=limit)
-    payload = [CategoryRead.model_validate(c).model_dump() for c in categories]
+    payload = await load_categories(db, offset, limit)
     await set_json(cache_key, payload)
     return payload
 
@@ -62,7 +135,7 @@ async def create_category(payload: CategoryCreate, db: AsyncSession = Depends(ge
     if await repo.get_by_slug(payload.slug):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Category slug already exists")
     category = await repo.create(payload.model_dump())
-    await invalidate_prefix("catalog:categories:")
+    await section_changed("categories")
     return category
 
 
@@ -70,8 +143,9 @@ async def create_category(payload: CategoryCreate, db: AsyncSession = Depends(ge
     "/categories/{category_id}",
     response_model=CategoryRead,
     summary="Получить категорию",
+    dependencies=[Depends(conditional_get("categories", "categories"))],
 )
-async def get_category(category_id: int, db: AsyncSession = Depends(get_db)) -> Category:
+async def get_category(category_id: int, db: AsyncSession = Depends(get_read_db)) -> Category:
     category = await CategoryRepository(db).get(category_id)
     if not category:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
@@ -92,7 +166,7 @@ async def update_category(
     if not category:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
     category = await repo.update(category, payload.model_dump(exclude_unset=True))
-    await invalidate_prefix("catalog:categories:")
+    await section_changed("categories")
     return category
 
 
@@ -108,7 +182,7 @@ async def delete_category(category_id: int, db: AsyncSession = Depends(get_db))
     if not category:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
     await repo.delete(category)
-    await invalidate_prefix("catalog:categories:")
+    await section_changed("categories", f"listing:category:{category_id}")
     return None
 
 
@@ -116,16 +190,16 @@ async def delete_category(category_id: int, db: AsyncSession = Depends(get_db))
     "/brands",
     response_model=list[BrandRead],
     summary="Список брендов",
+    dependencies=[Depends(conditional_get("brands", "brands"))],
 )
 async def list_brands(
-    offset: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)
+    offset: int = 0, limit: int = LIST_LIMIT, db: AsyncSession = Depends(get_read_db)
 ) -> list[Brand] | list[dict]:
-    cache_key = f"catalog:brands:{offset}:{limit}"
+    cache_key = brands_key(offset, limit)
     cached = await get_json(cache_key)
     if cached is not None:
         return cached
-    brands = await BrandRepository(db).list(offset=offset, limit=limit)
-    payload = [BrandRead.model_validate(b).model_dump() for b in brands]
+    payload = await load_brands(db, offset, limit)
     await set_json(cache_key, payload)
     return payload
 
@@ -142,7 +216,7 @@ async def create_brand(payload: BrandCreate, db: AsyncSession = Depends(get_db))
     if await repo.get_by_slug(payload.slug):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Brand slug already exists")
     brand = await repo.create(payload.model_dump())
-    await invalidate_prefix("catalog:brands:")
+    await section_changed("brands")
     return brand
 
 
@@ -150,8 +224,9 @@ async def create_brand(payload: BrandCreate, db: AsyncSession = Depends(get_db))
     "/brands/{brand_id}",
     response_model=BrandRead,
     summary="Получить бренд",
+    dependencies=[Depends(conditional_get("brands", "brands"))],
 )
-async def get_brand(brand_id: int, db: AsyncSession = Depends(get_db)) -> Brand:
+async def get_brand(brand_id: int, db: AsyncSession = Depends(get_read_db)) -> Brand:
     brand = await BrandRepository(db).get(brand_id)
     if not brand:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Brand not found")
@@ -170,7 +245,7 @@ async def update_brand(brand_id: int, payload: BrandUpdate, db: AsyncSession = D
     if not brand:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Brand not found")
     brand = await repo.update(brand, payload.model_dump(exclude_unset=True))
-    await invalidate_prefix("catalog:brands:")
+    await section_changed("brands")
     return brand
 
 
@@ -186,7 +261,7 @@ async def delete_brand(brand_id: int, db: AsyncSession = Depends(get_db)) -> Non
     if not brand:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Brand not found")
     await repo.delete(brand)
-    await invalidate_prefix("catalog:brands:")
+    await section_changed("brands", f"listing:brand:{brand_id}")
     return None
 
 
@@ -197,38 +272,36 @@ async def delete_brand(brand_id: int, db: AsyncSession = Depends(get_db)) -> Non
     description="Список активных товаров с фильтрами.",
 )
 async def list_products(
+    request: Request,
     offset: int = 0,
-    limit: int = 20,
+    limit: int = PRODUCTS_PAGE_SIZE,
     category_id: int | None = None,
     brand_id: int | None = None,
-    db: AsyncSession = Depends(get_db),
-) -> list[Product] | list[dict]:
-    cache_key = f"catalog:products:{offset}:{limit}:{category_id}:{brand_id}"
-    cached = await get_json(cache_key)
-    if cached is not None:
-        return cached
+    db: AsyncSession = Depends(get_read_db),
+    validators: Validators = Depends(conditional_get("products", "products")),
+) -> Response:
+    async def load() -> tuple[bytes, list[str]]:
+        return await load_products_page(db, offset, limit, category_id, brand_id)
 
-    query = (
-        select(Product)
-        .options(
-            joinedload(Product.images),
-            joinedload(Product.specs),
-            joinedload(Product.brand),
-            joinedload(Product.category),
-        )
-        .where(Product.is_active.is_(True))
-    )
-    if category_id:
-        query = query.where(Product.category_id == category_id)
-    if brand_id:
-        query = query.where(Product.brand_id == brand_id)
+    cache_key = products_page_key(offset, limit, category_id, brand_id)
+    return await _cached_json(request, cache_key, validators, load)
 
-    result = await db.execute(query.offset(offset).limit(limit))
-    products = result.scalars().all()
 
-    payload = [ProductRead.model_validate(p).model_dump() for p in products]
-    await set_json(cache_key, payload)
-    return payload
+@router.get(
+    "/products/batch",
+    response_model=list[ProductDetailRead],
+    summary="Несколько товаров",
+    description=(
+        f"Карточки товаров ``ids=1,2,3`` (до {LIST_LIMIT}) в порядке запроса; несуществующие id пропускаются."
+    ),
+)
+async def get_products_batch(
+    ids: str,
+    db: AsyncSession = Depends(get_read_db),
+    validators: Validators = Depends(conditional_get("products", "products")),
+) -> Response:
+    cards = await get_product_cards(db, _parse_ids(ids))
+    return json_response(b"[" + b",".join(cards) + b"]", validators.headers)
 
 
 @router.post(
@@ -238,34 +311,103 @@ async def list_products(
     description="Ищет товары по вектору названия (pgvector).",
 )
 async def search_products_vector(
-    payload: ProductSearchVector, db: AsyncSession = Depends(get_db)
-) -> list[Product]:
+    payload: ProductSearchVector, db: AsyncSession = Depends(get_read_db)
+) -> Response:
     products = await ProductRepository(db).search_by_embedding(payload.vector, limit=payload.limit)
-    return products
+    return json_response(dump_products(products))
+
+
+@router.get(
+    "/products/search",
+    response_model=list[ProductRead],
+    summary="Поиск товаров",
+    description="Полнотекстовый поиск по названию и описанию.",
+)
+async def search_products(
+    request: Request,
+    q: str,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_read_db),
+    validators: Validators = Depends(conditional_get("products", "search")),
+) -> Response:
+    query = q.strip()
+    if not query:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Query is required")
+
+    async def load() -> tuple[bytes, list[str]]:
+        await charge_miss(request, "search")
+        return await load_search(db, query, limit)
+
+    return await _cached_json(request, search_key(query, limit), validators, load)
+
+
+@router.get(
+    "/products/search/semantic",
+    response_model=list[ProductRead],
+    summary="Семантический поиск",
+    description="Ищет товары по близости названия к запросу; вектор запроса строится на сервере.",
+)
+async def search_products_semantic(
+    request: Request,
+    q: str,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_read_db),
+    validators: Validators = Depends(conditional_get("products", "search")),
+) -> Response:
+    query = q.strip()
+    if not query:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Query is required")
+
+    async def load() -> tuple[bytes, list[str]]:
+        await charge_miss(request, "semantic_search")
+        return await load_semantic_search(db, query, limit)
+
+    return await _cached_json(request, semantic_search_key(query, limit), validators, load)
 
 
 @router.get(
     "/products/{product_id}",
-    response_model=ProductRead,
+    response_model=ProductDetailRead,
     summary="Карточка товара",
+    description="Карточка товара со списком похожих товаров.",
 )
-async def get_product(product_id: int, db: AsyncSession = Depends(get_db)) -> Product | dict:
-    cache_key = f"catalog:product:{product_id}"
-    cached = await get_json(cache_key)
-    if cached is not None:
-        return cached
+async def get_product(
+    request: Request,
+    product_id: int,
+    db: AsyncSession = Depends(get_read_db),
+    validators: Validators = Depends(conditional_get("products", "product")),
+) -> Response:
+    async def load() -> tuple[bytes, list[str]]:
+        cards = await load_product_cards(db, [product_id])
+        if product_id not in cards:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+        return cards[product_id]
 
-    result = await db.execute(
-        select(Product)
-        .options(joinedload(Product.images), joinedload(Product.specs))
-        .where(Product.id == product_id)
-    )
-    product = result.scalars().first()
-    if not product:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-    payload = ProductRead.model_validate(product).model_dump()
-    await set_json(cache_key, payload)
-    return payload
+    return await _cached_json(request, product_key(product_id), validators, load)
+
+
+@router.get(
+    "/products/{product_id}/similar",
+    response_model=list[ProductSimilarRead],
+    summary="Похожие товары",
+    description="Предрасчитанный список товаров с близкими названиями.",
+    dependencies=[Depends(conditional_get("products", "product"))],
+)
+async def get_similar_products(product_id: int, db: AsyncSession = Depends(get_read_db)) -> list:
+    similar = await ProductNeighborRepository(db).similar([product_id])
+    return similar[product_id]
+
+
+@router.get(
+    "/products/{product_id}/bought-together",
+    response_model=list[ProductRecommendationRead],
+    summary="Покупают вместе",
+    description="Предрасчитанный список товаров, которые чаще всего покупают вместе с этим.",
+)
+async def get_bought_together(
+    product_id: int, limit: int = Query(10, ge=1, le=50), db: AsyncSession = Depends(get_read_db)
+) -> list:
+    return await CopurchaseRepository(db).for_product(product_id, limit)
 
 
 @router.post(
@@ -295,9 +437,16 @@ async def create_product(payload: ProductCreate, db: AsyncSession = Depends(get_
     db.add(product)
     await db.commit()
     await db.refresh(product)
-    await invalidate_prefix("catalog:products:")
-    await invalidate_prefix("catalog:product:")
-    await invalidate_prefix("catalog:search:tsv:")
+    await product_changed(
+        ProductChange(
+            product.id,
+            "created",
+            category_ids=frozenset({product.category_id} - {None}),
+            brand_ids=frozenset({product.brand_id} - {None}),
+        )
+    )
+    if product.name_embedding is not None:
+        await mark_dirty([product.id])
     return product
 
 
@@ -319,23 +468,93 @@ async def update_product(
     images = data.pop("images", None)
     specs = data.pop("specs", None)
 
-    for field, value in data.items():
-        setattr(product, field, value)
+    category_ids = {product.category_id, data.get("category_id", product.category_id)} - {None}
+    brand_ids = {product.brand_id, data.get("brand_id", product.brand_id)} - {None}
+    # Вектор из БД — массив numpy, поэлементное сравнение тут не годится.
+    changed = {
+        field for field, value in data.items() if field == "name_embedding" or getattr(product, field) != value
+    }
+    stock_delta = data["stock"] - product.stock if "stock" in changed and product.hot_stock else 0
+    for field in changed:
+        setattr(product, field, data[field])
+    if "name" in changed and "name_embedding" not in data:
+        # Старый вектор описывает старое название; новый посчитает embedding_worker.
+        product.name_embedding = None
+        changed.add("name_embedding")
 
     if images is not None:
         product.images = [ProductImage(**image.model_dump()) for image in images]
+        changed.add("images")
     if specs is not None:
         product.specs = [ProductSpec(**spec.model_dump()) for spec in specs]
+        changed.add("specs")
+    # onupdate не сработает, если изменились только картинки или характеристики.
+    product.updated_at = datetime.utcnow()
 
     db.add(product)
     await db.commit()
     await db.refresh(product)
-    await invalidate_prefix("catalog:products:")
-    await invalidate_prefix("catalog:product:")
-    await invalidate_prefix("catalog:search:tsv:")
+    await adjust_hot_stock(product_id, stock_delta)
+    await product_changed(
+        ProductChange(product_id, "updated", frozenset(changed), frozenset(category_ids), frozenset(brand_ids))
+    )
+    if changed & NEIGHBOR_FIELDS:
+        await mark_dirty([product_id])
     return product
 
 
+@router.post(
+    "/products/{product_id}/images",
+    response_model=ProductImageRead,
+    status_code=status.HTTP_201_CREATED,
+    summary="Загрузить изображение товара",
+    description=(
+        "Тело запроса — сам файл (image/jpeg, image/png или image/webp), без multipart. "
+        "Файл пишется на диск по мере получения; WebP-варианты строятся до ответа."
+    ),
+    dependencies=[Depends(require_admin)],
+)
+async def upload_product_image(
+    request: Request,
+    product_id: int,
+    is_main: bool = False,
+    sort_order: int = 0,
+    db: AsyncSession = Depends(get_db),
+) -> ProductImage:
+    if not await db.get(Product, product_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    # Соединение возвращается в пул: приём тела и варианты могут занять долго.
+    await db.commit()
+    content_type = request.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+    storage_key = await save_upload(request, content_type)
+    try:
+        fields = await generate_variants(storage_key)
+    except ValueError as exc:
+        logger.info("image upload rejected product_id=%s error=%s", product_id, exc)
+        await remove_original(storage_key)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid image")
+    product = await db.get(Product, product_id, populate_existing=True)
+    if not product:
+        # Товар удалили, пока шла загрузка; тот же файл может быть у другого изображения.
+        if not await ProductImageRepository(db).storage_key_in_use(storage_key):
+            await remove_original(storage_key)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    image = ProductImage(
+        product_id=product_id,
+        url=media_url(storage_key),
+        is_main=is_main,
+        sort_order=sort_order,
+        storage_key=storage_key,
+        **fields,
+    )
+    db.add(image)
+    product.updated_at = datetime.utcnow()
+    await db.commit()
+    await db.refresh(image)
+    await product_changed(ProductChange(product_id, "updated", frozenset({"images"})))
+    return image
+
+
 @router.delete(
     "/products/{product_id}",
     status_code=status.HTTP_204_NO_CONTENT,
@@ -347,33 +566,16 @@ async def delete_product(product_id: int, db: AsyncSession = Depends(get_db)) ->
     product = result.scalars().first()
     if not product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    change = ProductChange(
+        product_id,
+        "deleted",
+        category_ids=frozenset({product.category_id} - {None}),
+        brand_ids=frozenset({product.brand_id} - {None}),
+    )
+    # Строки product_neighbors удалит каскад; списки, где товар был, надо пересчитать.
+    referencing = await ProductNeighborRepository(db).referencing([product_id])
     await db.delete(product)
     await db.commit()
-    await invalidate_prefix("catalog:products:")
-    await invalidate_prefix("catalog:product:")
-    await invalidate_prefix("catalog:search:tsv:")
+    await product_changed(change)
+    await mark_dirty(referencing)
     return None
-
-
-@router.get(
-    "/products/search",
-    response_model=list[ProductRead],
-    summary="Поиск товаров",
-    description="Полнотекстовый поиск по названию и описанию.",
-)
-async def search_products(
-    q: str,
-    limit: int = 20,
-    db: AsyncSession = Depends(get_db),
-) -> list[Product] | list[dict]:
-    query = q.strip()
-    if not query:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Query is required")
-    cache_key = f"catalog:search:tsv:{query}:{limit}"
-    cached = await get_json(cache_key)
-    if cached is not None:
-        return cached
-    products = await ProductRepository(db).search_by_tsv(query, limit=limit)
-    payload = [ProductRead.model_validate(p).model_dump() for p in products]
-    await set_json(cache_key, payload)
-    return payload
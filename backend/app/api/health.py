@@ -1,4 +1,5 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
 
 router = APIRouter(tags=["health"])
 
@@ -7,3 +8,9 @@ router = APIRouter(tags=["health"])
 async def health():
     return {"ok": True}
 
+
+@router.get("/health/ready", summary="Готовность к приёму трафика")
+async def ready(request: Request):
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"ready": False})
+    return {"ready": True}
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, HTTPException, Response, status
+
+from app.core.config import settings
+from app.core.metrics import CONTENT_TYPE, render_async
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get(
+    "/metrics",
+    summary="Метрики Prometheus",
+    description="Счётчики запросов, гистограммы латентности, пул БД, Redis и кэш.",
+    include_in_schema=False,
+)
+async def metrics() -> Response:
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics disabled")
+    return Response(await render_async(settings.metrics_multiproc_dir), media_type=CONTENT_TYPE)
@@ -1,29 +1,99 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import base64
+import logging
+from collections import Counter
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import selectinload
 
-from app.core.deps import get_current_user
+from app.core import stock
+from app.core.cart_store import persist_user_cart
+from app.core.catalog_cache import ProductChange, product_changed
+from app.core.deps import get_current_user, require_admin
 from app.db.models import Order, OrderItem, Product, User
+from app.db.repositories import AnalyticsRepository, CopurchaseRepository, OrderRepository, ProductRepository
+from app.db.repositories.analytics import is_counted
+from app.db.replicas import get_read_db
 from app.db.session import get_db
-from app.schemas.order import OrderCreate, OrderRead
+from app.schemas.order import OrderCreate, OrderPage, OrderRead, OrderStatusUpdate, OrderSummaryRead
 
 router = APIRouter(prefix="/api/orders", tags=["orders"])
+logger = logging.getLogger(__name__)
+
+# Позиции и товары с картинками и характеристиками — фиксированное число запросов на заказ.
+_ORDER_DETAILS = (
+    selectinload(Order.items).joinedload(OrderItem.product).selectinload(Product.images),
+    selectinload(Order.items).joinedload(OrderItem.product).selectinload(Product.specs),
+)
+
+
+def _encode_cursor(created_at: datetime, order_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{order_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, order_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except ValueError as exc:
+        logger.info("Invalid order cursor: %s", exc)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+async def _take_stock(db: AsyncSession, order_id: int, items: list) -> tuple[str | None, set[int]]:
+    """Списывает остаток позиций заказа: обычные товары — UPDATE в транзакции
+    заказа, товары в hot-режиме — резервом в Redis. Возвращает резерв и id
+    товаров, списанных в БД."""
+    lines = Counter()
+    for item in items:
+        lines[item.product_id] += item.quantity
+    hot = await stock.hot_ids(lines)
+    regular = {product_id: quantity for product_id, quantity in lines.items() if product_id not in hot}
+    taken = await ProductRepository(db).take_stock(regular)
+    failed = set(regular) - taken
+    if failed:
+        # Товар мог перейти в hot-режим, пока заказ ждал строку.
+        hot |= await stock.hot_ids(failed)
+        if failed - hot:
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Insufficient stock")
+    if not hot:
+        return None, taken
+    try:
+        reservation = await stock.reserve(order_id, {product_id: lines[product_id] for product_id in hot})
+    except stock.StockUnavailable as exc:
+        logger.warning("hot stock reservation failed order_id=%s error=%s", order_id, exc)
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Stock is temporarily unavailable")
+    if reservation is None:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Insufficient stock")
+    return reservation, taken
 
 
 @router.get(
     "",
-    response_model=list[OrderRead],
-    summary="Список заказов пользователя",
+    response_model=OrderPage,
+    summary="История заказов пользователя",
+    description="Краткие карточки заказов с keyset-пагинацией; полная информация — в GET /api/orders/{id}.",
 )
-async def list_orders(user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)) -> list[Order]:
-    result = await db.execute(
-        select(Order)
-        .options(joinedload(Order.items).joinedload(OrderItem.product))
-        .where(Order.user_id == user.id)
-        .order_by(Order.created_at.desc())
-    )
-    return result.scalars().all()
+async def list_orders(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = None,
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+) -> OrderPage:
+    before = _decode_cursor(cursor) if cursor else None
+    rows = await OrderRepository(db).list_summaries_by_user(user.id, limit=limit + 1, before=before)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id)
+    return OrderPage(items=[OrderSummaryRead.model_validate(row) for row in rows], next_cursor=next_cursor)
 
 
 @router.post(
@@ -47,27 +117,52 @@ async def create_order(
         status="new",
     )
 
+    product_ids = {item.product_id for item in payload.items}
+    product_result = await db.execute(select(Product.id, Product.price).where(Product.id.in_(product_ids)))
+    prices = {product_id: float(price) for product_id, price in product_result.all()}
+    if len(prices) != len(product_ids):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+
     total = 0.0
     for item in payload.items:
-        product_result = await db.execute(select(Product).where(Product.id == item.product_id))
-        product = product_result.scalars().first()
-        if not product:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-        price = float(product.price)
+        price = prices[item.product_id]
         total += price * item.quantity
         order.items.append(
             OrderItem(
-                product_id=product.id,
+                product_id=item.product_id,
                 quantity=item.quantity,
                 price_snapshot=price,
             )
         )
 
     order.total_amount = total
+    try:
+        await persist_user_cart(user.id)
+    except Exception as exc:
+        logger.warning("cart persist on checkout failed user_id=%s error=%s", user.id, exc)
     db.add(order)
-    await db.commit()
-    await db.refresh(order)
-    return order
+    await db.flush()
+    reservation, taken = await _take_stock(db, order.id, payload.items)
+    try:
+        await AnalyticsRepository(db).log_change(order.id, None, order.status)
+        await CopurchaseRepository(db).log_order(order.id)
+        await db.commit()
+    except BaseException:
+        if reservation:
+            await stock.release(reservation)
+        raise
+    if reservation:
+        await stock.confirm(reservation)
+    # Остаток hot-товаров попадёт в БД и кэш при сверке (stock.reconcile).
+    for product_id in taken:
+        await product_changed(ProductChange(product_id, "updated", frozenset({"stock"})))
+    result = await db.execute(
+        select(Order)
+        .options(*_ORDER_DETAILS)
+        .where(Order.id == order.id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().one()
 
 
 @router.get(
@@ -76,14 +171,39 @@ async def create_order(
     summary="Получить заказ",
 )
 async def get_order(
-    order_id: int, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+    order_id: int, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)
 ) -> Order:
     result = await db.execute(
         select(Order)
-        .options(joinedload(Order.items).joinedload(OrderItem.product))
+        .options(*_ORDER_DETAILS)
         .where(Order.id == order_id, Order.user_id == user.id)
     )
     order = result.scalars().first()
     if not order:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
     return order
+
+
+@router.patch(
+    "/{order_id}/status",
+    response_model=OrderSummaryRead,
+    summary="Изменить статус заказа",
+    dependencies=[Depends(require_admin)],
+)
+async def update_order_status(
+    order_id: int, payload: OrderStatusUpdate, db: AsyncSession = Depends(get_db)
+) -> OrderSummaryRead:
+    result = await db.execute(select(Order).where(Order.id == order_id).with_for_update())
+    order = result.scalars().first()
+    if not order:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    old_status = order.status
+    if payload.status != old_status:
+        order.status = payload.status
+        await db.flush()
+        await AnalyticsRepository(db).log_change(order.id, old_status, order.status)
+        if is_counted(old_status) != is_counted(order.status):
+            await CopurchaseRepository(db).log_order(order.id, 1 if is_counted(order.status) else -1)
+        await db.commit()
+        logger.info("order status changed id=%s %s -> %s", order.id, old_status, order.status)
+    return OrderSummaryRead.model_validate(await OrderRepository(db).get_summary(order.id))
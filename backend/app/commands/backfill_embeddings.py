@@ -0,0 +1,57 @@
+"""Расчёт name_embedding для товаров без вектора (или для всех с --all).
+
+    python3 -m app.commands.backfill_embeddings [--all] [--chunk-size 500]
+
+Нужен после первого включения эмбеддингов и после смены
+PRODUCT_EMBEDDING_DIM/EMBEDDING_SEED (с --all).
+"""
+
+import argparse
+import asyncio
+import logging
+
+from app.core.cache import invalidate_tags
+from app.core.catalog_cache import product_tags
+from app.core.embeddings import embed_texts
+from app.core.http_cache import bump_catalog_version
+from app.core.logging import setup_logging
+from app.db.repositories import ProductRepository
+from app.db.session import SessionLocal
+
+logger = logging.getLogger("app.commands.backfill_embeddings")
+
+
+async def backfill_embeddings(chunk_size: int = 500, missing_only: bool = True) -> int:
+    updated = 0
+    last_id = 0
+    while True:
+        async with SessionLocal() as db:
+            repo = ProductRepository(db)
+            chunk = await repo.list_names_chunk(last_id, chunk_size, missing_only=missing_only)
+            if not chunk:
+                break
+            vectors = await embed_texts([row.name for row in chunk])
+            await repo.set_embeddings({row.id: vector for row, vector in zip(chunk, vectors)})
+            await db.commit()
+        # Карточки и списки содержат вектор.
+        await invalidate_tags(product_tags(row.id for row in chunk))
+        updated += len(chunk)
+        last_id = chunk[-1].id
+        logger.info("embeddings updated=%s last_id=%s", updated, last_id)
+    if updated:
+        await bump_catalog_version("products")
+    return updated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--all", action="store_true", help="пересчитать векторы всех товаров")
+    args = parser.parse_args()
+    setup_logging()
+    total = asyncio.run(backfill_embeddings(chunk_size=args.chunk_size, missing_only=not args.all))
+    logger.info("done, embeddings updated=%s", total)
+
+
+if __name__ == "__main__":
+    main()
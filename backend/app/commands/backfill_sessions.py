@@ -0,0 +1,52 @@
+"""Перенос активных сессий из таблицы user_sessions в Redis.
+
+    python3 -m app.commands.backfill_sessions [--purge] [--chunk-size 1000]
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from app.core.logging import setup_logging
+from app.core.sessions import DatabaseSessionStore, RedisSessionStore
+from app.db.repositories import SessionRepository
+from app.db.session import SessionLocal
+
+logger = logging.getLogger("app.commands.backfill_sessions")
+
+
+async def backfill_sessions(chunk_size: int = 1000, purge: bool = False) -> int:
+    store = RedisSessionStore()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    migrated = 0
+    last_id = 0
+    while True:
+        async with SessionLocal() as db:
+            chunk = await SessionRepository(db).list_active_chunk(now, after_id=last_id, limit=chunk_size)
+        if not chunk:
+            break
+        for session in chunk:
+            await store.create(session.token, session.user_id, session.expires_at)
+        migrated += len(chunk)
+        last_id = chunk[-1].id
+        logger.info("sessions migrated=%s last_id=%s", migrated, last_id)
+
+    if purge:
+        removed = await DatabaseSessionStore().purge_expired()
+        logger.info("expired sessions purged=%s", removed)
+    return migrated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--purge", action="store_true", help="удалить истёкшие строки из user_sessions")
+    args = parser.parse_args()
+    setup_logging()
+    total = asyncio.run(backfill_sessions(chunk_size=args.chunk_size, purge=args.purge))
+    logger.info("done, sessions migrated=%s", total)
+
+
+if __name__ == "__main__":
+    main()
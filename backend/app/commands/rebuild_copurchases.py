@@ -0,0 +1,32 @@
+"""Полный пересчёт «покупают вместе» (product_pair_counts, product_recommendations).
+
+    python3 -m app.commands.rebuild_copurchases [--chunk-size 50000]
+
+Позиции учитываемых заказов читаются блоками по --chunk-size строк, пары
+товаров накапливаются в numpy и пишутся во вспомогательную таблицу, которая
+затем подменяет product_pair_counts. Новые заказы тем временем копятся в
+журнале copurchase_events и переносятся после пересчёта. Запускать после
+импорта истории заказов и после изменения COPURCHASE_MAX_ORDER_ITEMS.
+"""
+
+import argparse
+import asyncio
+import logging
+
+from app.core.copurchase import rebuild_all
+from app.core.logging import setup_logging
+
+logger = logging.getLogger("app.commands.rebuild_copurchases")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+    setup_logging()
+    total = asyncio.run(rebuild_all(chunk_size=args.chunk_size))
+    logger.info("done, pairs=%s", total)
+
+
+if __name__ == "__main__":
+    main()
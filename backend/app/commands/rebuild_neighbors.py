@@ -0,0 +1,31 @@
+"""Полный пересчёт похожих товаров (product_neighbors) по name_embedding.
+
+    python3 -m app.commands.rebuild_neighbors [--chunk-size 256]
+
+Близости считаются блоками по --chunk-size товаров (память — блок × все
+товары × 4 байта). Запускать после backfill_embeddings и периодически:
+инкрементальное обновление не добавляет товар в списки, где его ещё не было,
+кроме списков его собственных соседей.
+"""
+
+import argparse
+import asyncio
+import logging
+
+from app.core.logging import setup_logging
+from app.core.neighbors import rebuild_all
+
+logger = logging.getLogger("app.commands.rebuild_neighbors")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+    setup_logging()
+    total = asyncio.run(rebuild_all(chunk_size=args.chunk_size))
+    logger.info("done, products=%s", total)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Полный пересчёт агрегатов продаж из orders/order_items.
+
+    python3 -m app.commands.rebuild_rollups
+"""
+
+import argparse
+import asyncio
+import logging
+
+from app.core.logging import setup_logging
+from app.db.repositories import AnalyticsRepository
+from app.db.session import SessionLocal
+
+logger = logging.getLogger("app.commands.rebuild_rollups")
+
+
+async def rebuild_rollups() -> None:
+    async with SessionLocal() as db:
+        await AnalyticsRepository(db).rebuild()
+
+
+def main() -> None:
+    argparse.ArgumentParser(description=__doc__).parse_args()
+    setup_logging()
+    asyncio.run(rebuild_rollups())
+    logger.info("sales rollups rebuilt")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Пересчёт WebP-вариантов загруженных изображений товаров.
+
+    python3 -m app.commands.regenerate_images [--all] [--batch-size 20]
+
+Обрабатывает изображения, у которых variants_version меньше
+IMAGE_VARIANTS_VERSION (после смены IMAGE_VARIANT_WIDTHS, IMAGE_CARD_WIDTH
+или качества увеличьте версию). Прогресс хранится в самих строках, поэтому
+прерванный запуск продолжается с того же места, а несколько запусков
+параллельно делят работу (FOR UPDATE SKIP LOCKED). --all сначала помечает
+устаревшими все загруженные изображения.
+"""
+
+import argparse
+import asyncio
+import logging
+
+from app.core.catalog_cache import ProductChange, product_changed
+from app.core.config import settings
+from app.core.images import generate_variants, shutdown_pool
+from app.core.logging import setup_logging
+from app.db.repositories import ProductImageRepository
+from app.db.session import SessionLocal
+
+logger = logging.getLogger("app.commands.regenerate_images")
+
+
+async def regenerate_images(batch_size: int = 20, all_images: bool = False) -> int:
+    if all_images:
+        async with SessionLocal() as db:
+            marked = await ProductImageRepository(db).mark_stale()
+            await db.commit()
+        logger.info("images marked stale=%s", marked)
+    updated = failed = 0
+    # Сбойные изображения в этом запуске пропускаются, следующий попробует их снова.
+    last_id = 0
+    try:
+        while True:
+            async with SessionLocal() as db, db.begin():
+                images = await ProductImageRepository(db).claim_stale(
+                    settings.image_variants_version, last_id, batch_size
+                )
+                if not images:
+                    break
+                results = await asyncio.gather(
+                    *(generate_variants(image.storage_key) for image in images), return_exceptions=True
+                )
+                product_ids = set()
+                for image, result in zip(images, results):
+                    if isinstance(result, Exception):
+                        failed += 1
+                        logger.warning("image variants failed id=%s error=%s", image.id, result)
+                        continue
+                    for field, value in result.items():
+                        setattr(image, field, value)
+                    product_ids.add(image.product_id)
+                    updated += 1
+                last_id = images[-1].id
+            for product_id in product_ids:
+                await product_changed(ProductChange(product_id, "updated", frozenset({"images"})))
+            logger.info("images updated=%s failed=%s last_id=%s", updated, failed, last_id)
+    finally:
+        shutdown_pool()
+    return updated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--all", action="store_true", help="пересчитать варианты всех загруженных изображений")
+    args = parser.parse_args()
+    setup_logging()
+    total = asyncio.run(regenerate_images(batch_size=args.batch_size, all_images=args.all))
+    logger.info("done, images updated=%s", total)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+_periodic: list[tuple[str, float, Callable[[], Awaitable[None]]]] = []
+_skip_final_run: set[str] = set()
+_tasks: list[asyncio.Task] = []
+
+
+def register_periodic(
+    name: str, interval_seconds: float, func: Callable[[], Awaitable[None]], run_on_shutdown: bool = True
+) -> None:
+    _periodic.append((name, interval_seconds, func))
+    if not run_on_shutdown:
+        _skip_final_run.add(name)
+
+
+async def _run_periodic(name: str, interval_seconds: float, func: Callable[[], Awaitable[None]]) -> None:
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("background task failed name=%s error=%s", name, exc)
+
+
+def start_background_tasks() -> None:
+    for name, interval_seconds, func in _periodic:
+        _tasks.append(asyncio.create_task(_run_periodic(name, interval_seconds, func), name=name))
+        logger.info("background task started name=%s interval=%ss", name, interval_seconds)
+
+
+async def stop_background_tasks(final_run: bool = True) -> None:
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    if final_run:
+        for name, _, func in _periodic:
+            if name in _skip_final_run:
+                continue
+            try:
+                await func()
+            except Exception as exc:
+                logger.warning("background task final run failed name=%s error=%s", name, exc)
@@ -1,40 +1,371 @@
-import json
+"""Кэш ответов в Redis: JSON-значения, готовые тела с тегами и их сжатые варианты.
+
+Значения хранятся в формате кодека: байт версии (``CODEC_VERSION``), байт
+сжатия (``COMPRESSORS``: 0 — без сжатия, 1 — zstd, 2 — lz4) и компактный JSON
+(orjson), сжатый, если он не меньше ``CACHE_CODEC_MIN_SIZE`` байт и сжатие
+выигрывает. Записи в старом формате (JSON-текст) начинаются с печатного
+символа и читаются как есть, поэтому включать кодек можно на работающем
+кэше: сначала выкатить чтение с ``CACHE_CODEC_ENABLED=false`` (по умолчанию),
+затем включить запись. Запись с незнакомой версией считается промахом.
+
+Если кодек сжимает zstd, zstd-вариант тела для ``Accept-Encoding`` отдельно не
+хранится: значением тела становится он сам с заголовком кодека, и ``get_body``
+отдаёт его без заголовка.
+"""
+
+import asyncio
 import logging
+from collections.abc import Callable, Iterable, Mapping
 from typing import Any
 
+import orjson
+
+from app.core.compression import available_encodings, precompress
 from app.core.config import settings
-from app.db.redis import get_redis
+from app.core.metrics import CACHE_REQUESTS, CACHE_WRITTEN_BYTES, CACHE_WRITTEN_ENTRIES
+from app.db.redis import get_redis, get_redis_bytes, lua_script
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - optional dependency
+    lz4_frame = None
 
 logger = logging.getLogger(__name__)
 
+# Счётчик обращений к телам в кэше; затухает в catalog_cache.refresh_popular.
+POPULARITY_KEY = "cache:popular"
+
+CODEC_VERSION = 1
+NO_COMPRESSION = 0
+
+# имя -> (байт в заголовке, сжатие(data, level), распаковка)
+COMPRESSORS: dict[str, tuple[int, Callable[[bytes, int], bytes], Callable[[bytes], bytes]]] = {}
+
+
+def register_compressor(
+    name: str, code: int, compress: Callable[[bytes, int], bytes], decompress: Callable[[bytes], bytes]
+) -> None:
+    """Добавляет алгоритм сжатия; ``code`` навсегда закреплён за ним в записанных значениях."""
+    COMPRESSORS[name] = (code, compress, decompress)
+
+
+if zstandard is not None:
+    register_compressor(
+        "zstd",
+        1,
+        lambda data, level: zstandard.ZstdCompressor(level=level).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+    )
+if lz4_frame is not None:
+    register_compressor(
+        "lz4",
+        2,
+        lambda data, level: lz4_frame.compress(data, compression_level=level),
+        lz4_frame.decompress,
+    )
+
+
+def encode(payload: bytes) -> bytes:
+    """Значение для Redis в формате кодека (или как есть, если кодек выключен)."""
+    if not settings.cache_codec_enabled:
+        return payload
+    compressor = COMPRESSORS.get(settings.cache_codec_compression)
+    if compressor is not None and len(payload) >= settings.cache_codec_min_size:
+        code, compress, _ = compressor
+        compressed = compress(payload, settings.cache_codec_level)
+        if len(compressed) < len(payload):
+            return bytes((CODEC_VERSION, code)) + compressed
+    return bytes((CODEC_VERSION, NO_COMPRESSION)) + payload
+
+
+def decode(stored: bytes) -> bytes:
+    """JSON-байты из значения в Redis; ValueError — формат не распознан."""
+    if not stored or stored[0] >= 0x20:
+        return stored
+    if stored[0] != CODEC_VERSION or len(stored) < 2:
+        raise ValueError(f"unknown cache codec version {stored[0]}")
+    code, data = stored[1], stored[2:]
+    if code == NO_COMPRESSION:
+        return data
+    for compressor_code, _, decompress in COMPRESSORS.values():
+        if compressor_code == code:
+            return decompress(data)
+    raise ValueError(f"unknown cache compression {code}")
+
+
+def _shared_encoding() -> str | None:
+    """Кодировка ответа, вариант в которой служит и значением тела в кэше."""
+    if settings.cache_codec_enabled and settings.cache_codec_compression == "zstd" and "zstd" in COMPRESSORS:
+        return "zstd"
+    return None
+
+
+def _shared_value(variant: bytes) -> bytes:
+    return bytes((CODEC_VERSION, COMPRESSORS["zstd"][0])) + variant
+
+
+async def _encode(payload: bytes) -> bytes:
+    if len(payload) < settings.compression_offload_size:
+        return encode(payload)
+    return await asyncio.to_thread(encode, payload)
+
+
+def _namespace(key: str) -> str:
+    # catalog:product:42 -> catalog:product
+    return ":".join(key.split(":", 2)[:2])
+
+
+def _account(key: str, raw_size: int, stored_size: int) -> None:
+    namespace = _namespace(key)
+    CACHE_WRITTEN_ENTRIES.inc(namespace=namespace)
+    CACHE_WRITTEN_BYTES.inc(raw_size, namespace=namespace, kind="raw")
+    CACHE_WRITTEN_BYTES.inc(stored_size, namespace=namespace, kind="stored")
+
 
 async def get_json(key: str) -> Any | None:
     try:
-        client = get_redis()
+        client = get_redis_bytes()
         raw = await client.get(key)
         if raw is None:
+            CACHE_REQUESTS.inc(op="get", result="miss")
             return None
-        return json.loads(raw)
+        CACHE_REQUESTS.inc(op="get", result="hit")
+        return orjson.loads(decode(raw))
     except Exception as exc:  # pragma: no cover - redis optional
+        CACHE_REQUESTS.inc(op="get", result="error")
         logger.warning("cache get failed key=%s error=%s", key, exc)
         return None
 
 
 async def set_json(key: str, value: Any, ttl_seconds: int | None = None) -> None:
     try:
-        client = get_redis()
-        payload = json.dumps(value, default=str)
+        client = get_redis_bytes()
+        payload = orjson.dumps(value, default=str)
+        stored = await _encode(payload)
         ttl = ttl_seconds or settings.cache_ttl_seconds
-        await client.setex(key, ttl, payload)
+        await client.setex(key, ttl, stored)
+        CACHE_REQUESTS.inc(op="set", result="ok")
+        _account(key, len(payload), len(stored))
     except Exception as exc:  # pragma: no cover - redis optional
+        CACHE_REQUESTS.inc(op="set", result="error")
         logger.warning("cache set failed key=%s error=%s", key, exc)
 
 
+async def get_body(key: str, encoding: str | None = None) -> tuple[bytes, str | None] | None:
+    """Готовый JSON из кэша без разбора: сжатый вариант, если он сохранён, иначе исходный."""
+    try:
+        keys = [key, _variant_key(key, encoding)] if encoding else [key]
+        async with get_redis_bytes().pipeline(transaction=False) as pipe:
+            pipe.mget(keys)
+            # Популярность считается в том же round trip, что и чтение.
+            pipe.zincrby(POPULARITY_KEY, 1, key)
+            (raw, *variant), _ = await pipe.execute()
+        CACHE_REQUESTS.inc(op="get", result="miss" if raw is None else "hit")
+        if raw is None:
+            return None
+        if variant and variant[0] is not None:
+            return variant[0], encoding
+        if encoding == _shared_encoding() and raw[:2] == _shared_value(b""):
+            return raw[2:], encoding
+        return decode(raw), None
+    except Exception as exc:  # pragma: no cover - redis optional
+        CACHE_REQUESTS.inc(op="get", result="error")
+        logger.warning("cache get failed key=%s error=%s", key, exc)
+        return None
+
+
+async def get_many(keys: list[str]) -> list[bytes | None]:
+    """Исходные тела по списку ключей одним MGET, в том же порядке; None — промах
+    (в том числе запись, которую не удалось декодировать)."""
+    if not keys:
+        return []
+    try:
+        async with get_redis_bytes().pipeline(transaction=False) as pipe:
+            pipe.mget(keys)
+            for key in keys:
+                pipe.zincrby(POPULARITY_KEY, 1, key)
+            stored, *_ = await pipe.execute()
+        bodies = [_decode_or_none(key, value) for key, value in zip(keys, stored)]
+        hits = sum(body is not None for body in bodies)
+        if hits:
+            CACHE_REQUESTS.inc(hits, op="get", result="hit")
+        if hits < len(keys):
+            CACHE_REQUESTS.inc(len(keys) - hits, op="get", result="miss")
+        return bodies
+    except Exception as exc:  # pragma: no cover - redis optional
+        CACHE_REQUESTS.inc(len(keys), op="get", result="error")
+        logger.warning("cache mget failed keys=%s error=%s", len(keys), exc)
+        return [None] * len(keys)
+
+
+def _decode_or_none(key: str, stored: bytes | None) -> bytes | None:
+    if stored is None:
+        return None
+    try:
+        return decode(stored)
+    except Exception as exc:
+        logger.warning("cache decode failed key=%s error=%s", key, exc)
+        return None
+
+
+async def set_many(entries: Mapping[str, tuple[bytes, Iterable[str]]], ttl_seconds: int | None = None) -> None:
+    """Сохраняет тела с тегами одним pipeline.
+
+    Сжатые варианты не строятся: ``get_body`` отдаст исходное тело, а сожмёт его
+    middleware.
+    """
+    if not entries:
+        return
+    try:
+        ttl = ttl_seconds or settings.cache_ttl_seconds
+        stored = {key: await _encode(payload) for key, (payload, _) in entries.items()}
+        async with get_redis_bytes().pipeline(transaction=False) as pipe:
+            for key, (payload, tags) in entries.items():
+                pipe.setex(key, ttl, stored[key])
+                for tag in tags:
+                    pipe.sadd(_tag_key(tag), key)
+                    pipe.expire(_tag_key(tag), ttl)
+            await pipe.execute()
+        CACHE_REQUESTS.inc(len(entries), op="set", result="ok")
+        for key, (payload, _) in entries.items():
+            _account(key, len(payload), len(stored[key]))
+    except Exception as exc:  # pragma: no cover - redis optional
+        CACHE_REQUESTS.inc(len(entries), op="set", result="error")
+        logger.warning("cache mset failed keys=%s error=%s", len(entries), exc)
+
+
+# KEYS[1]: тело, затем ключи вариантов; ARGV: ttl, значение тела на момент записи,
+# новое значение тела ('' — оставить), варианты. Тело успели сбросить или
+# перезаписать — варианты устарели и не пишутся.
+_SET_VARIANTS_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[2] then
+    return 0
+end
+if ARGV[3] ~= '' then
+    redis.call('SET', KEYS[1], ARGV[3], 'KEEPTTL')
+end
+for i = 2, #KEYS do
+    redis.call('SETEX', KEYS[i], ARGV[1], ARGV[i + 2])
+end
+return 1
+"""
+
+_variant_tasks: set[asyncio.Task] = set()
+
+
+async def set_body(
+    key: str,
+    payload: bytes,
+    ttl_seconds: int | None = None,
+    tags: Iterable[str] = (),
+    background_variants: bool = False,
+) -> None:
+    """Сохраняет тело и его сжатые варианты.
+
+    ``tags`` — сущности, из которых собрано тело (``product:42``, ``listing:all``);
+    ``invalidate_tags`` удаляет все записи с любым из тегов. С
+    ``background_variants`` варианты строятся в фоновой задаче: на промахе
+    ответ сжимает middleware одной быстрой кодировкой, а сильное сжатие
+    всеми кодировками его не задерживает.
+    """
+    try:
+        ttl = ttl_seconds or settings.cache_ttl_seconds
+        encodings = available_encodings() if len(payload) >= settings.compression_min_size else []
+        shared = _shared_encoding()
+        shared = shared if shared in encodings else None
+        variants = {} if background_variants or not encodings else await precompress(payload)
+        if shared:
+            # Тело сжимается один раз — вариантом; до фоновой записи лежит несжатым.
+            variant = variants.pop(shared, None)
+            encoded = _shared_value(variant) if variant else bytes((CODEC_VERSION, NO_COMPRESSION)) + payload
+        else:
+            encoded = await _encode(payload)
+        # Варианты попадают в множества тегов сразу: сброс удалит и записанные позже.
+        stored = [key, *(_variant_key(key, encoding) for encoding in encodings if encoding != shared)]
+        async with get_redis_bytes().pipeline(transaction=False) as pipe:
+            pipe.setex(key, ttl, encoded)
+            for encoding, variant in variants.items():
+                pipe.setex(_variant_key(key, encoding), ttl, variant)
+            for tag in tags:
+                # TTL у всех записей одинаковый: множество тега живёт не меньше самой свежей из них.
+                pipe.sadd(_tag_key(tag), *stored)
+                pipe.expire(_tag_key(tag), ttl)
+            await pipe.execute()
+        CACHE_REQUESTS.inc(op="set", result="ok")
+        _account(key, len(payload), len(encoded) + sum(map(len, variants.values())))
+    except Exception as exc:  # pragma: no cover - redis optional
+        CACHE_REQUESTS.inc(op="set", result="error")
+        logger.warning("cache set failed key=%s error=%s", key, exc)
+        return
+    if background_variants and encodings:
+        task = asyncio.create_task(_store_variants(key, encoded, payload, ttl, shared))
+        _variant_tasks.add(task)
+        task.add_done_callback(_variant_tasks.discard)
+
+
+async def _store_variants(key: str, encoded: bytes, payload: bytes, ttl: int, shared: str | None) -> None:
+    try:
+        variants = await precompress(payload)
+        body = _shared_value(variants.pop(shared)) if shared in variants else b""
+        if not variants and not body:
+            return
+        stored = await lua_script(_SET_VARIANTS_SCRIPT, binary=True)(
+            keys=[key, *(_variant_key(key, encoding) for encoding in variants)],
+            args=[ttl, encoded, body, *variants.values()],
+        )
+        if stored:
+            CACHE_WRITTEN_BYTES.inc(
+                len(body) + sum(map(len, variants.values())), namespace=_namespace(key), kind="stored"
+            )
+    except Exception as exc:  # pragma: no cover - redis optional
+        logger.warning("cache variants failed key=%s error=%s", key, exc)
+
+
+def _variant_key(key: str, encoding: str) -> str:
+    # Тот же префикс, что у исходного ключа: invalidate_prefix удаляет и варианты.
+    return f"{key}:~{encoding}"
+
+
+def _tag_key(tag: str) -> str:
+    return f"cache:tag:{tag}"
+
+
+async def invalidate_tags(tags: Iterable[str]) -> int:
+    """Удаляет записи, помеченные любым из тегов; возвращает число удалённых ключей."""
+    tag_keys = [_tag_key(tag) for tag in tags]
+    if not tag_keys:
+        return 0
+    try:
+        client = get_redis()
+        # Чтение и удаление множеств в одной транзакции: записи, добавленные
+        # после неё, попадут в новые множества и не потеряют теги.
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.sunion(tag_keys)
+            pipe.delete(*tag_keys)
+            keys, _ = await pipe.execute()
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            await client.delete(*keys[start : start + 500])
+        CACHE_REQUESTS.inc(op="invalidate", result="ok")
+        return len(keys)
+    except Exception as exc:  # pragma: no cover - redis optional
+        CACHE_REQUESTS.inc(op="invalidate", result="error")
+        logger.warning("cache invalidate failed tags=%s error=%s", tag_keys, exc)
+        return 0
+
+
 async def invalidate_prefix(prefix: str) -> None:
     try:
         client = get_redis()
         keys = [key async for key in client.scan_iter(match=f"{prefix}*")]
         if keys:
             await client.delete(*keys)
+        CACHE_REQUESTS.inc(op="invalidate", result="ok")
     except Exception as exc:  # pragma: no cover - redis optional
+        CACHE_REQUESTS.inc(op="invalidate", result="error")
         logger.warning("cache invalidate failed prefix=%s error=%s", prefix, exc)
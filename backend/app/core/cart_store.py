@@ -0,0 +1,271 @@
+"""Корзины в Redis-хешах с отложенной записью в таблицы carts/cart_items.
+
+Хеш ``cart:<owner>`` хранит ``qty:<product_id>`` (количество, HINCRBY),
+``price:<product_id>`` (цена на момент добавления) и служебные поля
+``created_at``/``updated_at``. Корзины пользователей, изменённые с момента
+последней записи, лежат в множестве ``cart:dirty`` и периодически
+сохраняются в Postgres; гостевые корзины живут только в Redis.
+"""
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any
+
+from app.core.config import settings
+from app.db.redis import get_redis
+from app.db.repositories import CartRepository
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+CART_KEY_PREFIX = "cart:"
+DIRTY_KEY = "cart:dirty"
+QTY_PREFIX = "qty:"
+PRICE_PREFIX = "price:"
+
+_SET_QTY_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    return nil
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2], 'updated_at', ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return redis.call('HGET', KEYS[1], ARGV[3])
+"""
+
+# ARGV: now, ttl, затем тройки product_id, quantity, price. Цены уже лежащих
+# в корзине товаров сохраняются.
+_REPLACE_SCRIPT = """
+local prices = {}
+for i = 3, #ARGV, 3 do
+    prices[ARGV[i]] = redis.call('HGET', KEYS[1], 'price:' .. ARGV[i]) or ARGV[i + 2]
+end
+local created_at = redis.call('HGET', KEYS[1], 'created_at') or ARGV[1]
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'created_at', created_at, 'updated_at', ARGV[1])
+for i = 3, #ARGV, 3 do
+    redis.call('HSET', KEYS[1], 'qty:' .. ARGV[i], ARGV[i + 1], 'price:' .. ARGV[i], prices[ARGV[i]])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+"""
+
+# KEYS: целевая корзина и (необязательно) гостевая. Количества складываются,
+# гостевая корзина удаляется.
+_MERGE_SCRIPT = """
+local function add(product_id, quantity, price)
+    redis.call('HINCRBY', KEYS[1], 'qty:' .. product_id, quantity)
+    redis.call('HSETNX', KEYS[1], 'price:' .. product_id, price)
+end
+if KEYS[2] then
+    local guest = {}
+    local raw = redis.call('HGETALL', KEYS[2])
+    for i = 1, #raw, 2 do
+        guest[raw[i]] = raw[i + 1]
+    end
+    for field, value in pairs(guest) do
+        if string.sub(field, 1, 4) == 'qty:' then
+            local product_id = string.sub(field, 5)
+            add(product_id, value, guest['price:' .. product_id] or '0')
+        end
+    end
+    redis.call('DEL', KEYS[2])
+end
+for i = 3, #ARGV, 3 do
+    add(ARGV[i], ARGV[i + 1], ARGV[i + 2])
+end
+redis.call('HSETNX', KEYS[1], 'created_at', ARGV[1])
+redis.call('HSET', KEYS[1], 'updated_at', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+"""
+
+# ARGV: ttl, затем пары поле/значение. Пишет корзину из Postgres, только если
+# ключа всё ещё нет: параллельный запрос мог уже поднять её и изменить.
+_HYDRATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+_scripts: dict[str, Any] = {}
+
+
+def _script(source: str):
+    if source not in _scripts:
+        _scripts[source] = get_redis().register_script(source)
+    return _scripts[source]
+
+
+def _lines_args(lines: list[tuple[int, int, Decimal]]) -> list[Any]:
+    args: list[Any] = []
+    for product_id, quantity, price in lines:
+        args.extend([product_id, quantity, str(price)])
+    return args
+
+
+@dataclass(frozen=True)
+class CartOwner:
+    key: str
+    user_id: int | None = None
+
+    @classmethod
+    def for_user(cls, user_id: int) -> "CartOwner":
+        return cls(key=f"{CART_KEY_PREFIX}user:{user_id}", user_id=user_id)
+
+    @classmethod
+    def for_guest(cls, token: str) -> "CartOwner":
+        return cls(key=f"{CART_KEY_PREFIX}guest:{token}")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def _decode(raw: dict[str, str]) -> dict[str, Any]:
+    items = []
+    for field, value in raw.items():
+        if not field.startswith(QTY_PREFIX):
+            continue
+        product_id = field[len(QTY_PREFIX) :]
+        items.append(
+            {
+                "product_id": int(product_id),
+                "quantity": int(value),
+                "price_snapshot": Decimal(raw.get(f"{PRICE_PREFIX}{product_id}", "0")),
+            }
+        )
+    items.sort(key=lambda item: item["product_id"])
+    now = _now()
+    return {
+        "created_at": datetime.fromisoformat(raw.get("created_at", now)),
+        "updated_at": datetime.fromisoformat(raw.get("updated_at", now)),
+        "items": items,
+    }
+
+
+async def _ensure_loaded(owner: CartOwner) -> None:
+    """Поднимает сохранённую корзину пользователя из Postgres, если её нет в Redis."""
+    client = get_redis()
+    if owner.user_id is None or await client.exists(owner.key):
+        return
+    async with SessionLocal() as db:
+        cart = await CartRepository(db).get_active_with_items(owner.user_id)
+    mapping: dict[str, Any] = {"created_at": _now(), "updated_at": _now()}
+    if cart is not None:
+        mapping["created_at"] = cart.created_at.isoformat()
+        mapping["updated_at"] = (cart.updated_at or cart.created_at).isoformat()
+        for item in cart.items:
+            mapping[f"{QTY_PREFIX}{item.product_id}"] = item.quantity
+            mapping[f"{PRICE_PREFIX}{item.product_id}"] = str(item.price_snapshot)
+    args: list[Any] = [settings.cart_ttl_seconds]
+    for field, value in mapping.items():
+        args.extend((field, value))
+    if await _script(_HYDRATE_SCRIPT)(keys=[owner.key], args=args):
+        logger.info("cart hydrated from db user_id=%s", owner.user_id)
+
+
+def _touch(pipe, owner: CartOwner, now: str) -> None:
+    pipe.hset(owner.key, "updated_at", now)
+    pipe.hsetnx(owner.key, "created_at", now)
+    pipe.expire(owner.key, settings.cart_ttl_seconds)
+    if owner.user_id is not None:
+        pipe.sadd(DIRTY_KEY, owner.user_id)
+
+
+async def get_cart(owner: CartOwner) -> dict[str, Any]:
+    await _ensure_loaded(owner)
+    return _decode(await get_redis().hgetall(owner.key))
+
+
+async def add_item(owner: CartOwner, product_id: int, quantity: int, price: Decimal) -> tuple[int, Decimal]:
+    await _ensure_loaded(owner)
+    async with get_redis().pipeline(transaction=True) as pipe:
+        pipe.hincrby(owner.key, f"{QTY_PREFIX}{product_id}", quantity)
+        pipe.hsetnx(owner.key, f"{PRICE_PREFIX}{product_id}", str(price))
+        pipe.hget(owner.key, f"{PRICE_PREFIX}{product_id}")
+        _touch(pipe, owner, _now())
+        result = await pipe.execute()
+    return int(result[0]), Decimal(result[2])
+
+
+async def set_quantity(owner: CartOwner, product_id: int, quantity: int) -> Decimal | None:
+    await _ensure_loaded(owner)
+    client = get_redis()
+    price = await _script(_SET_QTY_SCRIPT)(
+        keys=[owner.key],
+        args=[
+            f"{QTY_PREFIX}{product_id}",
+            quantity,
+            f"{PRICE_PREFIX}{product_id}",
+            _now(),
+            settings.cart_ttl_seconds,
+        ],
+    )
+    if price is None:
+        return None
+    if owner.user_id is not None:
+        await client.sadd(DIRTY_KEY, owner.user_id)
+    return Decimal(price)
+
+
+async def remove_item(owner: CartOwner, product_id: int) -> bool:
+    await _ensure_loaded(owner)
+    async with get_redis().pipeline(transaction=True) as pipe:
+        pipe.hdel(owner.key, f"{QTY_PREFIX}{product_id}", f"{PRICE_PREFIX}{product_id}")
+        _touch(pipe, owner, _now())
+        result = await pipe.execute()
+    return bool(result[0])
+
+
+async def clear(owner: CartOwner) -> None:
+    now = _now()
+    async with get_redis().pipeline(transaction=True) as pipe:
+        pipe.delete(owner.key)
+        pipe.hset(owner.key, "created_at", now)
+        _touch(pipe, owner, now)
+        await pipe.execute()
+
+
+async def replace(owner: CartOwner, lines: list[tuple[int, int, Decimal]]) -> None:
+    await _ensure_loaded(owner)
+    await _script(_REPLACE_SCRIPT)(
+        keys=[owner.key], args=[_now(), settings.cart_ttl_seconds, *_lines_args(lines)]
+    )
+
+
+async def merge(
+    owner: CartOwner, lines: list[tuple[int, int, Decimal]], guest: CartOwner | None = None
+) -> None:
+    await _ensure_loaded(owner)
+    keys = [owner.key] if guest is None else [owner.key, guest.key]
+    await _script(_MERGE_SCRIPT)(keys=keys, args=[_now(), settings.cart_ttl_seconds, *_lines_args(lines)])
+
+
+async def persist_user_cart(user_id: int) -> None:
+    owner = CartOwner.for_user(user_id)
+    raw = await get_redis().hgetall(owner.key)
+    if not raw:
+        return
+    state = _decode(raw)
+    async with SessionLocal() as db:
+        await CartRepository(db).replace_items(user_id, state["items"], state["updated_at"])
+
+
+async def flush_dirty_carts(batch_size: int | None = None) -> int:
+    client = get_redis()
+    user_ids = await client.spop(DIRTY_KEY, batch_size or settings.cart_flush_batch_size)
+    if not user_ids:
+        return 0
+    flushed = 0
+    for user_id in user_ids:
+        try:
+            await persist_user_cart(int(user_id))
+            flushed += 1
+        except Exception as exc:
+            logger.warning("cart flush failed user_id=%s error=%s", user_id, exc)
+            await client.sadd(DIRTY_KEY, user_id)
+    logger.info("carts flushed=%s", flushed)
+    return flushed
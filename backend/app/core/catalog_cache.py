@@ -0,0 +1,367 @@
+"""Ключи и загрузчики кэшируемых ответов каталога, прогрев кэша, события изменений.
+
+Эндпоинты каталога и прогрев при старте используют одни и те же ключи и
+загрузчики, поэтому прогретые записи — ровно то, что потом читают запросы.
+
+Записи о товарах помечаются тегами: ``product:<id>`` для каждого товара в теле,
+``listing:all``/``listing:category:<id>``/``listing:brand:<id>`` для страниц
+списка и ``search:all`` для поиска. Запись о товаре порождает ``ProductChange``
+с изменёнными полями, и ``product_changed`` сбрасывает только теги, на которые
+эти поля влияют: смена остатка удаляет карточку и страницы/поиски, где товар
+есть, но не трогает остальные.
+
+``refresh_popular`` — периодическая задача: по затухающему счётчику обращений
+(``cache:popular``, пополняется в ``cache.get_body``) берёт top-K ключей и
+заранее пересчитывает те, что сброшены или скоро истекут, теми же загрузчиками.
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+import orjson
+
+from sqlalchemy import Integer, any_, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.core.cache import (
+    POPULARITY_KEY,
+    get_many,
+    invalidate_prefix,
+    invalidate_tags,
+    set_body,
+    set_json,
+    set_many,
+)
+from app.core.config import settings
+from app.core.embeddings import embed_texts
+from app.core.http_cache import bump_catalog_version
+from app.core.neighbors import similar_tags
+from app.core.serialization import dump_product_detail, dump_products
+from app.db.models import Product
+from app.db.repositories import (
+    AnalyticsRepository,
+    BrandRepository,
+    CategoryRepository,
+    ProductNeighborRepository,
+    ProductRepository,
+)
+from app.db.redis import get_redis
+from app.db.session import SessionLocal
+from app.schemas.catalog import BrandRead, CategoryRead
+
+logger = logging.getLogger(__name__)
+
+LIST_LIMIT = 100
+PRODUCTS_PAGE_SIZE = 20
+
+SECTION_PREFIXES = {
+    "categories": ["catalog:categories:"],
+    "brands": ["catalog:brands:"],
+}
+CHANGES_CHANNEL = "catalog:changes"
+REFRESH_LOCK_KEY = "cache:refresh:lock"
+# Ключи, к которым почти не обращаются, выпадают из счётчика.
+MIN_POPULARITY = 0.5
+
+# Поля, от которых зависит, в какие списки и в какой поиск попадает товар.
+LISTING_FIELDS = frozenset({"is_active", "category_id", "brand_id"})
+SEARCH_FIELDS = frozenset({"is_active", "name", "description"})
+
+
+def categories_key(offset: int, limit: int) -> str:
+    return f"catalog:categories:{offset}:{limit}"
+
+
+def brands_key(offset: int, limit: int) -> str:
+    return f"catalog:brands:{offset}:{limit}"
+
+
+def products_page_key(offset: int, limit: int, category_id: int | None, brand_id: int | None) -> str:
+    return f"catalog:products:{offset}:{limit}:{category_id}:{brand_id}"
+
+
+def product_key(product_id: int) -> str:
+    return f"catalog:product:{product_id}"
+
+
+def search_key(query: str, limit: int) -> str:
+    return f"catalog:search:tsv:{query}:{limit}"
+
+
+def semantic_search_key(query: str, limit: int) -> str:
+    return f"catalog:search:semantic:{query}:{limit}"
+
+
+def product_tags(product_ids: Iterable[int]) -> list[str]:
+    return [f"product:{product_id}" for product_id in product_ids]
+
+
+def listing_tags(category_id: int | None, brand_id: int | None) -> list[str]:
+    tags = []
+    if category_id:
+        tags.append(f"listing:category:{category_id}")
+    if brand_id:
+        tags.append(f"listing:brand:{brand_id}")
+    return tags or ["listing:all"]
+
+
+@dataclass(frozen=True)
+class ProductChange:
+    """Событие записи о товаре: что произошло и какие поля изменились.
+
+    ``category_ids``/``brand_ids`` — старые и новые значения: товар уходит
+    из одних списков и появляется в других.
+    """
+
+    product_id: int
+    kind: str  # created | updated | deleted
+    fields: frozenset[str] = frozenset()
+    category_ids: frozenset[int] = field(default_factory=frozenset)
+    brand_ids: frozenset[int] = field(default_factory=frozenset)
+
+    def tags(self) -> set[str]:
+        tags = set(product_tags([self.product_id]))
+        membership = self.kind != "updated"
+        if membership or self.fields & LISTING_FIELDS:
+            tags.add("listing:all")
+            tags.update(f"listing:category:{category_id}" for category_id in self.category_ids)
+            tags.update(f"listing:brand:{brand_id}" for brand_id in self.brand_ids)
+        if membership or self.fields & SEARCH_FIELDS:
+            tags.add("search:all")
+        return tags
+
+    def to_json(self) -> bytes:
+        return orjson.dumps(
+            {
+                "product_id": self.product_id,
+                "kind": self.kind,
+                "fields": sorted(self.fields),
+                "category_ids": sorted(self.category_ids),
+                "brand_ids": sorted(self.brand_ids),
+            }
+        )
+
+
+async def product_changed(change: ProductChange) -> None:
+    """Сбрасывает затронутые записи кэша и публикует событие в ``catalog:changes``."""
+    removed = await invalidate_tags(change.tags())
+    await bump_catalog_version("products")
+    try:
+        await get_redis().publish(CHANGES_CHANNEL, change.to_json())
+    except Exception as exc:  # pragma: no cover - redis optional
+        logger.warning("product change publish failed product_id=%s error=%s", change.product_id, exc)
+    logger.info(
+        "product changed id=%s kind=%s fields=%s evicted=%s",
+        change.product_id,
+        change.kind,
+        ",".join(sorted(change.fields)),
+        removed,
+    )
+
+
+async def products_changed(changes: list[ProductChange]) -> None:
+    """То же для пачки изменений: один сброс по объединённым тегам, одно
+    повышение версии и события одним pipeline."""
+    if not changes:
+        return
+    removed = await invalidate_tags(set().union(*(change.tags() for change in changes)))
+    await bump_catalog_version("products")
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for change in changes:
+                pipe.publish(CHANGES_CHANNEL, change.to_json())
+            await pipe.execute()
+    except Exception as exc:  # pragma: no cover - redis optional
+        logger.warning("product changes publish failed count=%s error=%s", len(changes), exc)
+    logger.info("products changed count=%s evicted=%s", len(changes), removed)
+
+
+async def section_changed(section: str, *tags: str) -> None:
+    """Изменение категорий или брендов: их списки невелики и сбрасываются целиком."""
+    for prefix in SECTION_PREFIXES[section]:
+        await invalidate_prefix(prefix)
+    if tags:
+        await invalidate_tags(tags)
+    await bump_catalog_version(section)
+
+
+async def load_categories(db: AsyncSession, offset: int, limit: int) -> list[dict]:
+    categories = await CategoryRepository(db).list(offset=offset, limit=limit)
+    return [CategoryRead.model_validate(c).model_dump() for c in categories]
+
+
+async def load_brands(db: AsyncSession, offset: int, limit: int) -> list[dict]:
+    brands = await BrandRepository(db).list(offset=offset, limit=limit)
+    return [BrandRead.model_validate(b).model_dump() for b in brands]
+
+
+async def load_products_page(
+    db: AsyncSession, offset: int, limit: int, category_id: int | None = None, brand_id: int | None = None
+) -> tuple[bytes, list[str]]:
+    query = (
+        select(Product)
+        .options(selectinload(Product.images), selectinload(Product.specs))
+        .where(Product.is_active.is_(True))
+    )
+    if category_id:
+        query = query.where(Product.category_id == category_id)
+    if brand_id:
+        query = query.where(Product.brand_id == brand_id)
+    result = await db.execute(query.offset(offset).limit(limit))
+    products = result.scalars().all()
+    return dump_products(products), listing_tags(category_id, brand_id) + product_tags(p.id for p in products)
+
+
+async def load_product_cards(db: AsyncSession, product_ids: list[int]) -> dict[int, tuple[bytes, list[str]]]:
+    """Карточки товаров с похожими товарами и теги каждой карточки.
+
+    Карточка помечена и тегами похожих товаров: их цена и остаток видны в ней.
+    """
+    if not product_ids:
+        return {}
+    result = await db.execute(
+        select(Product)
+        .options(selectinload(Product.images), selectinload(Product.specs))
+        # Один параметр-массив вместо IN (...): один план на любое число id.
+        .where(Product.id == any_(literal(list(product_ids), ARRAY(Integer))))
+    )
+    products = result.scalars().all()
+    similar = await ProductNeighborRepository(db).similar([product.id for product in products])
+    return {
+        product.id: (
+            dump_product_detail(product, similar[product.id]),
+            [
+                *product_tags([product.id]),
+                *similar_tags([product.id]),
+                *product_tags(row.id for row in similar[product.id]),
+            ],
+        )
+        for product in products
+    }
+
+
+async def get_product_cards(db: AsyncSession, product_ids: list[int]) -> list[bytes]:
+    """Карточки в порядке ``product_ids``: попадания — одним MGET, промахи —
+    одним запросом к БД и одной записью в кэш. Несуществующие id пропускаются."""
+    keys = [product_key(product_id) for product_id in product_ids]
+    bodies = dict(zip(product_ids, await get_many(keys)))
+    missing = [product_id for product_id, body in bodies.items() if body is None]
+    if missing:
+        cards = await load_product_cards(db, missing)
+        await set_many({product_key(product_id): card for product_id, card in cards.items()})
+        bodies.update((product_id, payload) for product_id, (payload, _) in cards.items())
+    return [bodies[product_id] for product_id in product_ids if bodies[product_id] is not None]
+
+
+async def load_search(db: AsyncSession, query: str, limit: int) -> tuple[bytes, list[str]]:
+    products = await ProductRepository(db).search_by_tsv(query, limit=limit)
+    return dump_products(products), ["search:all", *product_tags(p.id for p in products)]
+
+
+async def load_semantic_search(db: AsyncSession, query: str, limit: int) -> tuple[bytes, list[str]]:
+    vector = (await embed_texts([query]))[0]
+    if not any(vector):
+        # В запросе нет ни одного слова: с нулевым вектором косинус не определён.
+        return dump_products([]), ["search:all"]
+    products = await ProductRepository(db).search_by_embedding(vector, limit=limit)
+    return dump_products(products), ["search:all", *product_tags(p.id for p in products)]
+
+
+async def warm_up(product_pages: int, top_products: int) -> None:
+    """Заполняет кэш первой страницей категорий и брендов, первыми страницами
+    списка товаров и карточками самых продаваемых товаров."""
+    start = time.perf_counter()
+    async with SessionLocal() as db:
+        await set_json(categories_key(0, LIST_LIMIT), await load_categories(db, 0, LIST_LIMIT))
+        await set_json(brands_key(0, LIST_LIMIT), await load_brands(db, 0, LIST_LIMIT))
+        for page in range(product_pages):
+            offset = page * PRODUCTS_PAGE_SIZE
+            payload, tags = await load_products_page(db, offset, PRODUCTS_PAGE_SIZE)
+            await set_body(products_page_key(offset, PRODUCTS_PAGE_SIZE, None, None), payload, tags=tags)
+        top = await AnalyticsRepository(db).top_products(limit=top_products)
+        cards = await load_product_cards(db, [row.product_id for row in top])
+    for product_id, (payload, tags) in cards.items():
+        await set_body(product_key(product_id), payload, tags=tags)
+    logger.info(
+        "catalog cache warmed pages=%s products=%s %.2fs", product_pages, len(cards), time.perf_counter() - start
+    )
+
+
+def _optional_int(value: str) -> int | None:
+    return None if value == "None" else int(value)
+
+
+async def refresh_key(db: AsyncSession, key: str) -> bool:
+    """Пересчитывает тело по ключу кэша; False — ключ не распознан или товара больше нет."""
+    try:
+        _, kind, rest = key.split(":", 2)
+        if kind == "product":
+            product_id = int(rest)
+            cards = await load_product_cards(db, [product_id])
+            if product_id not in cards:
+                return False
+            payload, tags = cards[product_id]
+        elif kind == "products":
+            offset, limit, category_id, brand_id = rest.split(":")
+            payload, tags = await load_products_page(
+                db, int(offset), int(limit), _optional_int(category_id), _optional_int(brand_id)
+            )
+        elif kind == "search" and rest.startswith("tsv:"):
+            query, _, limit = rest.removeprefix("tsv:").rpartition(":")
+            payload, tags = await load_search(db, query, int(limit))
+        elif kind == "search" and rest.startswith("semantic:"):
+            query, _, limit = rest.removeprefix("semantic:").rpartition(":")
+            payload, tags = await load_semantic_search(db, query, int(limit))
+        else:
+            return False
+    except ValueError:
+        return False
+    await set_body(key, payload, tags=tags)
+    return True
+
+
+async def refresh_popular() -> None:
+    client = get_redis()
+    interval = settings.cache_refresh_interval_seconds
+    # Замок не снимается: за интервал обновление запускает только один воркер.
+    if not await client.set(REFRESH_LOCK_KEY, "1", nx=True, ex=max(1, int(interval))):
+        return
+    top_k = settings.cache_refresh_top_k
+    decay = 0.5 ** (interval / settings.cache_popularity_half_life_seconds)
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.zunionstore(POPULARITY_KEY, {POPULARITY_KEY: decay})
+        pipe.zremrangebyscore(POPULARITY_KEY, "-inf", f"({MIN_POPULARITY}")
+        pipe.zremrangebyrank(POPULARITY_KEY, 0, -top_k * 10 - 1)
+        pipe.zrevrange(POPULARITY_KEY, 0, top_k - 1)
+        *_, top = await pipe.execute()
+    if not top:
+        return
+    async with client.pipeline(transaction=False) as pipe:
+        for key in top:
+            pipe.ttl(key)
+        ttls = await pipe.execute()
+    # -2: ключ сброшен или истёк.
+    stale = [key for key, ttl in zip(top, ttls) if ttl == -2 or 0 <= ttl < settings.cache_refresh_ahead_seconds]
+    if not stale:
+        return
+
+    start = time.perf_counter()
+    # Своя сессия на ключ, но не больше cache_refresh_concurrency соединений сразу:
+    # пул остаётся запросам.
+    semaphore = asyncio.Semaphore(settings.cache_refresh_concurrency)
+
+    async def refresh(key: str) -> None:
+        async with semaphore, SessionLocal() as db:
+            if not await refresh_key(db, key):
+                await client.zrem(POPULARITY_KEY, key)
+
+    results = await asyncio.gather(*(refresh(key) for key in stale), return_exceptions=True)
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        logger.warning("cache refresh failed keys=%s first_error=%s", len(failed), failed[0])
+    logger.info("cache refreshed keys=%s top=%s %.2fs", len(stale) - len(failed), len(top), time.perf_counter() - start)
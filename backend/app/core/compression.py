@@ -0,0 +1,149 @@
+"""Сжатие ответов: zstd, brotli и gzip по ``Accept-Encoding``.
+
+Тела из кэша сжимаются один раз после записи (``precompress``, в фоне) и
+отдаются готовыми; ``CompressionMiddleware`` сжимает остальные ответы, а
+большие — в пуле потоков, чтобы не блокировать event loop.
+"""
+
+import asyncio
+import gzip
+from collections.abc import Callable
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+# Потоковые ответы: буферизация до конца тела задержала бы события.
+STREAMING_TYPES = ("text/event-stream",)
+
+# (быстрый уровень для ответов на лету, сильный — для тел в кэше)
+_ENCODERS: dict[str, tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "gzip": (
+        lambda data: gzip.compress(data, compresslevel=6, mtime=0),
+        lambda data: gzip.compress(data, compresslevel=9, mtime=0),
+    ),
+}
+if brotli is not None:
+    _ENCODERS["br"] = (
+        lambda data: brotli.compress(data, quality=4),
+        lambda data: brotli.compress(data, quality=9),
+    )
+if zstandard is not None:
+    _ENCODERS["zstd"] = (
+        lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+        lambda data: zstandard.ZstdCompressor(level=12).compress(data),
+    )
+
+
+def available_encodings() -> list[str]:
+    """Включённые и доступные кодировки в порядке предпочтения сервера."""
+    return [encoding for encoding in settings.compression_encodings if encoding in _ENCODERS]
+
+
+def negotiate(accept_encoding: str | None) -> str | None:
+    if not accept_encoding:
+        return None
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data: bytes, encoding: str, strong: bool = False) -> bytes:
+    fast, slow = _ENCODERS[encoding]
+    return (slow if strong else fast)(data)
+
+
+async def compress_async(data: bytes, encoding: str, strong: bool = False) -> bytes:
+    if len(data) < settings.compression_offload_size:
+        return compress(data, encoding, strong)
+    return await asyncio.to_thread(compress, data, encoding, strong)
+
+
+async def precompress(data: bytes) -> dict[str, bytes]:
+    """Все варианты тела для кэша; пусто, если тело меньше порога."""
+    if len(data) < settings.compression_min_size:
+        return {}
+
+    def run() -> dict[str, bytes]:
+        return {encoding: compress(data, encoding, strong=True) for encoding in available_encodings()}
+
+    return await asyncio.to_thread(run)
+
+
+class CompressionMiddleware:
+    """ASGI-middleware: сжимает несжатые ответы подходящего типа и размера."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        chunks: list[bytes] = []
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or content_type.startswith(STREAMING_TYPES)
+                ):
+                    start = None
+                    await send(message)
+                    return
+                start = message
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            if len(body) >= settings.compression_min_size:
+                body = await compress_async(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -5,6 +5,20 @@ class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
     database_url: str
+    db_driver: str | None = None
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout_seconds: float = 10
+    db_pool_recycle_seconds: int = 1800
+    db_pool_pre_ping: str = "idle"
+    db_pool_pre_ping_idle_seconds: int = 30
+    db_statement_cache_size: int = 500
+    db_statement_timeout_ms: int = 0
+    database_replica_urls: list[str] = []
+    db_replica_eject_seconds: int = 30
+    db_replica_max_lag_seconds: float = 10
+    db_replica_check_interval_seconds: int = 10
+    db_read_your_writes_seconds: int = 5
     redis_url: str = "redis://localhost:6379/0"
 
     jwt_secret: str = "dev-secret"
@@ -14,11 +28,94 @@ class Settings(BaseSettings):
 
     cors_origins: list[str] = ["http://localhost:5173"]
     product_embedding_dim: int = 128
+    embedding_seed: int = 0
+    embedding_worker_enabled: bool = True
+    embedding_interval_seconds: float = 5
+    embedding_batch_size: int = 64
+    embedding_batches_per_run: int = 10
+    neighbors_k: int = 10
+    neighbors_same_category: bool = False
+    neighbors_chunk_size: int = 256
+    neighbors_refresh_interval_seconds: float = 10
+    neighbors_refresh_batch_size: int = 50
+    neighbors_ef_search: int = 100
+    rollups_fold_interval_seconds: float = 2
+    rollups_fold_batch_size: int = 1000
+    copurchase_k: int = 10
+    copurchase_min_count: int = 2
+    copurchase_keep_per_product: int = 200
+    copurchase_max_order_items: int = 50
+    copurchase_refresh_interval_seconds: float = 30
+    copurchase_refresh_batch_size: int = 200
+    copurchase_fold_batch_size: int = 500
+    copurchase_prune_interval_seconds: float = 3600
+    copurchase_rebuild_chunk_size: int = 50_000
     cache_ttl_seconds: int = 60
+    cache_refresh_enabled: bool = True
+    cache_refresh_interval_seconds: float = 10
+    cache_refresh_ahead_seconds: int = 20
+    cache_refresh_top_k: int = 200
+    cache_refresh_concurrency: int = 2
+    cache_popularity_half_life_seconds: float = 600
+    cache_codec_enabled: bool = False
+    cache_codec_compression: str = "zstd"
+    cache_codec_level: int = 3
+    cache_codec_min_size: int = 512
+    media_root: str = "media"
+    media_url_prefix: str = "/media"
+    media_serve: bool = True
+    image_max_upload_bytes: int = 20 * 1024 * 1024
+    image_variant_widths: list[int] = [160, 320, 640, 1280]
+    image_card_width: int = 320
+    image_webp_quality: int = 80
+    image_variants_version: int = 1
+    image_workers: int = 2
+    stock_reservation_ttl_seconds: int = 60
+    stock_reconcile_interval_seconds: float = 2
+    stock_expire_interval_seconds: float = 10
+    compression_encodings: list[str] = ["zstd", "br", "gzip"]
+    compression_min_size: int = 1024
+    compression_offload_size: int = 64 * 1024
+    cache_control_default: str = "no-cache"
+    cache_control_policies: dict[str, str] = {
+        "categories": "public, max-age=300, stale-while-revalidate=60",
+        "brands": "public, max-age=300, stale-while-revalidate=60",
+        "products": "public, max-age=60, stale-while-revalidate=30",
+        "product": "public, max-age=60, stale-while-revalidate=30",
+        "search": "public, max-age=30",
+    }
+    rate_limit_enabled: bool = True
+    rate_limit_policies: dict[str, dict[str, float]] = {
+        "default": {"rate": 20, "burst": 100, "cost": 1},
+        "search": {"rate": 2, "burst": 30, "cost": 1, "miss_cost": 4},
+        "vector_search": {"rate": 1, "burst": 10, "cost": 5},
+        "semantic_search": {"rate": 2, "burst": 30, "cost": 1, "miss_cost": 4},
+        "auth": {"rate": 0.2, "burst": 10, "cost": 1},
+    }
+    # API-ключ -> множитель квоты (rate и burst).
+    rate_limit_api_keys: dict[str, float] = {}
+    rate_limit_trusted_proxy_hops: int = 0
     enable_db_init: bool = True
+    db_pool_warm_connections: int = 5
+    warmup_enabled: bool = True
+    warmup_product_pages: int = 5
+    warmup_top_products: int = 100
+    warmup_timeout_seconds: float = 30
     session_cookie_name: str = "take_smart_session"
     session_cookie_secure: bool = False
     session_cookie_samesite: str = "lax"
+    session_backend: str = "redis"
+    session_sliding_expiration: bool = False
+    cart_cookie_name: str = "take_smart_cart"
+    cart_ttl_seconds: int = 30 * 24 * 3600
+    cart_flush_interval_seconds: int = 10
+    cart_flush_batch_size: int = 500
+    metrics_enabled: bool = True
+    metrics_multiproc_dir: str | None = None
+    metrics_flush_interval_seconds: int = 5
+    db_slow_query_ms: int = 200
+    db_n_plus_one_threshold: int = 5
+    server_timing_enabled: bool = True
 
 
 settings = Settings()
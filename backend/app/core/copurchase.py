@@ -0,0 +1,209 @@
+"""«Покупают вместе»: счётчики пар товаров в заказах и готовые top-K списки.
+
+Заказ в своей транзакции только дописывает событие в ``copurchase_events``:
+upsert пар в ней держал бы блокировки популярных пар до commit и выстраивал
+оформления в очередь. Периодическая задача переносит журнал в
+``product_pair_counts`` (пары считает ``order_pairs`` — так же, как полный
+пересчёт, с пропуском заказов больше ``COPURCHASE_MAX_ORDER_ITEMS``), а id
+товаров попадают в множество ``copurchase:dirty``, и их списки в
+``product_recommendations`` пересчитываются. Вес пары — косинус: число общих
+заказов, делённое на корень из произведения заказов каждого товара. Полный
+пересчёт (``rebuild_all``, команда ``rebuild_copurchases``) собирает пары из
+истории заказов в numpy во вспомогательную таблицу и подменяет ею счётчики.
+Перенос, пересчёт списков, чистка и полный пересчёт идут под одним замком в
+Redis.
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from collections.abc import Iterable
+
+import numpy as np
+
+from app.core.config import settings
+from app.db.redis import get_redis, redis_lock
+from app.db.repositories import CopurchaseRepository
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+DIRTY_KEY = "copurchase:dirty"
+LOCK_KEY = "copurchase:lock"
+LOCK_TTL_SECONDS = 300
+REBUILD_LOCK_TTL_SECONDS = 3 * 3600
+
+
+async def mark_dirty(product_ids: Iterable[int]) -> None:
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    try:
+        await get_redis().sadd(DIRTY_KEY, *product_ids)
+    except Exception as exc:  # pragma: no cover - redis optional
+        logger.warning("copurchase mark dirty failed ids=%s error=%s", product_ids, exc)
+
+
+def order_pairs(order_ids: np.ndarray, product_ids: np.ndarray, max_items: int) -> np.ndarray:
+    """Коды пар ``(a << 32) | b`` в обе стороны для строк, отсортированных по order_id.
+
+    Повторы товара в заказе схлопываются, заказы больше ``max_items`` товаров
+    (оптовые) пропускаются — они дают квадратичное число пар и мало сигнала.
+    """
+    keys = np.unique((order_ids.astype(np.int64) << 32) | product_ids.astype(np.int64))
+    orders, products = keys >> 32, keys & 0xFFFFFFFF
+    _, sizes = np.unique(orders, return_counts=True)
+    keep = np.repeat(sizes <= max_items, sizes)
+    orders, products = orders[keep], products[keep]
+    pairs = []
+    for offset in range(1, min(int(sizes.max(initial=0)), max_items)):
+        same = orders[offset:] == orders[:-offset]
+        left, right = products[:-offset][same], products[offset:][same]
+        pairs.append((left << 32) | right)
+        pairs.append((right << 32) | left)
+    return np.concatenate(pairs) if pairs else np.empty(0, dtype=np.int64)
+
+
+def _count_pairs(chunks: list[np.ndarray], keep_per_product: int) -> list[dict]:
+    codes, counts = np.unique(np.concatenate(chunks), return_counts=True)
+    products, others = codes >> 32, codes & 0xFFFFFFFF
+    # Внутри товара — по убыванию числа заказов, затем отрезаем хвост.
+    order = np.lexsort((-counts, products))
+    products, others, counts = products[order], others[order], counts[order]
+    _, starts = np.unique(products, return_index=True)
+    rank = np.arange(len(products)) - np.repeat(starts, np.diff(np.append(starts, len(products))))
+    keep = rank < keep_per_product
+    return [
+        {"product_id": product_id, "other_id": other_id, "orders_count": count}
+        for product_id, other_id, count in zip(
+            products[keep].tolist(), others[keep].tolist(), counts[keep].tolist()
+        )
+    ]
+
+
+def _pair_deltas(order_ids: np.ndarray, product_ids: np.ndarray, signs: dict[int, int], max_items: int) -> list[dict]:
+    """Дельты счётчиков по заказам с итоговым знаком, по возрастанию (product_id, other_id)."""
+    totals: Counter[int] = Counter()
+    for sign in set(signs.values()):
+        orders = [order_id for order_id, order_sign in signs.items() if order_sign == sign]
+        mask = np.isin(order_ids, orders)
+        codes, counts = np.unique(order_pairs(order_ids[mask], product_ids[mask], max_items), return_counts=True)
+        for code, count in zip(codes.tolist(), counts.tolist()):
+            totals[code] += sign * count
+    return [
+        {"product_id": code >> 32, "other_id": code & 0xFFFFFFFF, "orders_count": delta}
+        for code, delta in sorted(totals.items())
+        if delta
+    ]
+
+
+async def _fold_batch() -> int:
+    async with SessionLocal() as db:
+        repo = CopurchaseRepository(db)
+        events = await repo.take_events(settings.copurchase_fold_batch_size)
+        signs: Counter[int] = Counter()
+        for order_id, sign in events:
+            signs[order_id] += sign
+        signs = {order_id: sign for order_id, sign in signs.items() if sign}
+        rows = []
+        if signs:
+            items = await repo.order_items(list(signs))
+            order_ids = np.array([item.order_id for item in items], dtype=np.int64)
+            product_ids = np.array([item.product_id for item in items], dtype=np.int64)
+            rows = await asyncio.to_thread(
+                _pair_deltas, order_ids, product_ids, signs, settings.copurchase_max_order_items
+            )
+            await repo.add_counts(rows)
+        await db.commit()
+    await mark_dirty({row["product_id"] for row in rows})
+    return len(events)
+
+
+async def _fold_events() -> int:
+    batch_size = settings.copurchase_fold_batch_size
+    total = 0
+    while True:
+        folded = await _fold_batch()
+        total += folded
+        if folded < batch_size:
+            return total
+
+
+async def _rebuild(chunk_size: int) -> int:
+    start_time = time.perf_counter()
+    async with SessionLocal() as db:
+        # Один снимок на чтение заказов и журнала: события заказов, прочитанных
+        # здесь, удаляются, а оформленных позже — останутся и лягут на новые счётчики.
+        await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        repo = CopurchaseRepository(db)
+        chunks: list[np.ndarray] = []
+        after_order_id = 0
+        while True:
+            rows = await repo.order_items_chunk(after_order_id, chunk_size)
+            if not rows:
+                break
+            order_ids = np.array([row.order_id for row in rows], dtype=np.int64)
+            product_ids = np.array([row.product_id for row in rows], dtype=np.int64)
+            if len(rows) == chunk_size and order_ids[0] != order_ids[-1]:
+                # Последний заказ мог не поместиться целиком — дочитаем его следующим блоком.
+                complete = order_ids != order_ids[-1]
+                order_ids, product_ids = order_ids[complete], product_ids[complete]
+            after_order_id = int(order_ids[-1])
+            chunks.append(
+                await asyncio.to_thread(order_pairs, order_ids, product_ids, settings.copurchase_max_order_items)
+            )
+        rows = await asyncio.to_thread(_count_pairs, chunks, settings.copurchase_keep_per_product) if chunks else []
+        await repo.swap_counts(rows)
+        await repo.clear_events()
+        await repo.refresh_lists(None, settings.copurchase_k, settings.copurchase_min_count)
+        await db.commit()
+    logger.info("copurchase rebuilt pairs=%s %.2fs", len(rows), time.perf_counter() - start_time)
+    return len(rows)
+
+
+async def rebuild_all(chunk_size: int | None = None) -> int:
+    """Пересчитывает счётчики пар по всем учитываемым заказам и все списки.
+
+    Ждёт, пока фоновая задача отпустит замок; оформление заказов не блокирует.
+    """
+    while True:
+        async with redis_lock(LOCK_KEY, REBUILD_LOCK_TTL_SECONDS) as acquired:
+            if acquired:
+                return await _rebuild(chunk_size or settings.copurchase_rebuild_chunk_size)
+        await asyncio.sleep(1)
+
+
+async def refresh_dirty() -> None:
+    """Периодическая задача: перенос новых заказов в счётчики и пересчёт списков их товаров."""
+    async with redis_lock(LOCK_KEY, LOCK_TTL_SECONDS) as acquired:
+        if not acquired:
+            return
+        folded = await _fold_events()
+        client = get_redis()
+        popped = await client.spop(DIRTY_KEY, settings.copurchase_refresh_batch_size)
+        product_ids = [int(product_id) for product_id in popped]
+        if not product_ids:
+            return
+        try:
+            async with SessionLocal() as db:
+                await CopurchaseRepository(db).refresh_lists(
+                    product_ids, settings.copurchase_k, settings.copurchase_min_count
+                )
+                await db.commit()
+        except Exception:
+            await client.sadd(DIRTY_KEY, *product_ids)
+            raise
+    logger.info("copurchase lists refreshed orders=%s products=%s", folded, len(product_ids))
+
+
+async def prune_pairs() -> None:
+    """Периодическая задача: срезает редкие пары, чтобы таблица не росла квадратично."""
+    async with redis_lock(LOCK_KEY, LOCK_TTL_SECONDS) as acquired:
+        if not acquired:
+            return
+        async with SessionLocal() as db:
+            removed = await CopurchaseRepository(db).prune(settings.copurchase_keep_per_product)
+            await db.commit()
+    if removed:
+        logger.info("copurchase pairs pruned rows=%s", removed)
@@ -1,13 +1,14 @@
 from datetime import datetime, timedelta, timezone
 import logging
 
-from fastapi import Cookie, Depends, HTTPException, Request, status
+from fastapi import Cookie, Depends, HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.core.security import decode_access_token
+from app.core.sessions import get_session_store
 from app.db.models import User
-from app.db.repositories import SessionRepository, UserRepository
+from app.db.repositories import UserRepository
 from app.db.session import get_db
 
 logger = logging.getLogger(__name__)
@@ -15,6 +16,7 @@ logger = logging.getLogger(__name__)
 
 async def get_current_user(
     request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     session_token: str | None = Cookie(default=None, alias=settings.session_cookie_name),
 ) -> User:
@@ -37,18 +39,30 @@ async def get_current_user(
         return user
 
     if session_token:
-        session_repo = SessionRepository(db)
-        session = await session_repo.get_by_token(session_token)
-        if not session or session.expires_at < datetime.now(timezone.utc):
+        user_id = await get_session_store().get_user_id(session_token)
+        if user_id is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired")
-        user = await user_repo.get(session.user_id)
+        user = await user_repo.get(user_id)
         if not user or not user.is_active:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        if settings.session_sliding_expiration:
+            set_session_cookie(response, session_token, get_session_expiration())
         return user
 
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
 
 
+async def get_optional_user(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    session_token: str | None = Cookie(default=None, alias=settings.session_cookie_name),
+) -> User | None:
+    if not session_token and not request.headers.get("Authorization"):
+        return None
+    return await get_current_user(request, response, db, session_token)
+
+
 async def require_admin(user: User = Depends(get_current_user)) -> User:
     if not user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
@@ -57,3 +71,14 @@ async def require_admin(user: User = Depends(get_current_user)) -> User:
 
 def get_session_expiration() -> datetime:
     return datetime.now(timezone.utc) + timedelta(hours=settings.session_exp_hours)
+
+
+def set_session_cookie(response: Response, session_token: str, expires_at: datetime) -> None:
+    response.set_cookie(
+        settings.session_cookie_name,
+        session_token,
+        httponly=True,
+        max_age=int((expires_at - datetime.now(timezone.utc)).total_seconds()),
+        secure=settings.session_cookie_secure,
+        samesite=settings.session_cookie_samesite,
+    )
@@ -0,0 +1,39 @@
+"""Заполнение ``Product.name_embedding`` в фоне.
+
+Запись товара без явного вектора оставляет (или сбрасывает при смене
+названия) ``name_embedding = NULL``; периодическая задача забирает такие
+товары пачками (``FOR UPDATE SKIP LOCKED``, так что воркеры не мешают друг
+другу), считает векторы в пуле потоков, сбрасывает кэш карточек и ставит
+товары в очередь пересчёта похожих (``neighbors``).
+"""
+
+import logging
+
+from app.core.catalog_cache import ProductChange, products_changed
+from app.core.config import settings
+from app.core.embeddings import embed_texts
+from app.core.neighbors import mark_dirty
+from app.db.repositories import ProductRepository
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+async def embed_pending() -> int:
+    total = 0
+    for _ in range(settings.embedding_batches_per_run):
+        async with SessionLocal() as db, db.begin():
+            repo = ProductRepository(db)
+            rows = await repo.claim_missing_embeddings(settings.embedding_batch_size)
+            if not rows:
+                break
+            vectors = await embed_texts([row.name for row in rows])
+            await repo.set_embeddings({row.id: vector for row, vector in zip(rows, vectors)})
+        await products_changed([ProductChange(row.id, "updated", frozenset({"name_embedding"})) for row in rows])
+        await mark_dirty(row.id for row in rows)
+        total += len(rows)
+        if len(rows) < settings.embedding_batch_size:
+            break
+    if total:
+        logger.info("product embeddings computed=%s", total)
+    return total
@@ -0,0 +1,67 @@
+"""Локальные эмбеддинги текста без моделей и сети.
+
+Слова и символьные n-граммы слов хэшируются (crc32, стабилен между
+процессами) в ``2**bits`` признаков, каждый признак проецируется в
+``dim`` измерений разреженной случайной проекцией (несколько координат со
+знаком ±1, матрица задаётся seed). Веса — сублинейная частота, вектор
+нормирован по L2, так что косинусная близость равна скалярному произведению.
+Похожими оказываются названия с общими словами и их частями, а не синонимы.
+"""
+
+import asyncio
+import re
+from functools import lru_cache
+from zlib import crc32
+
+import numpy as np
+
+from app.core.config import settings
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    def __init__(
+        self, dim: int, ngram_range: tuple[int, int] = (3, 5), bits: int = 18, nnz: int = 4, seed: int = 0
+    ) -> None:
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self._mask = (1 << bits) - 1
+        rng = np.random.default_rng(seed)
+        self._index = rng.integers(0, dim, size=(1 << bits, nnz), dtype=np.int32)
+        self._sign = rng.choice(np.array([-1.0, 1.0], dtype=np.float32), size=(1 << bits, nnz))
+
+    def features(self, text: str) -> list[int]:
+        low, high = self.ngram_range
+        features = []
+        for word in _WORD_RE.findall(text.lower().replace("ё", "е")):
+            features.append(crc32(f"w:{word}".encode()) & self._mask)
+            padded = f" {word} "
+            for n in range(low, high + 1):
+                for start in range(len(padded) - n + 1):
+                    features.append(crc32(padded[start : start + n].encode()) & self._mask)
+        return features
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Матрица ``len(texts) × dim``; пустой текст даёт нулевой вектор."""
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = np.fromiter(self.features(text), dtype=np.int64)
+            if not features.size:
+                continue
+            features, counts = np.unique(features, return_counts=True)
+            weights = self._sign[features] * (1 + np.log(counts)).astype(np.float32)[:, None]
+            out[row] = np.bincount(self._index[features].ravel(), weights=weights.ravel(), minlength=self.dim)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return out / norms
+
+
+@lru_cache
+def get_embedder() -> HashingEmbedder:
+    return HashingEmbedder(settings.product_embedding_dim, seed=settings.embedding_seed)
+
+
+async def embed_texts(texts: list[str]) -> list[list[float]]:
+    """Эмбеддинги в пуле потоков, чтобы не занимать event loop."""
+    return await asyncio.to_thread(lambda: get_embedder().embed(texts).tolist())
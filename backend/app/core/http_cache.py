@@ -0,0 +1,104 @@
+"""Условные GET для каталога: слабые ETag и Last-Modified по версии каталога.
+
+Версия — счётчик в Redis на раздел каталога (``categories``, ``brands``,
+``products``), который увеличивается при каждой записи в раздел. Проверка
+``If-None-Match``/``If-Modified-Since`` выполняется в зависимости до запроса
+к БД и сериализации, поэтому ответ 304 ничего не стоит, кроме HMGET.
+"""
+
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from secrets import token_hex
+
+from fastapi import HTTPException, Request, Response, status
+
+from app.core.config import settings
+from app.db.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_KEY = "catalog:versions"
+
+
+@dataclass(frozen=True)
+class Validators:
+    etag: str | None
+    last_modified: datetime | None
+    cache_control: str
+
+    @property
+    def headers(self) -> dict[str, str]:
+        headers = {"Cache-Control": self.cache_control}
+        if self.etag:
+            headers["ETag"] = self.etag
+        if self.last_modified:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        return headers
+
+    def not_modified(self, request: Request) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            # Для GET сравнение слабое: W/ не учитывается.
+            if self.etag is None:
+                return False
+            candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in candidates or self.etag.removeprefix("W/") in candidates
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since and self.last_modified:
+            try:
+                return self.last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+async def bump_catalog_version(*sections: str) -> None:
+    try:
+        client = get_redis()
+        now = str(int(datetime.now(timezone.utc).timestamp()))
+        async with client.pipeline(transaction=True) as pipe:
+            # epoch отличает версии после потери данных Redis: счётчик начнётся с 1 заново.
+            pipe.hsetnx(VERSIONS_KEY, "epoch", token_hex(4))
+            for section in sections:
+                pipe.hincrby(VERSIONS_KEY, section, 1)
+                pipe.hset(VERSIONS_KEY, f"{section}:at", now)
+            await pipe.execute()
+    except Exception as exc:  # pragma: no cover - redis optional
+        logger.warning("catalog version bump failed sections=%s error=%s", sections, exc)
+
+
+async def get_validators(section: str, policy: str) -> Validators:
+    cache_control = settings.cache_control_policies.get(policy, settings.cache_control_default)
+    try:
+        epoch, version, modified_at = await get_redis().hmget(
+            VERSIONS_KEY, "epoch", section, f"{section}:at"
+        )
+    except Exception as exc:  # pragma: no cover - redis optional
+        logger.warning("catalog version read failed section=%s error=%s", section, exc)
+        return Validators(None, None, cache_control)
+    if epoch is None:
+        # Раздел ещё ни разу не менялся с момента очистки Redis: заводим версию.
+        await bump_catalog_version(section)
+        return Validators(None, None, cache_control)
+    last_modified = datetime.fromtimestamp(int(modified_at), timezone.utc) if modified_at else None
+    return Validators(f'W/"{epoch}.{version or 0}"', last_modified, cache_control)
+
+
+def conditional_get(section: str, policy: str) -> Callable[[Request, Response], Awaitable[Validators]]:
+    """Зависимость: отвечает 304 по валидаторам раздела или выставляет их в ответ.
+
+    Эндпоинты, возвращающие готовый ``Response``, переносят заголовки сами
+    через ``Validators.headers``.
+    """
+
+    async def dependency(request: Request, response: Response) -> Validators:
+        validators = await get_validators(section, policy)
+        if validators.not_modified(request):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=validators.headers)
+        response.headers.update(validators.headers)
+        return validators
+
+    return dependency
@@ -0,0 +1,164 @@
+"""Загруженные изображения товаров: потоковая запись на диск и WebP-варианты.
+
+Тело запроса пишется в ``MEDIA_ROOT/tmp`` по частям, без буферизации в
+памяти, и переносится в ``originals/`` под именем по sha256 содержимого.
+Уменьшенные варианты (``IMAGE_VARIANT_WIDTHS``, WebP) строит Pillow в пуле
+процессов: декодирование и ресайз занимают CPU и держали бы event loop.
+Варианты лежат в ``variants/<IMAGE_VARIANTS_VERSION>/``, так что пересчёт с
+новыми размерами не перезаписывает файлы, на которые ссылаются закэшированные
+страницы. Карточкам в списках достаётся ``card_url`` — наименьший вариант
+не уже ``IMAGE_CARD_WIDTH``.
+"""
+
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import anyio
+from fastapi import HTTPException, Request, status
+
+from app.core.config import settings
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"}
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def media_path(storage_key: str) -> Path:
+    return Path(settings.media_root) / storage_key
+
+
+def media_url(storage_key: str) -> str:
+    return f"{settings.media_url_prefix.rstrip('/')}/{storage_key}"
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: fork скопировал бы в дочерний процесс event loop и потоки воркера.
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.image_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def save_upload(request: Request, content_type: str) -> str:
+    """Пишет тело запроса в хранилище и возвращает storage_key оригинала."""
+    extension = CONTENT_TYPES.get(content_type)
+    if extension is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported image type")
+    limit = settings.image_max_upload_bytes
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > limit:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image is too large")
+
+    tmp_dir = anyio.Path(settings.media_root) / "tmp"
+    await tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = tmp_dir / uuid.uuid4().hex
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as file:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > limit:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image is too large"
+                    )
+                digest.update(chunk)
+                await file.write(chunk)
+        if not size:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty body")
+        name = digest.hexdigest()
+        storage_key = f"originals/{name[:2]}/{name}{extension}"
+        target = anyio.Path(media_path(storage_key))
+        await target.parent.mkdir(parents=True, exist_ok=True)
+        await tmp_path.replace(target)
+    except BaseException:
+        await tmp_path.unlink(missing_ok=True)
+        raise
+    return storage_key
+
+
+def build_variants(
+    source: str, dest_dir: str, stem: str, widths: list[int], quality: int
+) -> tuple[int, int, list[tuple[int, int, str]]]:
+    """Выполняется в процессе пула: размеры оригинала и (ширина, высота, имя файла) вариантов.
+
+    Ширины больше оригинала сводятся к ширине оригинала, изображение не увеличивается.
+    """
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or "A" in image.getbands() else "RGB")
+        width, height = image.size
+        os.makedirs(dest_dir, exist_ok=True)
+        variants = []
+        for target in sorted({min(target, width) for target in widths}):
+            target_height = max(1, round(height * target / width))
+            resized = image if target == width else image.resize((target, target_height), Image.Resampling.LANCZOS)
+            name = f"{stem}-{target}.webp"
+            resized.save(os.path.join(dest_dir, name), "WEBP", quality=quality, method=4)
+            variants.append((target, target_height, name))
+    return width, height, variants
+
+
+async def generate_variants(storage_key: str) -> dict[str, Any]:
+    """Строит варианты оригинала; возвращает поля ``ProductImage``.
+
+    ValueError — файл не читается как изображение.
+    """
+    if Image is None:
+        raise RuntimeError("Pillow is not installed")
+    version = settings.image_variants_version
+    stem = Path(storage_key).stem
+    relative_dir = f"variants/{version}/{stem[:2]}"
+    loop = asyncio.get_running_loop()
+    try:
+        width, height, built = await loop.run_in_executor(
+            _get_pool(),
+            build_variants,
+            str(media_path(storage_key)),
+            str(media_path(relative_dir)),
+            stem,
+            settings.image_variant_widths,
+            settings.image_webp_quality,
+        )
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        raise ValueError(f"invalid image {storage_key}: {exc}") from exc
+    variants = [
+        {"width": variant_width, "height": variant_height, "url": media_url(f"{relative_dir}/{name}")}
+        for variant_width, variant_height, name in built
+    ]
+    suitable = [variant for variant in variants if variant["width"] >= settings.image_card_width]
+    return {
+        "width": width,
+        "height": height,
+        "variants": variants,
+        "card_url": (suitable[0] if suitable else variants[-1])["url"],
+        "variants_version": version,
+    }
+
+
+async def remove_original(storage_key: str) -> None:
+    await anyio.Path(media_path(storage_key)).unlink(missing_ok=True)
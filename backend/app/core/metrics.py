@@ -0,0 +1,268 @@
+"""Метрики в формате Prometheus text exposition 0.0.4.
+
+Каждый воркер копит значения в обычных словарях: весь код приложения
+выполняется в одном потоке event loop, поэтому блокировки не нужны. При
+нескольких воркерах uvicorn (``METRICS_MULTIPROC_DIR``) каждый процесс
+периодически сбрасывает снимок в ``<dir>/<pid>.json``, а ``/metrics``
+складывает снимки всех процессов. Счётчики и гистограммы умерших воркеров
+сохраняются, gauge — только живых. Файлы пишутся и читаются в пуле потоков
+(``flush``, ``render_async``), а снимок процесса — копия, снятая в event loop.
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import math
+import os
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+LabelKey = tuple[str, ...]
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[LabelKey, Any] = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict[str, Any]) -> LabelKey:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "values": [[list(key), value] for key, value in self._values.items()],
+        }
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        collect: Callable[[], dict[LabelKey, float]] | None = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._collect = collect
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        self._values[self._key(labels)] = value
+
+    def snapshot(self) -> dict[str, Any]:
+        if self._collect is not None:
+            try:
+                self._values = dict(self._collect())
+            except Exception as exc:
+                logger.warning("gauge collect failed name=%s error=%s", self.name, exc)
+        return super().snapshot()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # [счётчики по бакетам (не кумулятивные) + +Inf, сумма, количество]
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        state[0][index] += 1
+        state[1] += value
+        state[2] += 1
+
+    def totals(self, **labels: Any) -> tuple[int, float]:
+        """Количество наблюдений и их сумма (в этом процессе)."""
+        state = self._values.get(self._key(labels))
+        return (state[2], state[1]) if state else (0, 0.0)
+
+    def snapshot(self) -> dict[str, Any]:
+        data = super().snapshot()
+        data["buckets"] = list(self.buckets)
+        return data
+
+
+REGISTRY: list[Metric] = []
+
+
+def _merge(target: dict[str, Any], source: dict[str, Any], include_gauges: bool) -> None:
+    for name, metric in source.items():
+        if metric["kind"] == "gauge" and not include_gauges:
+            continue
+        merged = target.setdefault(name, {**metric, "values": {}})
+        for key, value in metric["values"]:
+            key = tuple(key)
+            current = merged["values"].get(key)
+            if current is None:
+                merged["values"][key] = copy.deepcopy(value)
+            elif metric["kind"] == "histogram":
+                current[0] = [a + b for a, b in zip(current[0], value[0])]
+                current[1] += value[1]
+                current[2] += value[2]
+            else:
+                merged["values"][key] = current + value
+
+
+def _local_snapshot() -> dict[str, Any]:
+    return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def write_snapshot(directory: str, snapshot: dict[str, Any] | None = None) -> None:
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    tmp = path / f".{os.getpid()}.json.tmp"
+    tmp.write_text(json.dumps(_local_snapshot() if snapshot is None else snapshot))
+    tmp.replace(path / f"{os.getpid()}.json")
+
+
+async def flush(directory: str) -> None:
+    snapshot = copy.deepcopy(_local_snapshot())
+    await asyncio.to_thread(write_snapshot, directory, snapshot)
+
+
+def collect(directory: str | None = None, snapshot: dict[str, Any] | None = None) -> dict[str, Any]:
+    merged: dict[str, Any] = {}
+    if not directory:
+        _merge(merged, _local_snapshot(), include_gauges=True)
+        return merged
+    write_snapshot(directory, snapshot)
+    for file in Path(directory).glob("*.json"):
+        try:
+            snapshot = json.loads(file.read_text())
+        except (OSError, ValueError) as exc:
+            logger.warning("metrics snapshot unreadable file=%s error=%s", file, exc)
+            continue
+        _merge(merged, snapshot, include_gauges=_pid_alive(int(file.stem)))
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def render(directory: str | None = None, snapshot: dict[str, Any] | None = None) -> str:
+    lines: list[str] = []
+    for name, metric in sorted(collect(directory, snapshot).items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        labelnames = metric["labelnames"]
+        for key, value in sorted(metric["values"].items()):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip([*metric["buckets"], math.inf], counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{name}_bucket{_format_labels(labelnames, key, le)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labelnames, key)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+async def render_async(directory: str | None = None) -> str:
+    if not directory:
+        return render()
+    return await asyncio.to_thread(render, directory, copy.deepcopy(_local_snapshot()))
+
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status", ("method", "route", "status")
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template and status",
+    ("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being processed")
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache operations by result", ("op", "result"))
+CACHE_WRITTEN_BYTES = Counter(
+    "cache_written_bytes_total",
+    "Bytes written to the cache by key namespace: payload before the codec (raw) and stored in Redis (stored)",
+    ("namespace", "kind"),
+)
+CACHE_WRITTEN_ENTRIES = Counter("cache_written_entries_total", "Cache entries written by key namespace", ("namespace",))
+RATE_LIMIT_DECISIONS = Counter(
+    "rate_limit_decisions_total", "Rate limit decisions by route class", ("route_class", "result", "backend")
+)
+REDIS_LATENCY = Histogram(
+    "redis_command_duration_seconds",
+    "Redis command latency",
+    ("command",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the DB pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
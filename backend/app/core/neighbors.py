@@ -0,0 +1,169 @@
+"""Похожие товары: top-K ближайших по name_embedding в таблице product_neighbors.
+
+Полный пересчёт (``rebuild_all``, команда ``rebuild_neighbors``) загружает
+векторы в numpy и считает близости блоками матричного умножения. После
+изменения вектора, активности или категории товара его id попадает в
+множество ``neighbors:dirty``; периодическая задача пересчитывает запросами
+pgvector его список и списки, которых изменение может коснуться: тех, где он
+уже был, и его новых соседей. Товар, ставший близким кому-то ещё, попадёт
+в его список при следующем полном пересчёте. Пересчёты идут под одним замком
+в Redis.
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Iterable
+
+import numpy as np
+from sqlalchemy.engine import Row
+
+from app.core.cache import invalidate_prefix, invalidate_tags
+from app.core.config import settings
+from app.core.http_cache import bump_catalog_version
+from app.db.redis import get_redis, redis_lock
+from app.db.repositories import ProductNeighborRepository, ProductRepository
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+DIRTY_KEY = "neighbors:dirty"
+LOCK_KEY = "neighbors:refresh:lock"
+LOCK_TTL_SECONDS = 300
+REBUILD_LOCK_TTL_SECONDS = 3 * 3600
+NO_CATEGORY = -1
+
+
+def similar_tags(product_ids: Iterable[int]) -> list[str]:
+    return [f"similar:{product_id}" for product_id in product_ids]
+
+
+async def mark_dirty(product_ids: Iterable[int]) -> None:
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    try:
+        await get_redis().sadd(DIRTY_KEY, *product_ids)
+    except Exception as exc:  # pragma: no cover - redis optional
+        logger.warning("neighbors mark dirty failed ids=%s error=%s", product_ids, exc)
+
+
+def top_neighbors(
+    matrix: np.ndarray, ids: np.ndarray, categories: np.ndarray, start: int, stop: int, k: int, same_category: bool
+) -> list[list[tuple[int, float]]]:
+    """Списки для строк ``start:stop``; строки matrix нормированы по L2."""
+    scores = matrix[start:stop] @ matrix.T
+    rows = np.arange(stop - start)
+    scores[rows, rows + start] = -np.inf
+    if same_category:
+        scores[categories[start:stop, None] != categories[None, :]] = -np.inf
+    k = min(k, matrix.shape[0] - 1)
+    if k <= 0:
+        return [[] for _ in rows]
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    return [
+        [(int(ids[column]), float(score)) for column, score in zip(columns, row_scores) if np.isfinite(score)]
+        for columns, row_scores in zip(top, top_scores)
+    ]
+
+
+async def _rebuild(chunk_size: int) -> int:
+    start_time = time.perf_counter()
+    async with SessionLocal() as db:
+        rows = await ProductRepository(db).list_embeddings()
+    if rows:
+        ids = np.array([row.id for row in rows], dtype=np.int64)
+        categories = np.array([row.category_id or NO_CATEGORY for row in rows], dtype=np.int64)
+        matrix = np.stack([np.asarray(row.name_embedding, dtype=np.float32) for row in rows])
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        matrix /= norms
+        for start in range(0, len(rows), chunk_size):
+            stop = min(start + chunk_size, len(rows))
+            lists = await asyncio.to_thread(
+                top_neighbors,
+                matrix,
+                ids,
+                categories,
+                start,
+                stop,
+                settings.neighbors_k,
+                settings.neighbors_same_category,
+            )
+            async with SessionLocal() as db:
+                await ProductNeighborRepository(db).replace(dict(zip(ids[start:stop].tolist(), lists)))
+                await db.commit()
+    async with SessionLocal() as db:
+        await ProductNeighborRepository(db).prune()
+        await db.commit()
+    await invalidate_prefix("catalog:product:")
+    await bump_catalog_version("products")
+    logger.info("product neighbors rebuilt products=%s %.2fs", len(rows), time.perf_counter() - start_time)
+    return len(rows)
+
+
+async def rebuild_all(chunk_size: int | None = None) -> int:
+    """Пересчитывает списки всех товаров под тем же замком, что и ``refresh_dirty``.
+
+    Ждёт, пока фоновая задача отпустит замок.
+    """
+    while True:
+        async with redis_lock(LOCK_KEY, REBUILD_LOCK_TTL_SECONDS) as acquired:
+            if acquired:
+                return await _rebuild(chunk_size or settings.neighbors_chunk_size)
+        await asyncio.sleep(1)
+
+
+async def _nearest(repo: ProductRepository, row: Row) -> list[tuple[int, float]]:
+    category_id = row.category_id if settings.neighbors_same_category else None
+    nearest = await repo.nearest(row.id, row.name_embedding, settings.neighbors_k, category_id)
+    return [(item.id, float(item.score)) for item in nearest]
+
+
+async def _refresh(product_ids: list[int]) -> list[int]:
+    async with SessionLocal() as db:
+        products = ProductRepository(db)
+        if settings.neighbors_ef_search:
+            # HNSW отбирает ef_search кандидатов до фильтров по активности и категории.
+            await products.set_ef_search(settings.neighbors_ef_search)
+        neighbors = ProductNeighborRepository(db)
+        owners = set(await neighbors.referencing(product_ids))
+        lists: dict[int, list[tuple[int, float]]] = {product_id: [] for product_id in product_ids}
+        for row in await products.list_embeddings(product_ids):
+            lists[row.id] = await _nearest(products, row)
+            owners.update(neighbor_id for neighbor_id, _ in lists[row.id])
+        others = owners - lists.keys()
+        lists.update({product_id: [] for product_id in others})
+        for row in await products.list_embeddings(list(others)):
+            lists[row.id] = await _nearest(products, row)
+        await neighbors.replace(lists)
+        await db.commit()
+    return list(lists)
+
+
+async def refresh_dirty() -> None:
+    """Периодическая задача: пересчёт списков для изменившихся товаров.
+
+    Один воркер за раз: списки пересекаются, и параллельные DELETE + INSERT
+    одних и тех же строк упирались бы в первичный ключ.
+    """
+    client = get_redis()
+    async with redis_lock(LOCK_KEY, LOCK_TTL_SECONDS) as acquired:
+        if not acquired:
+            return
+        popped = await client.spop(DIRTY_KEY, settings.neighbors_refresh_batch_size)
+        product_ids = [int(product_id) for product_id in popped]
+        if not product_ids:
+            return
+        try:
+            touched = await _refresh(product_ids)
+        except Exception:
+            await client.sadd(DIRTY_KEY, *product_ids)
+            raise
+    await invalidate_tags(similar_tags(touched))
+    await bump_catalog_version("products")
+    logger.info("product neighbors refreshed changed=%s lists=%s", len(product_ids), len(touched))
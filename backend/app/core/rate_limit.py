@@ -0,0 +1,201 @@
+"""Ограничение частоты запросов: token bucket в Redis (атомарно, Lua).
+
+Корзина заводится на класс маршрута и клиента: известный API-ключ
+(``X-API-Key``), пользователь из Bearer-токена или cookie сессии, иначе IP.
+Параметры классов —
+``RATE_LIMIT_POLICIES``: ``rate`` (токенов в секунду), ``burst`` (ёмкость),
+``cost`` (цена запроса) и ``miss_cost`` (доплата за промах кэша, см.
+``charge_miss``). Если Redis недоступен, решения принимает корзина в памяти
+процесса — лимит тогда действует на каждый воркер отдельно.
+"""
+
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request, status
+
+from app.core.config import settings
+from app.core.metrics import RATE_LIMIT_DECISIONS
+from app.core.security import decode_access_token
+from app.core.sessions import get_session_store
+from app.db.redis import lua_script
+
+logger = logging.getLogger(__name__)
+
+API_KEY_HEADER = "X-API-Key"
+ROUTE_CLASSES = {
+    ("GET", "/api/products/search"): "search",
+    ("POST", "/api/products/search/vector"): "vector_search",
+    ("GET", "/api/products/search/semantic"): "semantic_search",
+    ("POST", "/api/auth/login"): "auth",
+    ("POST", "/api/auth/register"): "auth",
+}
+LOCAL_BUCKETS_MAX = 10_000
+
+# KEYS[1] — корзина; ARGV: rate, burst, cost. Время берётся у Redis, чтобы
+# воркеры с разными часами видели одну корзину одинаково.
+_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    remaining: float
+    limit: float
+    rate: float
+    cost: float
+
+    @property
+    def headers(self) -> dict[str, str]:
+        window = math.ceil(self.limit / self.rate)
+        headers = {
+            "RateLimit-Limit": str(int(self.limit)),
+            "RateLimit-Remaining": str(max(int(self.remaining), 0)),
+            "RateLimit-Reset": str(math.ceil((self.limit - self.remaining) / self.rate)),
+            "RateLimit-Policy": f"{int(self.limit)};w={window}",
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(math.ceil((self.cost - self.remaining) / self.rate), 1))
+        return headers
+
+
+class LocalBuckets:
+    """Корзины в памяти процесса на время недоступности Redis (LRU по клиентам)."""
+
+    def __init__(self, max_size: int = LOCAL_BUCKETS_MAX) -> None:
+        self.max_size = max_size
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: float, cost: float) -> tuple[bool, float]:
+        now = time.monotonic()
+        tokens, ts = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - ts) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_size:
+            self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+_local = LocalBuckets()
+_redis_down_logged_at = 0.0
+
+
+def _log_redis_down(message: str, exc: Exception) -> None:
+    """Предупреждение о недоступном Redis — не чаще раза в минуту на процесс."""
+    global _redis_down_logged_at
+    if time.monotonic() - _redis_down_logged_at > 60:
+        _redis_down_logged_at = time.monotonic()
+        logger.warning("%s error=%s", message, exc)
+
+
+def classify(method: str, path: str) -> str | None:
+    """Класс маршрута; None — запрос не ограничивается."""
+    route_class = ROUTE_CLASSES.get((method, path))
+    if route_class:
+        return route_class
+    if path.startswith("/api/") and method != "OPTIONS":
+        return "default"
+    return None
+
+
+async def client_identity(request: Request) -> tuple[str, float]:
+    """Идентификатор клиента и множитель его квоты (один раз на запрос)."""
+    identity = getattr(request.state, "rate_limit_identity", None)
+    if identity is None:
+        identity = request.state.rate_limit_identity = await _resolve_identity(request)
+    return identity
+
+
+async def _resolve_identity(request: Request) -> tuple[str, float]:
+    api_key = request.headers.get(API_KEY_HEADER)
+    if api_key and api_key in settings.rate_limit_api_keys:
+        # В Redis попадает хэш, а не сам ключ.
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16], settings.rate_limit_api_keys[api_key]
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        payload = decode_access_token(auth_header.split(" ", 1)[1].strip())
+        if payload and "sub" in payload:
+            return f"user:{payload['sub']}", 1.0
+    session_token = request.cookies.get(settings.session_cookie_name)
+    if session_token:
+        # Только существующая сессия: выдуманные cookie не дают новых корзин в обход IP.
+        try:
+            user_id = await get_session_store().get_user_id(session_token)
+        except Exception as exc:  # pragma: no cover - redis optional
+            _log_redis_down("rate limit session lookup failed", exc)
+            user_id = None
+        if user_id is not None:
+            return f"user:{user_id}", 1.0
+    return f"ip:{_client_ip(request)}", 1.0
+
+
+def _client_ip(request: Request) -> str:
+    hops = settings.rate_limit_trusted_proxy_hops
+    if hops:
+        # Каждый доверенный прокси дописывает адрес справа; левее — то, что прислал клиент.
+        forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+        if len(forwarded) >= hops:
+            return forwarded[-hops]
+    return request.client.host if request.client else "unknown"
+
+
+async def _take(key: str, rate: float, burst: float, cost: float) -> tuple[bool, float, str]:
+    try:
+        allowed, tokens = await lua_script(_BUCKET_SCRIPT)(keys=[key], args=[rate, burst, cost])
+        return bool(allowed), float(tokens), "redis"
+    except Exception as exc:  # pragma: no cover - redis optional
+        _log_redis_down("rate limit falls back to local buckets", exc)
+        allowed, tokens = _local.take(key, rate, burst, cost)
+        return allowed, tokens, "local"
+
+
+async def acquire(request: Request, route_class: str, cost: float | None = None) -> Decision:
+    policy = settings.rate_limit_policies.get(route_class) or settings.rate_limit_policies["default"]
+    identity, multiplier = await client_identity(request)
+    rate = policy["rate"] * multiplier
+    burst = policy["burst"] * multiplier
+    cost = policy.get("cost", 1) if cost is None else cost
+    allowed, tokens, backend = await _take(f"ratelimit:{route_class}:{identity}", rate, burst, cost)
+    RATE_LIMIT_DECISIONS.inc(route_class=route_class, result="allowed" if allowed else "limited", backend=backend)
+    if not allowed:
+        logger.info("rate limited class=%s client=%s", route_class, identity)
+    return Decision(allowed, tokens, burst, rate, cost)
+
+
+async def charge_miss(request: Request, route_class: str) -> None:
+    """Доплата за запрос, не попавший в кэш; 429, если токенов не хватает."""
+    policy = settings.rate_limit_policies.get(route_class, {})
+    miss_cost = policy.get("miss_cost", 0)
+    if not settings.rate_limit_enabled or not miss_cost:
+        return
+    decision = await acquire(request, route_class, miss_cost)
+    request.state.rate_limit = decision
+    if not decision.allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many requests", headers=decision.headers
+        )
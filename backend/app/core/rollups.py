@@ -0,0 +1,24 @@
+"""Перенос журнала изменений заказов (``order_rollup_events``) в агрегаты продаж."""
+
+import logging
+
+from app.core.config import settings
+from app.db.repositories import AnalyticsRepository
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+async def fold_events() -> None:
+    """Периодическая задача: переносит журнал пачками, пока он не опустеет."""
+    batch_size = settings.rollups_fold_batch_size
+    total = 0
+    while True:
+        async with SessionLocal() as db:
+            folded = await AnalyticsRepository(db).fold_events(batch_size)
+            await db.commit()
+        total += folded
+        if folded < batch_size:
+            break
+    if total:
+        logger.info("sales rollups folded events=%s", total)
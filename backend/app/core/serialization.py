@@ -0,0 +1,46 @@
+"""Быстрая сериализация товаров: ORM → JSON-байты без промежуточных dict.
+
+Адаптеры собираются один раз при импорте; ``dump_json`` pydantic-core сам
+кодирует Decimal и datetime. Готовые байты кладутся в кэш и отдаются
+клиенту как есть — без повторной валидации по response_model.
+"""
+
+from collections.abc import Iterable
+from typing import Any
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from app.db.models import Product
+from app.schemas.catalog import ProductDetailRead, ProductRead, ProductSimilarRead
+
+PRODUCT_ADAPTER = TypeAdapter(ProductRead)
+PRODUCT_LIST_ADAPTER = TypeAdapter(list[ProductRead])
+PRODUCT_DETAIL_ADAPTER = TypeAdapter(ProductDetailRead)
+
+
+def dump_product(product: Product) -> bytes:
+    return PRODUCT_ADAPTER.dump_json(PRODUCT_ADAPTER.validate_python(product, from_attributes=True))
+
+
+def dump_product_detail(product: Product, similar: Iterable[Any]) -> bytes:
+    """Карточка товара со списком похожих (строки ``ProductNeighborRepository.similar``)."""
+    detail = PRODUCT_DETAIL_ADAPTER.validate_python(product, from_attributes=True)
+    detail.similar = [ProductSimilarRead.model_validate(row) for row in similar]
+    return PRODUCT_DETAIL_ADAPTER.dump_json(detail)
+
+
+def dump_products(products: Iterable[Product]) -> bytes:
+    return PRODUCT_LIST_ADAPTER.dump_json(
+        PRODUCT_LIST_ADAPTER.validate_python(list(products), from_attributes=True)
+    )
+
+
+def json_response(
+    payload: bytes, headers: dict[str, str] | None = None, encoding: str | None = None
+) -> Response:
+    response = Response(content=payload, headers=headers, media_type="application/json")
+    response.headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,161 @@
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+
+from app.core.config import settings
+from app.db.redis import get_redis
+from app.db.repositories import SessionRepository
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY_PREFIX = "session:token:"
+USER_INDEX_PREFIX = "session:user:"
+# The db backend extends a sliding session at most this often.
+DB_TOUCH_INTERVAL_SECONDS = 60
+
+# GET + EXPIRE of the session and of the per-user index in one round trip.
+_TOUCH_SCRIPT = """
+local user_id = redis.call('GET', KEYS[1])
+if user_id then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+    redis.call('EXPIRE', ARGV[2] .. user_id, ARGV[1], 'GT')
+end
+return user_id
+"""
+
+# Removes every session of a user and the index itself atomically.
+_DROP_USER_SCRIPT = """
+local tokens = redis.call('SMEMBERS', KEYS[1])
+for _, token in ipairs(tokens) do
+    redis.call('DEL', ARGV[1] .. token)
+end
+redis.call('DEL', KEYS[1])
+return #tokens
+"""
+
+
+def _to_naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _ttl_seconds(expires_at: datetime) -> int:
+    expires_at = _to_naive_utc(expires_at)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return int((expires_at - now).total_seconds())
+
+
+class SessionStore(ABC):
+    @abstractmethod
+    async def create(self, token: str, user_id: int, expires_at: datetime) -> None: ...
+
+    @abstractmethod
+    async def get_user_id(self, token: str) -> int | None: ...
+
+    @abstractmethod
+    async def delete(self, token: str) -> None: ...
+
+    @abstractmethod
+    async def delete_user(self, user_id: int) -> int: ...
+
+
+class RedisSessionStore(SessionStore):
+    def __init__(self, sliding: bool = False, ttl_seconds: int | None = None) -> None:
+        self.sliding = sliding
+        self.ttl_seconds = ttl_seconds or settings.session_exp_hours * 3600
+        self._touch = None
+        self._drop_user = None
+
+    def _scripts(self):
+        if self._touch is None:
+            client = get_redis()
+            self._touch = client.register_script(_TOUCH_SCRIPT)
+            self._drop_user = client.register_script(_DROP_USER_SCRIPT)
+        return self._touch, self._drop_user
+
+    async def create(self, token: str, user_id: int, expires_at: datetime) -> None:
+        ttl = _ttl_seconds(expires_at)
+        if ttl <= 0:
+            return
+        index_key = f"{USER_INDEX_PREFIX}{user_id}"
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.set(f"{SESSION_KEY_PREFIX}{token}", user_id, ex=ttl)
+            pipe.sadd(index_key, token)
+            pipe.expire(index_key, ttl, gt=True)
+            pipe.expire(index_key, ttl, nx=True)
+            await pipe.execute()
+
+    async def get_user_id(self, token: str) -> int | None:
+        key = f"{SESSION_KEY_PREFIX}{token}"
+        if self.sliding:
+            touch, _ = self._scripts()
+            user_id = await touch(keys=[key], args=[self.ttl_seconds, USER_INDEX_PREFIX])
+        else:
+            user_id = await get_redis().get(key)
+        return int(user_id) if user_id is not None else None
+
+    async def delete(self, token: str) -> None:
+        client = get_redis()
+        user_id = await client.getdel(f"{SESSION_KEY_PREFIX}{token}")
+        if user_id is not None:
+            await client.srem(f"{USER_INDEX_PREFIX}{user_id}", token)
+
+    async def delete_user(self, user_id: int) -> int:
+        _, drop_user = self._scripts()
+        return int(await drop_user(keys=[f"{USER_INDEX_PREFIX}{user_id}"], args=[SESSION_KEY_PREFIX]))
+
+
+class DatabaseSessionStore(SessionStore):
+    def __init__(self, sliding: bool = False, ttl_seconds: int | None = None) -> None:
+        self.sliding = sliding
+        self.ttl_seconds = ttl_seconds or settings.session_exp_hours * 3600
+
+    async def create(self, token: str, user_id: int, expires_at: datetime) -> None:
+        async with SessionLocal() as db:
+            await SessionRepository(db).create(
+                {"user_id": user_id, "token": token, "expires_at": _to_naive_utc(expires_at)}
+            )
+
+    async def get_user_id(self, token: str) -> int | None:
+        async with SessionLocal() as db:
+            repo = SessionRepository(db)
+            session = await repo.get_by_token(token)
+            if not session or _ttl_seconds(session.expires_at) <= 0:
+                return None
+            if self.sliding:
+                now = _to_naive_utc(datetime.now(timezone.utc))
+                expires_at = now + timedelta(seconds=self.ttl_seconds)
+                touch_before = expires_at - timedelta(seconds=DB_TOUCH_INTERVAL_SECONDS)
+                if _to_naive_utc(session.expires_at) < touch_before:
+                    await repo.extend(token, expires_at, touch_before)
+        return session.user_id
+
+    async def delete(self, token: str) -> None:
+        async with SessionLocal() as db:
+            await SessionRepository(db).delete_by_token(token)
+
+    async def delete_user(self, user_id: int) -> int:
+        async with SessionLocal() as db:
+            return await SessionRepository(db).delete_by_user(user_id)
+
+    async def purge_expired(self) -> int:
+        async with SessionLocal() as db:
+            return await SessionRepository(db).delete_expired(_to_naive_utc(datetime.now(timezone.utc)))
+
+
+_session_store: SessionStore | None = None
+
+
+def get_session_store() -> SessionStore:
+    global _session_store
+    if _session_store is None:
+        if settings.session_backend == "redis":
+            _session_store = RedisSessionStore(sliding=settings.session_sliding_expiration)
+        elif settings.session_backend == "db":
+            _session_store = DatabaseSessionStore(sliding=settings.session_sliding_expiration)
+        else:
+            raise RuntimeError(f"Unknown session backend: {settings.session_backend}")
+        logger.info("session store backend=%s", settings.session_backend)
+    return _session_store
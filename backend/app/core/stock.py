@@ -0,0 +1,322 @@
+"""Hot-режим остатков для товаров распродаж: счётчики в Redis вместо строки products.
+
+Пока товар в hot-режиме (``products.hot_stock``, множество ``stock:hot``),
+доступный остаток живёт в хэше ``stock:available``. Оформление заказа
+резервирует его Lua-скриптом: проверка и списание всех позиций атомарны,
+так что продать больше остатка нельзя, а строка товара в Postgres не
+блокируется. Резерв (``stock:reservation:<token>``, срок — в
+``stock:reservations``) после commit заказа подтверждается, и проданное
+копится в ``stock:pending``; периодическая задача вычитает его из
+``products.stock`` одним UPDATE. Пачку переносит один воркер (замок
+``stock:reconcile:lock``), а её id записывается в ``stock_reconcile_batches``
+в транзакции UPDATE: повтор пачки после сбоя или истёкшего замка её не
+вычтет второй раз. Резервы, которые не подтвердили вовремя
+(воркер упал между резервом и commit), задача ``expire_reservations``
+подтверждает, если заказ есть в БД, иначе возвращает в остаток.
+
+Выключение переносит остаток из Redis в ``products.stock`` целиком; дельты,
+посчитанные до этого, для такого товара уже не применяются. Включение и
+выключение ждут тот же замок и сначала переносят накопленные пачки: иначе
+пачка, взятая до выключения, после повторного включения вычлась бы из уже
+перенесённого остатка второй раз.
+"""
+
+import asyncio
+import logging
+import uuid
+from collections.abc import AsyncIterator, Iterable
+from contextlib import asynccontextmanager
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.catalog_cache import ProductChange, product_changed, products_changed
+from app.core.config import settings
+from app.db.models import Order
+from app.db.redis import get_redis, lua_script, redis_lock
+from app.db.repositories import ProductRepository
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+HOT_KEY = "stock:hot"
+AVAILABLE_KEY = "stock:available"
+PENDING_KEY = "stock:pending"
+PROCESSING_KEY = "stock:pending:processing"
+BATCH_KEY = "stock:pending:batch"
+LOCK_KEY = "stock:reconcile:lock"
+LOCK_TTL_SECONDS = 60
+RESERVATIONS_KEY = "stock:reservations"
+RESERVATION_PREFIX = "stock:reservation:"
+
+# KEYS: hot, available, reservations, reservation; ARGV: ttl, order_id, (product_id, quantity)...
+# Ответ: {1} — зарезервировано, {0, id} — не хватает остатка, {-1, id} — товар не в hot-режиме.
+_RESERVE_SCRIPT = """
+for i = 3, #ARGV, 2 do
+    if redis.call('SISMEMBER', KEYS[1], ARGV[i]) == 0 then
+        return {-1, ARGV[i]}
+    end
+    local available = tonumber(redis.call('HGET', KEYS[2], ARGV[i]) or '0')
+    if available < tonumber(ARGV[i + 1]) then
+        return {0, ARGV[i]}
+    end
+end
+for i = 3, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[2], ARGV[i], -tonumber(ARGV[i + 1]))
+    redis.call('HSET', KEYS[4], ARGV[i], ARGV[i + 1])
+end
+redis.call('HSET', KEYS[4], 'order', ARGV[2])
+local clock = redis.call('TIME')
+redis.call('ZADD', KEYS[3], tonumber(clock[1]) + tonumber(ARGV[1]), KEYS[4])
+return {1}
+"""
+
+# KEYS: hot, available, pending, reservations, reservation; ARGV[1]: '1' — подтвердить, '0' — вернуть.
+# ZREM решает, кто завершает резерв: повторное подтверждение или возврат ничего не делают.
+_FINISH_SCRIPT = """
+if redis.call('ZREM', KEYS[4], KEYS[5]) == 0 then
+    return 0
+end
+local items = redis.call('HGETALL', KEYS[5])
+for i = 1, #items, 2 do
+    local product_id, quantity = items[i], tonumber(items[i + 1])
+    if product_id ~= 'order' then
+        local hot = redis.call('SISMEMBER', KEYS[1], product_id) == 1
+        if ARGV[1] == '1' then
+            if hot then
+                redis.call('HINCRBY', KEYS[3], product_id, quantity)
+            end
+        elseif hot then
+            redis.call('HINCRBY', KEYS[2], product_id, quantity)
+        else
+            -- Товар уже вышел из hot-режима: возврат идёт сразу в products.stock.
+            redis.call('HINCRBY', KEYS[3], product_id, -quantity)
+        end
+    end
+end
+redis.call('DEL', KEYS[5])
+return 1
+"""
+
+# KEYS: pending, processing, batch; ARGV[1]: id новой пачки. Ответ: {id, HGETALL пачки}.
+# Незавершённая прошлая пачка отдаётся повторно со своим id.
+_TAKE_PENDING_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return {}
+    end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+    redis.call('SET', KEYS[3], ARGV[1])
+elseif redis.call('EXISTS', KEYS[3]) == 0 then
+    redis.call('SET', KEYS[3], ARGV[1])
+end
+return {redis.call('GET', KEYS[3]), redis.call('HGETALL', KEYS[2])}
+"""
+
+# KEYS: processing, batch; ARGV[1]: id пачки. Удаляет пачку, только если её ещё не сменила следующая.
+_DONE_PENDING_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+return redis.call('DEL', KEYS[1], KEYS[2])
+"""
+
+# KEYS: hot, available, pending; ARGV[1]: product_id. Возвращает остаток в Redis или -1.
+_DISABLE_SCRIPT = """
+if redis.call('SREM', KEYS[1], ARGV[1]) == 0 then
+    return -1
+end
+local available = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+return available
+"""
+
+# KEYS: hot, available; ARGV: product_id, delta. Правка остатка админом, пока товар в hot-режиме.
+_ADJUST_SCRIPT = """
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('HINCRBY', KEYS[2], ARGV[1], ARGV[2])
+return 1
+"""
+
+
+class StockUnavailable(Exception):
+    """Redis недоступен, а в заказе есть товары в hot-режиме."""
+
+
+async def hot_ids(product_ids: Iterable[int]) -> set[int]:
+    """Товары в hot-режиме; без Redis — пусто (для них не сработает и списание в БД)."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return set()
+    try:
+        flags = await get_redis().smismember(HOT_KEY, product_ids)
+    except Exception as exc:  # pragma: no cover - redis optional
+        logger.warning("hot stock lookup failed error=%s", exc)
+        return set()
+    return {product_id for product_id, flag in zip(product_ids, flags) if flag}
+
+
+async def reserve(order_id: int, lines: dict[int, int]) -> str | None:
+    """Резервирует все позиции разом; None — какой-то не хватает."""
+    reservation = f"{RESERVATION_PREFIX}{uuid.uuid4().hex}"
+    args: list = [settings.stock_reservation_ttl_seconds, order_id]
+    for product_id, quantity in sorted(lines.items()):
+        args.extend((product_id, quantity))
+    try:
+        result = await lua_script(_RESERVE_SCRIPT)(
+            keys=[HOT_KEY, AVAILABLE_KEY, RESERVATIONS_KEY, reservation], args=args
+        )
+    except Exception as exc:
+        raise StockUnavailable(str(exc)) from exc
+    if int(result[0]) != 1:
+        logger.info("hot stock reservation refused order_id=%s product_id=%s code=%s", order_id, result[1], result[0])
+        return None
+    return reservation
+
+
+async def _finish(reservation: str, confirm: bool) -> bool:
+    done = await lua_script(_FINISH_SCRIPT)(
+        keys=[HOT_KEY, AVAILABLE_KEY, PENDING_KEY, RESERVATIONS_KEY, reservation], args=[1 if confirm else 0]
+    )
+    return bool(done)
+
+
+async def confirm(reservation: str) -> None:
+    try:
+        await _finish(reservation, confirm=True)
+    except Exception as exc:  # pragma: no cover - redis optional
+        # Не страшно: expire_reservations найдёт заказ в БД и подтвердит резерв сам.
+        logger.warning("hot stock confirm failed reservation=%s error=%s", reservation, exc)
+
+
+async def release(reservation: str) -> None:
+    try:
+        await _finish(reservation, confirm=False)
+    except Exception as exc:  # pragma: no cover - redis optional
+        logger.warning("hot stock release failed reservation=%s error=%s", reservation, exc)
+
+
+async def enable(db: AsyncSession, product_id: int) -> int | None:
+    """Переводит товар в hot-режим; возвращает перенесённый остаток (None — товара нет).
+
+    UPDATE держит строку до commit: заказы, уже списывающие остаток в БД,
+    успевают до снимка, а следующие видят hot_stock и идут в Redis.
+    """
+    async with _reconcile_lock():
+        await _drain()
+        stock = await ProductRepository(db).set_hot_stock(product_id, True)
+        if stock is None:
+            return None
+        client = get_redis()
+        if not await client.sismember(HOT_KEY, product_id):
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.hset(AVAILABLE_KEY, product_id, stock)
+                pipe.sadd(HOT_KEY, product_id)
+                await pipe.execute()
+        else:
+            stock = int(await client.hget(AVAILABLE_KEY, product_id) or 0)
+        await db.commit()
+    logger.info("hot stock enabled product_id=%s available=%s", product_id, stock)
+    return stock
+
+
+async def disable(db: AsyncSession, product_id: int) -> int | None:
+    """Возвращает товар к остатку в БД; возвращает перенесённый остаток."""
+    async with _reconcile_lock():
+        await _drain()
+        available = int(
+            await lua_script(_DISABLE_SCRIPT)(keys=[HOT_KEY, AVAILABLE_KEY, PENDING_KEY], args=[product_id])
+        )
+        stock = await ProductRepository(db).set_hot_stock(product_id, False, None if available < 0 else available)
+        await db.commit()
+    if stock is not None:
+        await product_changed(ProductChange(product_id, "updated", frozenset({"stock"})))
+        logger.info("hot stock disabled product_id=%s stock=%s", product_id, stock)
+    return stock
+
+
+async def adjust(product_id: int, delta: int) -> None:
+    """Переносит изменение products.stock на остаток в Redis, если товар в hot-режиме."""
+    if not delta:
+        return
+    await lua_script(_ADJUST_SCRIPT)(keys=[HOT_KEY, AVAILABLE_KEY], args=[product_id, delta])
+
+
+async def available_stock(product_id: int) -> int | None:
+    value = await get_redis().hget(AVAILABLE_KEY, product_id)
+    return None if value is None else int(value)
+
+
+@asynccontextmanager
+async def _reconcile_lock() -> AsyncIterator[None]:
+    """Замок переноса пачек; ждёт, пока его отпустит другой воркер."""
+    while True:
+        async with redis_lock(LOCK_KEY, LOCK_TTL_SECONDS) as acquired:
+            if acquired:
+                yield
+                return
+        await asyncio.sleep(0.05)
+
+
+async def _apply_batch() -> bool:
+    """Переносит одну пачку в products.stock; False — переносить нечего. Вызывается под замком."""
+    taken = await lua_script(_TAKE_PENDING_SCRIPT)(
+        keys=[PENDING_KEY, PROCESSING_KEY, BATCH_KEY], args=[uuid.uuid4().hex]
+    )
+    if not taken:
+        return False
+    batch_id, raw = taken
+    deltas = {int(raw[i]): int(raw[i + 1]) for i in range(0, len(raw), 2)}
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    updated: list[int] = []
+    if deltas:
+        async with SessionLocal() as db:
+            repo = ProductRepository(db)
+            if await repo.record_stock_batch(batch_id):
+                updated = await repo.apply_stock_deltas(deltas)
+            else:
+                logger.warning("hot stock batch already applied batch=%s", batch_id)
+            await db.commit()
+    # Пачка удаляется только после commit: при сбое её повторит следующий запуск.
+    await lua_script(_DONE_PENDING_SCRIPT)(keys=[PROCESSING_KEY, BATCH_KEY], args=[batch_id])
+    if updated:
+        await products_changed([ProductChange(product_id, "updated", frozenset({"stock"})) for product_id in updated])
+        logger.info("hot stock reconciled products=%s", len(updated))
+    return True
+
+
+async def _drain() -> None:
+    # Незавершённая пачка, затем накопленное к этому моменту. Подтверждённое
+    # позже остаётся в stock:pending: выключение удаляет оттуда товар, а до
+    # включения через Redis его не продают.
+    if await _apply_batch():
+        await _apply_batch()
+
+
+async def reconcile() -> None:
+    """Периодическая задача: переносит проданное через Redis в products.stock."""
+    async with redis_lock(LOCK_KEY, LOCK_TTL_SECONDS) as acquired:
+        if acquired:
+            await _apply_batch()
+
+
+async def expire_reservations() -> None:
+    """Периодическая задача: завершает резервы, не подтверждённые за STOCK_RESERVATION_TTL_SECONDS."""
+    client = get_redis()
+    now, _ = await client.time()
+    expired = await client.zrangebyscore(RESERVATIONS_KEY, "-inf", now, start=0, num=100)
+    if not expired:
+        return
+    async with client.pipeline(transaction=False) as pipe:
+        for reservation in expired:
+            pipe.hget(reservation, "order")
+        order_ids = {reservation: int(order_id or 0) for reservation, order_id in zip(expired, await pipe.execute())}
+    async with SessionLocal() as db:
+        result = await db.execute(select(Order.id).where(Order.id.in_(set(order_ids.values()))))
+        committed = set(result.scalars().all())
+    for reservation, order_id in order_ids.items():
+        await _finish(reservation, confirm=order_id in committed)
+    logger.info("hot stock reservations expired=%s confirmed=%s", len(expired), len(committed))
@@ -6,9 +6,13 @@ from app.db.models import (
     Category,
     Order,
     OrderItem,
+    OrderStatusCount,
     Product,
     ProductImage,
+    ProductSales,
     ProductSpec,
+    SalesDaily,
+    SalesDailySegment,
     User,
     UserSession,
 )
@@ -26,5 +30,9 @@ __all__ = [
     "CartItem",
     "Order",
     "OrderItem",
+    "SalesDaily",
+    "SalesDailySegment",
+    "ProductSales",
+    "OrderStatusCount",
 ]
 
@@ -0,0 +1,119 @@
+"""Учёт SQL-запросов на уровне движка.
+
+Слушатели ``before_cursor_execute``/``after_cursor_execute`` считают
+запросы и время в БД для текущего HTTP-запроса (через contextvar), пишут
+в лог медленные запросы и повторяющиеся «формы» запросов (признак N+1).
+``query_budget`` — помощник для тестов: падает, если код внутри блока
+выполнил больше запросов, чем разрешено.
+"""
+
+import logging
+import re
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![$\w])\d+(?:\.\d+)?\b")
+_PARAM = r"\s*(?:\$\d+|%\(\w+\)s|\?|:\w+)(?:::[\w ]+(?:\[\])?)?\s*"
+_PLACEHOLDER_LIST = re.compile(rf"\((?:{_PARAM},)+{_PARAM}\)")
+
+
+def normalize_sql(statement: str) -> str:
+    """Приводит запрос к «форме»: без литералов и с одинаковыми списками IN."""
+    shape = _STRING.sub("?", statement)
+    shape = _PLACEHOLDER_LIST.sub("(...)", shape)
+    shape = _NUMBER.sub("?", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    duration: float = 0.0
+    shapes: Counter[str] = field(default_factory=Counter)
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.shapes[normalize_sql(statement)] += 1
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.duration * 1000:.2f};desc="{self.count} queries"'
+
+
+_current: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+_budgets: list[QueryStats] = []
+_slow_query_seconds = 0.0
+
+
+def start_request() -> QueryStats:
+    """Начинает учёт для текущего контекста (вызывается из middleware)."""
+    stats = QueryStats()
+    _current.set(stats)
+    return stats
+
+
+def current_stats() -> QueryStats | None:
+    return _current.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    duration = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, duration)
+    for budget in _budgets:
+        budget.record(statement, duration)
+    if _slow_query_seconds and duration >= _slow_query_seconds:
+        logger.warning("slow query %.1fms: %s", duration * 1000, normalize_sql(statement))
+
+
+def _handle_error(exception_context) -> None:
+    # after_cursor_execute не вызывается при ошибке: снимаем отметку старта.
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def instrument_engine(engine: AsyncEngine, slow_query_ms: int) -> None:
+    global _slow_query_seconds
+    _slow_query_seconds = slow_query_ms / 1000
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+@contextmanager
+def query_budget(max_queries: int) -> Iterator[QueryStats]:
+    """Падает с AssertionError, если внутри блока выполнено больше max_queries запросов.
+
+    Считаются все запросы движка, включая выполненные TestClient в другом
+    потоке, поэтому блоки не должны пересекаться с чужой нагрузкой.
+    """
+    stats = QueryStats()
+    _budgets.append(stats)
+    try:
+        yield stats
+    finally:
+        _budgets.remove(stats)
+    if stats.count > max_queries:
+        details = "\n".join(f"  {count}x {shape}" for shape, count in stats.shapes.most_common())
+        raise AssertionError(f"expected at most {max_queries} queries, got {stats.count}:\n{details}")
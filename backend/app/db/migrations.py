@@ -0,0 +1,206 @@
+"""Упорядоченные SQL-миграции для уже существующих баз.
+
+``Base.metadata.create_all`` создаёт новые таблицы и индексы, но не меняет
+существующие. Всё, что нужно довести на старых базах (индексы, дедупликация
+данных, новые колонки), добавляется сюда новой версией в конец списка.
+"""
+
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_LOCK_ID = 7_202_601
+
+MIGRATIONS: list[tuple[int, str, list[str]]] = [
+    (
+        1,
+        "unique cart line per product",
+        [
+            """
+            WITH dup AS (
+                SELECT min(id) AS keep_id, sum(quantity) AS quantity
+                FROM cart_items
+                GROUP BY cart_id, product_id
+                HAVING count(*) > 1
+            )
+            UPDATE cart_items SET quantity = dup.quantity FROM dup WHERE cart_items.id = dup.keep_id
+            """,
+            """
+            DELETE FROM cart_items USING cart_items AS other
+            WHERE cart_items.cart_id = other.cart_id
+              AND cart_items.product_id = other.product_id
+              AND cart_items.id > other.id
+            """,
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_cart_items_cart_product ON cart_items (cart_id, product_id)",
+        ],
+    ),
+    (
+        2,
+        "order history keyset index",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_orders_user_created_at ON orders (user_id, created_at DESC, id DESC)",
+        ],
+    ),
+    (
+        3,
+        "products missing name embedding",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_products_missing_embedding ON products (id) WHERE name_embedding IS NULL",
+        ],
+    ),
+    (
+        4,
+        "product neighbors",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS product_neighbors (
+                product_id integer NOT NULL REFERENCES products (id) ON DELETE CASCADE,
+                rank smallint NOT NULL,
+                neighbor_id integer NOT NULL REFERENCES products (id) ON DELETE CASCADE,
+                score real NOT NULL,
+                PRIMARY KEY (product_id, rank)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_product_neighbors_neighbor_id ON product_neighbors (neighbor_id)",
+        ],
+    ),
+    (
+        5,
+        "co-purchase counts and recommendations",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS product_pair_counts (
+                product_id integer NOT NULL,
+                other_id integer NOT NULL,
+                orders_count integer NOT NULL DEFAULT 0,
+                PRIMARY KEY (product_id, other_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS product_recommendations (
+                product_id integer NOT NULL,
+                rank smallint NOT NULL,
+                other_id integer NOT NULL,
+                score real NOT NULL,
+                PRIMARY KEY (product_id, rank)
+            )
+            """,
+        ],
+    ),
+    (
+        6,
+        "uploaded product images with variants",
+        [
+            """
+            ALTER TABLE product_images
+                ADD COLUMN IF NOT EXISTS storage_key varchar(300),
+                ADD COLUMN IF NOT EXISTS width integer,
+                ADD COLUMN IF NOT EXISTS height integer,
+                ADD COLUMN IF NOT EXISTS variants jsonb NOT NULL DEFAULT '[]'::jsonb,
+                ADD COLUMN IF NOT EXISTS card_url varchar(500),
+                ADD COLUMN IF NOT EXISTS variants_version smallint NOT NULL DEFAULT 0
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_product_images_stale_variants
+            ON product_images (variants_version, id) WHERE storage_key IS NOT NULL
+            """,
+        ],
+    ),
+    (
+        7,
+        "hot stock mode",
+        [
+            "ALTER TABLE products ADD COLUMN IF NOT EXISTS hot_stock boolean NOT NULL DEFAULT false",
+        ],
+    ),
+    (
+        8,
+        "sales rollup event log",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS order_rollup_events (
+                id bigserial PRIMARY KEY,
+                order_id integer NOT NULL,
+                sign smallint NOT NULL,
+                old_status varchar(50),
+                new_status varchar(50) NOT NULL
+            )
+            """,
+        ],
+    ),
+    (
+        9,
+        "hnsw index on product name embeddings",
+        [
+            """
+            CREATE INDEX IF NOT EXISTS ix_products_name_embedding_hnsw
+            ON products USING hnsw (name_embedding vector_cosine_ops)
+            """,
+        ],
+    ),
+    (
+        10,
+        "co-purchase event log",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS copurchase_events (
+                id bigserial PRIMARY KEY,
+                order_id integer NOT NULL,
+                sign smallint NOT NULL
+            )
+            """,
+        ],
+    ),
+    (
+        11,
+        "applied hot stock batches",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS stock_reconcile_batches (
+                batch_id varchar(32) PRIMARY KEY,
+                applied_at timestamp NOT NULL DEFAULT now()
+            )
+            """,
+        ],
+    ),
+]
+
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def schema_version(conn: AsyncConnection) -> int | None:
+    """Последняя применённая версия; None, если схема ещё не создавалась."""
+    if await conn.scalar(text("SELECT to_regclass('schema_migrations')")) is None:
+        return None
+    return await conn.scalar(text("SELECT max(version) FROM schema_migrations"))
+
+
+async def apply_migrations(conn: AsyncConnection) -> None:
+    await conn.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": MIGRATIONS_LOCK_ID})
+    await conn.execute(
+        text(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(200) NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+            """
+        )
+    )
+    result = await conn.execute(text("SELECT version FROM schema_migrations"))
+    applied = set(result.scalars().all())
+    for version, name, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        for statement in statements:
+            await conn.execute(text(statement))
+        await conn.execute(
+            text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+            {"version": version, "name": name},
+        )
+        logger.info("migration applied version=%s name=%s", version, name)
@@ -1,5 +1,23 @@
+from app.db.models.analytics import (
+    CopurchaseEvent,
+    OrderRollupEvent,
+    OrderStatusCount,
+    ProductPairCount,
+    ProductRecommendation,
+    ProductSales,
+    SalesDaily,
+    SalesDailySegment,
+)
 from app.db.models.cart import Cart, CartItem
-from app.db.models.catalog import Brand, Category, Product, ProductImage, ProductSpec
+from app.db.models.catalog import (
+    Brand,
+    Category,
+    Product,
+    ProductImage,
+    ProductNeighbor,
+    ProductSpec,
+    StockReconcileBatch,
+)
 from app.db.models.order import Order, OrderItem
 from app.db.models.session import UserSession
 from app.db.models.user import User
@@ -12,9 +30,19 @@ __all__ = [
     "Product",
     "ProductImage",
     "ProductSpec",
+    "ProductNeighbor",
+    "StockReconcileBatch",
     "Cart",
     "CartItem",
     "Order",
     "OrderItem",
+    "SalesDaily",
+    "SalesDailySegment",
+    "ProductSales",
+    "OrderStatusCount",
+    "OrderRollupEvent",
+    "ProductPairCount",
+    "CopurchaseEvent",
+    "ProductRecommendation",
 ]
 
@@ -0,0 +1,94 @@
+from datetime import date
+
+from sqlalchemy import REAL, BigInteger, Date, Index, Integer, Numeric, SmallInteger, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class SalesDaily(Base):
+    __tablename__ = "sales_daily"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    orders_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    units: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    revenue: Mapped[float] = mapped_column(Numeric(14, 2), default=0, nullable=False)
+
+
+class SalesDailySegment(Base):
+    """Дневная выручка в разрезе категории и бренда (0 — не указано)."""
+
+    __tablename__ = "sales_daily_segments"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    category_id: Mapped[int] = mapped_column(Integer, primary_key=True, default=0)
+    brand_id: Mapped[int] = mapped_column(Integer, primary_key=True, default=0)
+    units: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    revenue: Mapped[float] = mapped_column(Numeric(14, 2), default=0, nullable=False)
+
+
+class ProductSales(Base):
+    __tablename__ = "product_sales"
+
+    product_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    orders_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    units_sold: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    revenue: Mapped[float] = mapped_column(Numeric(14, 2), default=0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_product_sales_units_sold", units_sold.desc()),
+        Index("ix_product_sales_revenue", revenue.desc()),
+    )
+
+
+class OrderStatusCount(Base):
+    __tablename__ = "order_status_counts"
+
+    status: Mapped[str] = mapped_column(String(50), primary_key=True)
+    orders_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class OrderRollupEvent(Base):
+    """Изменение заказа, ещё не перенесённое в агрегаты продаж.
+
+    sign: +1 — заказ начал учитываться, -1 — перестал, 0 — только смена статуса.
+    """
+
+    __tablename__ = "order_rollup_events"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    order_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    sign: Mapped[int] = mapped_column(SmallInteger, nullable=False)
+    old_status: Mapped[str | None] = mapped_column(String(50))
+    new_status: Mapped[str] = mapped_column(String(50), nullable=False)
+
+
+class ProductPairCount(Base):
+    """Число заказов, где оба товара куплены вместе (хранится в обе стороны)."""
+
+    __tablename__ = "product_pair_counts"
+
+    product_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    other_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    orders_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class CopurchaseEvent(Base):
+    """Заказ, который нужно добавить в счётчики пар (sign=1) или вычесть из них (sign=-1)."""
+
+    __tablename__ = "copurchase_events"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    order_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    sign: Mapped[int] = mapped_column(SmallInteger, nullable=False)
+
+
+class ProductRecommendation(Base):
+    """Top-K «покупают вместе» по счётчикам пар, пересчитывается в фоне."""
+
+    __tablename__ = "product_recommendations"
+
+    product_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    rank: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    other_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    score: Mapped[float] = mapped_column(REAL, nullable=False)
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import DateTime, ForeignKey, Integer, Numeric, String
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, Numeric, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.base import Base
@@ -28,6 +28,8 @@ class CartItem(Base):
     quantity: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
     price_snapshot: Mapped[float] = mapped_column(Numeric(12, 2), nullable=False)
 
+    __table_args__ = (Index("uq_cart_items_cart_product", "cart_id", "product_id", unique=True),)
+
     cart = relationship("Cart", back_populates="items")
     product = relationship("Product")
 
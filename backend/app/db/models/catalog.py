@@ -1,8 +1,21 @@
 from datetime import datetime
 
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import Boolean, Computed, DateTime, ForeignKey, Index, Integer, Numeric, String, Text
-from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy import (
+    REAL,
+    Boolean,
+    Computed,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    Numeric,
+    SmallInteger,
+    String,
+    Text,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.core.config import settings
@@ -41,9 +54,11 @@ class Product(Base):
     price: Mapped[float] = mapped_column(Numeric(12, 2), nullable=False)
     currency: Mapped[str] = mapped_column(String(10), default="RUB", nullable=False)
     stock: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # Остаток ведётся в Redis (app.core.stock), stock догоняет его пачками.
+    hot_stock: Mapped[bool] = mapped_column(Boolean, default=False, server_default=text("false"), nullable=False)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
-    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     brand_id: Mapped[int | None] = mapped_column(ForeignKey("brands.id"))
     category_id: Mapped[int | None] = mapped_column(ForeignKey("categories.id"))
@@ -63,7 +78,16 @@ class Product(Base):
         nullable=False,
     )
 
-    __table_args__ = (Index("ix_products_tsv", "tsv", postgresql_using="gin"),)
+    __table_args__ = (
+        Index("ix_products_tsv", "tsv", postgresql_using="gin"),
+        Index("ix_products_missing_embedding", "id", postgresql_where=text("name_embedding IS NULL")),
+        Index(
+            "ix_products_name_embedding_hnsw",
+            "name_embedding",
+            postgresql_using="hnsw",
+            postgresql_ops={"name_embedding": "vector_cosine_ops"},
+        ),
+    )
 
     brand = relationship("Brand", back_populates="products")
     category = relationship("Category", back_populates="products")
@@ -79,9 +103,27 @@ class ProductImage(Base):
     url: Mapped[str] = mapped_column(String(500), nullable=False)
     is_main: Mapped[bool] = mapped_column(Boolean, default=False)
     sort_order: Mapped[int] = mapped_column(Integer, default=0)
+    # Загруженные файлы: путь оригинала в MEDIA_ROOT, размеры и WebP-варианты
+    # [{"width", "height", "url"}] по возрастанию ширины. У внешних URL пусто.
+    storage_key: Mapped[str | None] = mapped_column(String(300))
+    width: Mapped[int | None] = mapped_column(Integer)
+    height: Mapped[int | None] = mapped_column(Integer)
+    variants: Mapped[list[dict]] = mapped_column(JSONB, default=list, server_default=text("'[]'::jsonb"))
+    # Наименьший вариант не уже IMAGE_CARD_WIDTH — для карточек в списках.
+    card_url: Mapped[str | None] = mapped_column(String(500))
+    variants_version: Mapped[int] = mapped_column(SmallInteger, default=0, server_default=text("0"))
 
     product = relationship("Product", back_populates="images")
 
+    __table_args__ = (
+        Index(
+            "ix_product_images_stale_variants",
+            "variants_version",
+            "id",
+            postgresql_where=text("storage_key IS NOT NULL"),
+        ),
+    )
+
 
 class ProductSpec(Base):
     __tablename__ = "product_specs"
@@ -92,3 +134,27 @@ class ProductSpec(Base):
     value: Mapped[str] = mapped_column(String(500), nullable=False)
 
     product = relationship("Product", back_populates="specs")
+
+
+class StockReconcileBatch(Base):
+    """Пачка проданного через Redis, уже вычтенная из products.stock (``app.core.stock.reconcile``)."""
+
+    __tablename__ = "stock_reconcile_batches"
+
+    batch_id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    applied_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, server_default=text("now()"), nullable=False
+    )
+
+
+class ProductNeighbor(Base):
+    """Предрасчитанные похожие товары: top-K по косинусной близости name_embedding."""
+
+    __tablename__ = "product_neighbors"
+
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    rank: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    neighbor_id: Mapped[int] = mapped_column(
+        ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    score: Mapped[float] = mapped_column(REAL, nullable=False)
@@ -1,13 +1,86 @@
+import time
+import uuid
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from redis.asyncio import Redis
+from redis.commands.core import AsyncScript
 
 from app.core.config import settings
+from app.core.metrics import REDIS_LATENCY
+
+
+class InstrumentedRedis(Redis):
+    """Клиент Redis, который пишет латентность команд в метрики."""
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_LATENCY.observe(time.perf_counter() - start, command=str(args[0]).upper())
 
 
 _redis_client: Redis | None = None
+_redis_bytes_client: Redis | None = None
+_scripts: dict[tuple[bool, str], AsyncScript] = {}
+
+# Снимает замок, только если он всё ещё наш: после истечения TTL его мог взять другой воркер.
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
 
 
 def get_redis() -> Redis:
     global _redis_client
     if _redis_client is None:
-        _redis_client = Redis.from_url(settings.redis_url, decode_responses=True)
+        _redis_client = InstrumentedRedis.from_url(settings.redis_url, decode_responses=True)
     return _redis_client
+
+
+def get_redis_bytes() -> Redis:
+    """Клиент без decode_responses — для готовых JSON-байтов в кэше."""
+    global _redis_bytes_client
+    if _redis_bytes_client is None:
+        _redis_bytes_client = InstrumentedRedis.from_url(settings.redis_url)
+    return _redis_bytes_client
+
+
+def lua_script(source: str, binary: bool = False) -> AsyncScript:
+    """Lua-скрипт на клиенте ``get_redis`` (``binary`` — ``get_redis_bytes``).
+
+    Регистрируется один раз на процесс; дальше EVALSHA по готовому sha.
+    """
+    key = (binary, source)
+    script = _scripts.get(key)
+    if script is None:
+        client = get_redis_bytes() if binary else get_redis()
+        script = _scripts[key] = client.register_script(source)
+    return script
+
+
+@asynccontextmanager
+async def redis_lock(key: str, ttl_seconds: int) -> AsyncIterator[bool]:
+    """NX-замок на время блока; внутри False — замок держит другой воркер.
+
+    TTL страхует от упавшего держателя, поэтому блок должен в него укладываться.
+    """
+    token = uuid.uuid4().hex
+    acquired = bool(await get_redis().set(key, token, nx=True, ex=ttl_seconds))
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            await lua_script(_RELEASE_LOCK_SCRIPT)(keys=[key], args=[token])
+
+
+async def close_redis() -> None:
+    global _redis_client, _redis_bytes_client
+    for client in (_redis_client, _redis_bytes_client):
+        if client is not None:
+            await client.aclose()
+    _redis_client = _redis_bytes_client = None
+    _scripts.clear()
@@ -0,0 +1,136 @@
+"""Чтение с реплик Postgres.
+
+``get_read_db`` по очереди раздаёт сессии реплик из ``DATABASE_REPLICA_URLS``.
+Реплика, к которой не удалось подключиться или которая отстала сильнее
+``DB_REPLICA_MAX_LAG_SECONDS``, исключается на ``DB_REPLICA_EJECT_SECONDS``;
+если здоровых реплик нет, чтение идёт с primary. Реплика выбирается при
+первом запросе сессии к БД: ответы из кэша и 304 соединение не занимают.
+После успешного изменяющего запроса клиент получает cookie, и его чтения
+``DB_READ_YOUR_WRITES_SECONDS`` секунд идут с primary.
+"""
+
+import logging
+import time
+
+from fastapi import Request, Response
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal, create_engine, engine as primary_engine
+
+logger = logging.getLogger(__name__)
+
+READ_PIN_COOKIE = "take_smart_primary"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# POST-эндпоинты, которые ничего не меняют: после них закреплять чтение не нужно.
+READ_ONLY_PATHS = {"/api/products/search/vector"}
+
+
+# Время с последней применённой транзакции растёт и на догнавшей реплике, если
+# на primary нет записей; всё полученное уже применено — значит, отставания нет.
+_LAG_QUERY = """
+SELECT CASE
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+class ReplicaSet:
+    def __init__(self, urls: list[str]) -> None:
+        self.engines: list[AsyncEngine] = [create_engine(url) for url in urls]
+        self._ejected_until = [0.0] * len(self.engines)
+        self._next = 0
+
+    def choose(self) -> int | None:
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            index = self._next
+            self._next = (self._next + 1) % len(self.engines)
+            if self._ejected_until[index] <= now:
+                return index
+        return None
+
+    def eject(self, index: int, reason: object) -> None:
+        if self._ejected_until[index] <= time.monotonic():
+            logger.warning("replica ejected index=%s reason=%s", index, reason)
+        self._ejected_until[index] = time.monotonic() + settings.db_replica_eject_seconds
+
+    async def check(self) -> None:
+        """Проверяет доступность и отставание реплик (периодическая задача)."""
+        for index, engine in enumerate(self.engines):
+            try:
+                async with engine.connect() as conn:
+                    lag = await conn.scalar(text(_LAG_QUERY))
+            except (DBAPIError, OSError) as exc:
+                self.eject(index, exc)
+                continue
+            if settings.db_replica_max_lag_seconds and lag > settings.db_replica_max_lag_seconds:
+                self.eject(index, f"lag {lag:.1f}s")
+
+
+replicas = ReplicaSet(settings.database_replica_urls)
+
+
+def is_write_request(request: Request) -> bool:
+    return request.method in WRITE_METHODS and request.url.path not in READ_ONLY_PATHS
+
+
+def pin_reads_to_primary(response: Response) -> None:
+    response.set_cookie(
+        READ_PIN_COOKIE,
+        "1",
+        max_age=settings.db_read_your_writes_seconds,
+        httponly=True,
+        secure=settings.session_cookie_secure,
+        samesite=settings.session_cookie_samesite,
+    )
+
+
+def _connect_for_read() -> Connection:
+    # Вызывается из greenlet сессии: синхронный connect() ждёт асинхронный драйвер.
+    while (index := replicas.choose()) is not None:
+        try:
+            return replicas.engines[index].sync_engine.connect()
+        except (DBAPIError, OSError) as exc:
+            replicas.eject(index, exc)
+    return primary_engine.sync_engine.connect()
+
+
+class _ReadSession(Session):
+    """Открывает соединение с репликой (или primary) при первом обращении к БД."""
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.read_connection: Connection | None = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs) -> Connection:
+        if self.read_connection is None:
+            self.read_connection = _connect_for_read()
+        return self.read_connection
+
+
+def _close_read_connection(session: _ReadSession) -> None:
+    if session.read_connection is not None:
+        session.read_connection.close()
+        session.read_connection = None
+
+
+ReadSessionLocal = async_sessionmaker(expire_on_commit=False, class_=AsyncSession, sync_session_class=_ReadSession)
+
+
+async def get_read_db(request: Request):
+    if not replicas.engines or READ_PIN_COOKIE in request.cookies:
+        async with SessionLocal() as db:
+            yield db
+        return
+    db = ReadSessionLocal()
+    try:
+        async with db:
+            yield db
+    finally:
+        await db.run_sync(_close_read_connection)
@@ -1,12 +1,15 @@
+from app.db.repositories.analytics import AnalyticsRepository
 from app.db.repositories.base import BaseRepository
 from app.db.repositories.cart import CartItemRepository, CartRepository
 from app.db.repositories.catalog import (
     BrandRepository,
     CategoryRepository,
     ProductImageRepository,
+    ProductNeighborRepository,
     ProductRepository,
     ProductSpecRepository,
 )
+from app.db.repositories.copurchase import CopurchaseRepository
 from app.db.repositories.order import OrderItemRepository, OrderRepository
 from app.db.repositories.session import SessionRepository
 from app.db.repositories.user import UserRepository
@@ -19,10 +22,13 @@ __all__ = [
     "BrandRepository",
     "ProductRepository",
     "ProductImageRepository",
+    "ProductNeighborRepository",
     "ProductSpecRepository",
     "CartRepository",
     "CartItemRepository",
     "OrderRepository",
     "OrderItemRepository",
+    "AnalyticsRepository",
+    "CopurchaseRepository",
 ]
 
@@ -0,0 +1,256 @@
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import Date, cast, delete, func, literal_column, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.db.models import (
+    Order,
+    OrderItem,
+    OrderRollupEvent,
+    OrderStatusCount,
+    Product,
+    ProductSales,
+    SalesDaily,
+    SalesDailySegment,
+)
+from app.db.repositories.base import BaseRepository
+
+# Заказы в этих статусах не учитываются в выручке и продажах.
+EXCLUDED_STATUSES = ("cancelled",)
+
+ROLLUP_TABLES = "sales_daily, sales_daily_segments, product_sales, order_status_counts"
+FOLD_LOCK_ID = 7_202_602
+
+
+def is_counted(status: str) -> bool:
+    return status not in EXCLUDED_STATUSES
+
+
+class AnalyticsRepository(BaseRepository[SalesDaily]):
+    """Инкрементальные агрегаты продаж.
+
+    Заказ в своей транзакции только дописывает событие в журнал
+    ``order_rollup_events`` (``log_change``, без commit): строки агрегатов
+    общие для всех заказов дня и товара, и upsert в них выстраивал бы
+    оформления в очередь. В агрегаты журнал переносит ``fold_events`` в
+    фоновой задаче, поэтому отчёты отстают на её интервал.
+    """
+
+    model = SalesDaily
+
+    async def _upsert(self, model, keys: list, columns: list[str], source) -> None:
+        stmt = insert(model).from_select(columns, source)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={
+                column: getattr(model, column) + getattr(stmt.excluded, column)
+                for column in columns
+                if column not in {key.key for key in keys}
+            },
+        )
+        await self.session.execute(stmt)
+
+    async def _apply(self, condition: ColumnElement[bool], sign: int) -> None:
+        day = cast(Order.created_at, Date)
+        order_units = (
+            select(func.coalesce(func.sum(OrderItem.quantity), 0))
+            .where(OrderItem.order_id == Order.id)
+            .correlate(Order)
+            .scalar_subquery()
+        )
+        await self._upsert(
+            SalesDaily,
+            [SalesDaily.day],
+            ["day", "orders_count", "units", "revenue"],
+            select(
+                day,
+                func.count(Order.id) * sign,
+                func.sum(order_units) * sign,
+                func.sum(Order.total_amount) * sign,
+            )
+            .where(condition)
+            .group_by(day),
+        )
+
+        category_id = func.coalesce(Product.category_id, literal_column("0"))
+        brand_id = func.coalesce(Product.brand_id, literal_column("0"))
+        line_revenue = OrderItem.quantity * OrderItem.price_snapshot
+        await self._upsert(
+            SalesDailySegment,
+            [SalesDailySegment.day, SalesDailySegment.category_id, SalesDailySegment.brand_id],
+            ["day", "category_id", "brand_id", "units", "revenue"],
+            select(
+                day,
+                category_id,
+                brand_id,
+                func.sum(OrderItem.quantity) * sign,
+                func.sum(line_revenue) * sign,
+            )
+            .select_from(OrderItem)
+            .join(Order, Order.id == OrderItem.order_id)
+            .outerjoin(Product, Product.id == OrderItem.product_id)
+            .where(condition)
+            .group_by(day, category_id, brand_id),
+        )
+
+        await self._upsert(
+            ProductSales,
+            [ProductSales.product_id],
+            ["product_id", "orders_count", "units_sold", "revenue"],
+            select(
+                OrderItem.product_id,
+                func.count(func.distinct(OrderItem.order_id)) * sign,
+                func.sum(OrderItem.quantity) * sign,
+                func.sum(line_revenue) * sign,
+            )
+            .join(Order, Order.id == OrderItem.order_id)
+            .where(condition)
+            .group_by(OrderItem.product_id),
+        )
+
+    async def log_change(self, order_id: int, old_status: str | None, new_status: str) -> None:
+        """Записывает создание заказа (old_status=None) или смену статуса в журнал."""
+        counted_before = old_status is not None and is_counted(old_status)
+        sign = int(is_counted(new_status)) - int(counted_before)
+        await self.session.execute(
+            insert(OrderRollupEvent).values(
+                order_id=order_id, sign=sign, old_status=old_status, new_status=new_status
+            )
+        )
+
+    async def fold_events(self, limit: int) -> int:
+        """Переносит в агрегаты до ``limit`` событий журнала (без commit).
+
+        Возвращает число событий; 0 — журнал пуст или его переносит другой воркер.
+        """
+        if not await self.session.scalar(select(func.pg_try_advisory_xact_lock(FOLD_LOCK_ID))):
+            return 0
+        # Таблицы агрегатов — до строк журнала, в том же порядке, что и rebuild.
+        await self.session.execute(text(f"LOCK TABLE {ROLLUP_TABLES} IN ROW EXCLUSIVE MODE"))
+        batch = select(OrderRollupEvent.id).order_by(OrderRollupEvent.id).limit(limit)
+        result = await self.session.execute(
+            delete(OrderRollupEvent)
+            .where(OrderRollupEvent.id.in_(batch.scalar_subquery()))
+            .returning(
+                OrderRollupEvent.order_id,
+                OrderRollupEvent.sign,
+                OrderRollupEvent.old_status,
+                OrderRollupEvent.new_status,
+            )
+        )
+        events = result.all()
+        signs: Counter[int] = Counter()
+        statuses: Counter[str] = Counter()
+        for order_id, sign, old_status, new_status in events:
+            signs[order_id] += sign
+            statuses[new_status] += 1
+            if old_status is not None:
+                statuses[old_status] -= 1
+        # Создание и отмена заказа в одной пачке взаимно гасятся.
+        orders_by_sign: defaultdict[int, list[int]] = defaultdict(list)
+        for order_id, sign in signs.items():
+            if sign:
+                orders_by_sign[sign].append(order_id)
+        for sign, order_ids in sorted(orders_by_sign.items()):
+            await self._apply(Order.id.in_(order_ids), sign)
+        deltas = {status: delta for status, delta in sorted(statuses.items()) if delta}
+        if deltas:
+            stmt = insert(OrderStatusCount).values(
+                [{"status": status, "orders_count": delta} for status, delta in deltas.items()]
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[OrderStatusCount.status],
+                set_={"orders_count": OrderStatusCount.orders_count + stmt.excluded.orders_count},
+            )
+            await self.session.execute(stmt)
+        return len(events)
+
+    async def rebuild(self) -> None:
+        """Пересчитывает все агрегаты с нуля (в одной транзакции REPEATABLE READ).
+
+        Блокировка агрегатов берётся до снимка и останавливает ``fold_events``.
+        События журнала, видимые в снимке, уже отражены в заказах и удаляются;
+        события заказов, оформленных во время пересчёта, остаются в журнале.
+        Оформление заказов пересчёт не блокирует.
+        """
+        await self.session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        await self.session.execute(text(f"LOCK TABLE {ROLLUP_TABLES} IN EXCLUSIVE MODE"))
+        await self.session.execute(delete(OrderRollupEvent))
+        for model in (SalesDaily, SalesDailySegment, ProductSales, OrderStatusCount):
+            await self.session.execute(delete(model))
+        await self._apply(Order.status.not_in(EXCLUDED_STATUSES), 1)
+        await self.session.execute(
+            insert(OrderStatusCount).from_select(
+                ["status", "orders_count"],
+                select(Order.status, func.count(Order.id)).group_by(Order.status),
+            )
+        )
+        await self.session.commit()
+
+    async def daily(self, date_from: date, date_to: date) -> list[SalesDaily]:
+        result = await self.session.execute(
+            select(SalesDaily)
+            .where(SalesDaily.day >= date_from, SalesDaily.day <= date_to)
+            .order_by(SalesDaily.day)
+        )
+        return result.scalars().all()
+
+    async def summary(self, today: date) -> Row:
+        week_start = today - timedelta(days=6)
+        month_start = today - timedelta(days=29)
+
+        def total(column, since: date | None = None):
+            aggregate = func.sum(column)
+            if since is not None:
+                aggregate = aggregate.filter(SalesDaily.day >= since)
+            return func.coalesce(aggregate, 0)
+
+        result = await self.session.execute(
+            select(
+                total(SalesDaily.orders_count).label("total_orders"),
+                total(SalesDaily.orders_count, today).label("today_orders"),
+                total(SalesDaily.orders_count, week_start).label("week_orders"),
+                total(SalesDaily.orders_count, month_start).label("month_orders"),
+                total(SalesDaily.revenue).label("total_revenue"),
+                total(SalesDaily.revenue, today).label("today_revenue"),
+                total(SalesDaily.revenue, week_start).label("week_revenue"),
+            )
+        )
+        return result.one()
+
+    async def by_segment(self, column: str, date_from: date, date_to: date) -> list[Row]:
+        key = getattr(SalesDailySegment, column)
+        result = await self.session.execute(
+            select(
+                key.label("id"),
+                func.sum(SalesDailySegment.units).label("units"),
+                func.sum(SalesDailySegment.revenue).label("revenue"),
+            )
+            .where(SalesDailySegment.day >= date_from, SalesDailySegment.day <= date_to)
+            .group_by(key)
+            .order_by(func.sum(SalesDailySegment.revenue).desc())
+        )
+        return result.all()
+
+    async def top_products(self, limit: int = 10, by: str = "units_sold") -> list[Row]:
+        order_column = ProductSales.revenue if by == "revenue" else ProductSales.units_sold
+        result = await self.session.execute(
+            select(
+                ProductSales.product_id,
+                Product.name,
+                ProductSales.orders_count,
+                ProductSales.units_sold,
+                ProductSales.revenue,
+            )
+            .outerjoin(Product, Product.id == ProductSales.product_id)
+            .order_by(order_column.desc())
+            .limit(limit)
+        )
+        return result.all()
+
+    async def status_counts(self) -> dict[str, int]:
+        result = await self.session.execute(select(OrderStatusCount.status, OrderStatusCount.orders_count))
+        return {status: count for status, count in result.all()}
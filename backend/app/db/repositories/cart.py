@@ -1,6 +1,13 @@
-from sqlalchemy import select
+from datetime import datetime
+from decimal import Decimal
+from typing import Any
 
-from app.db.models import Cart, CartItem
+from sqlalchemy import Integer, Numeric, and_, delete, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import selectinload
+
+from app.db.models import Cart, CartItem, Product, ProductImage
 from app.db.repositories.base import BaseRepository
 
 
@@ -13,6 +20,88 @@ class CartRepository(BaseRepository[Cart]):
         )
         return result.scalars().first()
 
+    async def get_active_with_items(self, user_id: int) -> Cart | None:
+        result = await self.session.execute(
+            select(Cart)
+            .options(selectinload(Cart.items))
+            .where(Cart.user_id == user_id, Cart.status == "active")
+        )
+        return result.scalars().first()
+
+    async def replace_items(self, user_id: int, items: list[dict[str, Any]], updated_at: datetime) -> Cart:
+        """Приводит позиции корзины к переданному набору в одной транзакции.
+
+        Все позиции пишутся одним multi-row ``INSERT ... ON CONFLICT (cart_id,
+        product_id) DO UPDATE``, лишние удаляются одним ``DELETE``.
+        """
+        cart = await self.get_active_by_user(user_id)
+        if cart is None:
+            cart = Cart(user_id=user_id, status="active")
+            self.session.add(cart)
+            await self.session.flush()
+        cart.updated_at = updated_at
+        product_ids = [item["product_id"] for item in items]
+        await self.session.execute(
+            delete(CartItem).where(CartItem.cart_id == cart.id, CartItem.product_id.not_in(product_ids))
+        )
+        if items:
+            stmt = insert(CartItem).values([{"cart_id": cart.id, **item} for item in items])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[CartItem.cart_id, CartItem.product_id],
+                set_={"quantity": stmt.excluded.quantity, "price_snapshot": stmt.excluded.price_snapshot},
+            )
+            await self.session.execute(stmt)
+        await self.session.commit()
+        return cart
+
+    async def price_lines(self, lines: list[tuple[int, int, Decimal]]) -> list[Row]:
+        """Считает позиции корзины одним запросом.
+
+        Позиции передаются массивами и разворачиваются через ``unnest``; цена,
+        остаток, главное изображение, флаги и итоги считаются на стороне
+        Postgres.
+        """
+        if not lines:
+            return []
+        product_ids, quantities, snapshots = (list(column) for column in zip(*lines))
+        cart_lines = select(
+            func.unnest(literal(product_ids, ARRAY(Integer))).label("product_id"),
+            func.unnest(literal(quantities, ARRAY(Integer))).label("quantity"),
+            func.unnest(literal(snapshots, ARRAY(Numeric(12, 2)))).label("price_snapshot"),
+        ).subquery("cart_lines")
+        image_url = (
+            select(func.coalesce(ProductImage.card_url, ProductImage.url))
+            .where(ProductImage.product_id == Product.id)
+            .order_by(ProductImage.is_main.desc(), ProductImage.sort_order, ProductImage.id)
+            .limit(1)
+            .correlate(Product)
+            .scalar_subquery()
+        )
+        line_total = cart_lines.c.quantity * Product.price
+        result = await self.session.execute(
+            select(
+                cart_lines.c.product_id,
+                cart_lines.c.quantity,
+                cart_lines.c.price_snapshot,
+                Product.id.label("id"),
+                Product.name,
+                Product.slug,
+                Product.price,
+                Product.currency,
+                Product.stock,
+                Product.is_active,
+                image_url.label("image_url"),
+                line_total.label("line_total"),
+                (Product.price != cart_lines.c.price_snapshot).label("price_changed"),
+                and_(Product.is_active.is_(True), Product.stock >= cart_lines.c.quantity).label("in_stock"),
+                func.sum(cart_lines.c.quantity * cart_lines.c.price_snapshot).over().label("subtotal"),
+                func.coalesce(func.sum(line_total).over(), 0).label("total"),
+            )
+            .select_from(cart_lines.outerjoin(Product, Product.id == cart_lines.c.product_id))
+            .order_by(cart_lines.c.product_id)
+        )
+        return result.all()
+
 
 class CartItemRepository(BaseRepository[CartItem]):
     model = CartItem
@@ -1,9 +1,44 @@
-from sqlalchemy import func, select
+from datetime import datetime, timedelta
 
-from app.db.models import Brand, Category, Product, ProductImage, ProductSpec
+from sqlalchemy import Integer, delete, func, literal, or_, select, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import selectinload
+
+from app.db.models import (
+    Brand,
+    Category,
+    Product,
+    ProductImage,
+    ProductNeighbor,
+    ProductSpec,
+    StockReconcileBatch,
+)
 from app.db.repositories.base import BaseRepository
 
 
+def product_card_columns() -> list:
+    """Колонки краткой карточки (``ProductCardRead``) с главным изображением."""
+    image_url = (
+        select(func.coalesce(ProductImage.card_url, ProductImage.url))
+        .where(ProductImage.product_id == Product.id)
+        .order_by(ProductImage.is_main.desc(), ProductImage.sort_order, ProductImage.id)
+        .limit(1)
+        .correlate(Product)
+        .scalar_subquery()
+    )
+    return [
+        Product.id,
+        Product.name,
+        Product.slug,
+        Product.price,
+        Product.currency,
+        Product.stock,
+        Product.is_active,
+        image_url.label("image_url"),
+    ]
+
+
 class CategoryRepository(BaseRepository[Category]):
     model = Category
 
@@ -45,9 +80,136 @@ class ProductRepository(BaseRepository[Product]):
         )
         return result.scalars().all()
 
+    async def take_stock(self, lines: dict[int, int]) -> set[int]:
+        """Списывает остаток товаров не в hot-режиме, если его хватает; возвращает списанные id.
+
+        Строки обновляются по возрастанию id: параллельные заказы не блокируют друг друга по кругу.
+        """
+        taken = set()
+        for product_id in sorted(lines):
+            result = await self.session.execute(
+                update(Product)
+                .where(
+                    Product.id == product_id,
+                    Product.stock >= lines[product_id],
+                    Product.hot_stock.is_(False),
+                )
+                .values(stock=Product.stock - lines[product_id])
+                .returning(Product.id)
+            )
+            if result.scalar_one_or_none() is not None:
+                taken.add(product_id)
+        return taken
+
+    async def set_hot_stock(self, product_id: int, hot: bool, stock: int | None = None) -> int | None:
+        """Включает/выключает hot-режим; возвращает остаток в БД (None — товара нет).
+
+        При выключении ``stock`` — итоговый остаток из Redis.
+        """
+        values: dict = {"hot_stock": hot}
+        if stock is not None:
+            values["stock"] = stock
+        result = await self.session.execute(
+            update(Product).where(Product.id == product_id).values(**values).returning(Product.stock)
+        )
+        return result.scalar_one_or_none()
+
+    async def apply_stock_deltas(self, deltas: dict[int, int]) -> list[int]:
+        """Вычитает из stock проданное через Redis. Товары, вышедшие из hot-режима,
+        пропускаются: их остаток уже перенесён целиком; отрицательные дельты
+        (возвраты после выхода) применяются всегда."""
+        if not deltas:
+            return []
+        changes = select(
+            func.unnest(literal(list(deltas), ARRAY(Integer))).label("product_id"),
+            func.unnest(literal(list(deltas.values()), ARRAY(Integer))).label("delta"),
+        ).subquery("changes")
+        result = await self.session.execute(
+            update(Product)
+            .where(
+                Product.id == changes.c.product_id,
+                or_(Product.hot_stock.is_(True), changes.c.delta < 0),
+            )
+            .values(stock=Product.stock - changes.c.delta)
+            .returning(Product.id)
+        )
+        return list(result.scalars().all())
+
+    async def record_stock_batch(self, batch_id: str) -> bool:
+        """Отмечает пачку дельт применённой; False — её уже применили.
+
+        Отметка ложится в транзакцию UPDATE остатков: параллельная запись той же
+        пачки ждёт commit и получает False. Отметки старше суток удаляются.
+        """
+        await self.session.execute(
+            delete(StockReconcileBatch).where(StockReconcileBatch.applied_at < datetime.utcnow() - timedelta(days=1))
+        )
+        result = await self.session.execute(
+            insert(StockReconcileBatch)
+            .values(batch_id=batch_id)
+            .on_conflict_do_nothing()
+            .returning(StockReconcileBatch.batch_id)
+        )
+        return result.scalar_one_or_none() is not None
+
+    async def claim_missing_embeddings(self, limit: int) -> list[Row]:
+        """(id, name) товаров без эмбеддинга; строки заблокированы до конца транзакции,
+        параллельные воркеры их пропускают."""
+        result = await self.session.execute(
+            select(Product.id, Product.name)
+            .where(Product.name_embedding.is_(None))
+            .order_by(Product.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        return result.all()
+
+    async def list_names_chunk(self, after_id: int, limit: int, missing_only: bool = True) -> list[Row]:
+        query = select(Product.id, Product.name).where(Product.id > after_id)
+        if missing_only:
+            query = query.where(Product.name_embedding.is_(None))
+        result = await self.session.execute(query.order_by(Product.id).limit(limit))
+        return result.all()
+
+    async def set_embeddings(self, embeddings: dict[int, list[float]]) -> None:
+        await self.session.execute(
+            update(Product),
+            [{"id": product_id, "name_embedding": vector} for product_id, vector in embeddings.items()],
+        )
+
+    async def list_embeddings(self, product_ids: list[int] | None = None) -> list[Row]:
+        """(id, category_id, name_embedding) активных товаров с вектором."""
+        query = select(Product.id, Product.category_id, Product.name_embedding).where(
+            Product.is_active.is_(True), Product.name_embedding.is_not(None)
+        )
+        if product_ids is not None:
+            query = query.where(Product.id.in_(product_ids))
+        result = await self.session.execute(query.order_by(Product.id))
+        return result.all()
+
+    async def set_ef_search(self, ef_search: int) -> None:
+        """Ширина поиска HNSW до конца транзакции."""
+        await self.session.execute(select(func.set_config("hnsw.ef_search", str(ef_search), True)))
+
+    async def nearest(
+        self, product_id: int, vector: list[float], limit: int, category_id: int | None = None
+    ) -> list[Row]:
+        """(id, score) ближайших активных товаров, кроме самого товара."""
+        distance = Product.name_embedding.cosine_distance(vector)
+        query = select(Product.id, (1 - distance).label("score")).where(
+            Product.id != product_id, Product.is_active.is_(True), Product.name_embedding.is_not(None)
+        )
+        if category_id is not None:
+            query = query.where(Product.category_id == category_id)
+        result = await self.session.execute(query.order_by(distance).limit(limit))
+        return result.all()
+
     async def search_by_embedding(self, vector: list[float], limit: int = 20) -> list[Product]:
         result = await self.session.execute(
-            select(Product).order_by(Product.name_embedding.cosine_distance(vector)).limit(limit)
+            select(Product)
+            .options(selectinload(Product.images), selectinload(Product.specs))
+            .order_by(Product.name_embedding.cosine_distance(vector))
+            .limit(limit)
         )
         return result.scalars().all()
 
@@ -63,6 +225,7 @@ class ProductRepository(BaseRepository[Product]):
         rank = func.ts_rank_cd(Product.tsv, ts_query)
         result = await self.session.execute(
             select(Product)
+            .options(selectinload(Product.images), selectinload(Product.specs))
             .where(Product.tsv.op("@@")(ts_query))
             .order_by(rank.desc())
             .limit(limit)
@@ -70,6 +233,50 @@ class ProductRepository(BaseRepository[Product]):
         return result.scalars().all()
 
 
+class ProductNeighborRepository(BaseRepository[ProductNeighbor]):
+    model = ProductNeighbor
+
+    async def similar(self, product_ids: list[int]) -> dict[int, list[Row]]:
+        """Краткие карточки похожих товаров по порядку; чтение по первичному ключу."""
+        if not product_ids:
+            return {}
+        result = await self.session.execute(
+            select(ProductNeighbor.product_id.label("owner_id"), ProductNeighbor.score, *product_card_columns())
+            .join(Product, Product.id == ProductNeighbor.neighbor_id)
+            .where(ProductNeighbor.product_id.in_(product_ids))
+            .order_by(ProductNeighbor.product_id, ProductNeighbor.rank)
+        )
+        similar: dict[int, list[Row]] = {product_id: [] for product_id in product_ids}
+        for row in result.all():
+            similar[row.owner_id].append(row)
+        return similar
+
+    async def referencing(self, product_ids: list[int]) -> list[int]:
+        """Товары, в чьих списках есть любой из product_ids."""
+        result = await self.session.execute(
+            select(ProductNeighbor.product_id).where(ProductNeighbor.neighbor_id.in_(product_ids)).distinct()
+        )
+        return list(result.scalars().all())
+
+    async def replace(self, neighbors: dict[int, list[tuple[int, float]]]) -> None:
+        """Заменяет списки товаров; пустой список удаляет строки товара."""
+        if not neighbors:
+            return
+        await self.session.execute(delete(ProductNeighbor).where(ProductNeighbor.product_id.in_(list(neighbors))))
+        rows = [
+            {"product_id": product_id, "rank": rank, "neighbor_id": neighbor_id, "score": score}
+            for product_id, items in neighbors.items()
+            for rank, (neighbor_id, score) in enumerate(items)
+        ]
+        if rows:
+            await self.session.execute(insert(ProductNeighbor), rows)
+
+    async def prune(self) -> None:
+        """Удаляет списки неактивных товаров и товаров без вектора."""
+        candidates = select(Product.id).where(Product.is_active.is_(True), Product.name_embedding.is_not(None))
+        await self.session.execute(delete(ProductNeighbor).where(ProductNeighbor.product_id.not_in(candidates)))
+
+
 class ProductImageRepository(BaseRepository[ProductImage]):
     model = ProductImage
 
@@ -79,6 +286,34 @@ class ProductImageRepository(BaseRepository[ProductImage]):
         )
         return result.scalars().all()
 
+    async def claim_stale(self, version: int, after_id: int, limit: int) -> list[ProductImage]:
+        """Загруженные изображения с вариантами старее ``version``; строки заблокированы
+        до конца транзакции, параллельные запуски их пропускают."""
+        result = await self.session.execute(
+            select(ProductImage)
+            .where(
+                ProductImage.storage_key.is_not(None),
+                ProductImage.variants_version < version,
+                ProductImage.id > after_id,
+            )
+            .order_by(ProductImage.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        return result.scalars().all()
+
+    async def storage_key_in_use(self, storage_key: str) -> bool:
+        result = await self.session.execute(
+            select(ProductImage.id).where(ProductImage.storage_key == storage_key).limit(1)
+        )
+        return result.first() is not None
+
+    async def mark_stale(self) -> int:
+        result = await self.session.execute(
+            update(ProductImage).where(ProductImage.storage_key.is_not(None)).values(variants_version=0)
+        )
+        return result.rowcount
+
 
 class ProductSpecRepository(BaseRepository[ProductSpec]):
     model = ProductSpec
@@ -0,0 +1,182 @@
+from sqlalchemy import MetaData, delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import aliased
+
+from app.db.models import (
+    CopurchaseEvent,
+    Order,
+    OrderItem,
+    Product,
+    ProductPairCount,
+    ProductRecommendation,
+    ProductSales,
+)
+from app.db.repositories.analytics import EXCLUDED_STATUSES
+from app.db.repositories.base import BaseRepository
+from app.db.repositories.catalog import product_card_columns
+
+STAGING_TABLE = "product_pair_counts_new"
+
+
+class CopurchaseRepository(BaseRepository[ProductPairCount]):
+    """Счётчики совместных покупок и готовые списки рекомендаций.
+
+    Заказ в своей транзакции только дописывает событие в ``copurchase_events``
+    (``log_order``, без commit); пары из него считает фоновая задача. Списки
+    ``product_recommendations`` пересчитываются в фоне, и эндпоинты читают
+    только их.
+    """
+
+    model = ProductPairCount
+
+    async def log_order(self, order_id: int, sign: int = 1) -> None:
+        await self.session.execute(insert(CopurchaseEvent).values(order_id=order_id, sign=sign))
+
+    async def take_events(self, limit: int) -> list[Row]:
+        """Забирает из журнала до ``limit`` самых старых событий (order_id, sign)."""
+        batch = select(CopurchaseEvent.id).order_by(CopurchaseEvent.id).limit(limit)
+        result = await self.session.execute(
+            delete(CopurchaseEvent)
+            .where(CopurchaseEvent.id.in_(batch.scalar_subquery()))
+            .returning(CopurchaseEvent.order_id, CopurchaseEvent.sign)
+        )
+        return result.all()
+
+    async def order_items(self, order_ids: list[int]) -> list[Row]:
+        """(order_id, product_id) позиций заказов по возрастанию order_id."""
+        result = await self.session.execute(
+            select(OrderItem.order_id, OrderItem.product_id)
+            .where(OrderItem.order_id.in_(order_ids))
+            .order_by(OrderItem.order_id)
+        )
+        return result.all()
+
+    async def add_counts(self, rows: list[dict]) -> None:
+        """Прибавляет дельты к счётчикам; строки отсортированы по (product_id, other_id)."""
+        for start in range(0, len(rows), 10_000):
+            stmt = insert(ProductPairCount).values(rows[start : start + 10_000])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ProductPairCount.product_id, ProductPairCount.other_id],
+                set_={"orders_count": ProductPairCount.orders_count + stmt.excluded.orders_count},
+            )
+            await self.session.execute(stmt)
+
+    async def refresh_lists(self, product_ids: list[int] | None, k: int, min_count: int) -> None:
+        """Пересчитывает top-K товаров (None — всех) по косинусу:
+        пары / sqrt(заказы товара × заказы соседа)."""
+        own, other = aliased(ProductSales), aliased(ProductSales)
+        score = ProductPairCount.orders_count / func.sqrt(
+            func.greatest(own.orders_count, 1) * func.greatest(other.orders_count, 1)
+        )
+        rank = func.row_number().over(partition_by=ProductPairCount.product_id, order_by=score.desc()) - 1
+        query = (
+            select(ProductPairCount.product_id, rank.label("rank"), ProductPairCount.other_id, score.label("score"))
+            .join(own, own.product_id == ProductPairCount.product_id)
+            .join(other, other.product_id == ProductPairCount.other_id)
+            .where(ProductPairCount.orders_count >= min_count)
+        )
+        cleanup = delete(ProductRecommendation)
+        if product_ids is not None:
+            query = query.where(ProductPairCount.product_id.in_(product_ids))
+            cleanup = cleanup.where(ProductRecommendation.product_id.in_(product_ids))
+        ranked = query.subquery()
+        await self.session.execute(cleanup)
+        await self.session.execute(
+            insert(ProductRecommendation).from_select(
+                ["product_id", "rank", "other_id", "score"],
+                select(ranked.c.product_id, ranked.c.rank, ranked.c.other_id, ranked.c.score).where(
+                    ranked.c.rank < k
+                ),
+            )
+        )
+
+    async def prune(self, keep_per_product: int) -> int:
+        """Оставляет у каждого товара ``keep_per_product`` самых частых пар."""
+        result = await self.session.execute(
+            text(
+                """
+                DELETE FROM product_pair_counts AS p
+                USING (
+                    SELECT product_id, other_id,
+                           row_number() OVER (PARTITION BY product_id ORDER BY orders_count DESC) AS rn
+                    FROM product_pair_counts
+                ) AS ranked
+                WHERE p.product_id = ranked.product_id
+                  AND p.other_id = ranked.other_id
+                  AND (ranked.rn > :keep OR p.orders_count <= 0)
+                """
+            ),
+            {"keep": keep_per_product},
+        )
+        return result.rowcount
+
+    async def order_items_chunk(self, after_order_id: int, limit: int) -> list[Row]:
+        """(order_id, product_id) учитываемых заказов по возрастанию order_id."""
+        result = await self.session.execute(
+            select(OrderItem.order_id, OrderItem.product_id)
+            .join(Order, Order.id == OrderItem.order_id)
+            .where(OrderItem.order_id > after_order_id, Order.status.not_in(EXCLUDED_STATUSES))
+            .order_by(OrderItem.order_id)
+            .limit(limit)
+        )
+        return result.all()
+
+    async def swap_counts(self, rows: list[dict]) -> None:
+        """Заливает счётчики в новую таблицу и подменяет ею ``product_pair_counts``.
+
+        Исключительная блокировка берётся только на DROP/RENAME, заливка идёт
+        мимо рабочей таблицы.
+        """
+        await self.session.execute(text(f"DROP TABLE IF EXISTS {STAGING_TABLE}"))
+        await self.session.execute(
+            text(f"CREATE TABLE {STAGING_TABLE} (LIKE product_pair_counts INCLUDING DEFAULTS)")
+        )
+        staging = ProductPairCount.__table__.to_metadata(MetaData(), name=STAGING_TABLE)
+        for start in range(0, len(rows), 10_000):
+            await self.session.execute(insert(staging), rows[start : start + 10_000])
+        await self.session.execute(
+            text(f"ALTER TABLE {STAGING_TABLE} ADD CONSTRAINT {STAGING_TABLE}_pkey PRIMARY KEY (product_id, other_id)")
+        )
+        await self.session.execute(text("LOCK TABLE product_pair_counts IN ACCESS EXCLUSIVE MODE"))
+        await self.session.execute(text("DROP TABLE product_pair_counts"))
+        await self.session.execute(text(f"ALTER TABLE {STAGING_TABLE} RENAME TO product_pair_counts"))
+        await self.session.execute(
+            text(f"ALTER TABLE product_pair_counts RENAME CONSTRAINT {STAGING_TABLE}_pkey TO product_pair_counts_pkey")
+        )
+
+    async def clear_events(self) -> None:
+        """Удаляет события, видимые в снимке транзакции (их заказы уже прочитаны пересчётом)."""
+        await self.session.execute(delete(CopurchaseEvent))
+
+    async def for_product(self, product_id: int, limit: int) -> list[Row]:
+        result = await self.session.execute(
+            select(ProductRecommendation.score, *product_card_columns())
+            .join(Product, Product.id == ProductRecommendation.other_id)
+            .where(ProductRecommendation.product_id == product_id, Product.is_active.is_(True))
+            .order_by(ProductRecommendation.rank)
+            .limit(limit)
+        )
+        return result.all()
+
+    async def for_products(self, product_ids: list[int], limit: int) -> list[Row]:
+        """Рекомендации к набору товаров (корзине): сумма весов по спискам, без самих товаров."""
+        if not product_ids:
+            return []
+        scores = (
+            select(ProductRecommendation.other_id, func.sum(ProductRecommendation.score).label("score"))
+            .where(
+                ProductRecommendation.product_id.in_(product_ids),
+                ProductRecommendation.other_id.not_in(product_ids),
+            )
+            .group_by(ProductRecommendation.other_id)
+            .subquery()
+        )
+        result = await self.session.execute(
+            select(scores.c.score, *product_card_columns())
+            .join(Product, Product.id == scores.c.other_id)
+            .where(Product.is_active.is_(True))
+            .order_by(scores.c.score.desc())
+            .limit(limit)
+        )
+        return result.all()
@@ -1,6 +1,9 @@
-from sqlalchemy import select
+from datetime import datetime
 
-from app.db.models import Order, OrderItem
+from sqlalchemy import Select, func, select, tuple_
+from sqlalchemy.engine import Row
+
+from app.db.models import Order, OrderItem, ProductImage
 from app.db.repositories.base import BaseRepository
 
 
@@ -13,6 +16,54 @@ class OrderRepository(BaseRepository[Order]):
         )
         return result.scalars().all()
 
+    @staticmethod
+    def _summary_query() -> Select:
+        items_count = (
+            select(func.coalesce(func.sum(OrderItem.quantity), 0))
+            .where(OrderItem.order_id == Order.id)
+            .correlate(Order)
+            .scalar_subquery()
+        )
+        first_product_id = (
+            select(OrderItem.product_id)
+            .where(OrderItem.order_id == Order.id)
+            .order_by(OrderItem.id)
+            .limit(1)
+            .correlate(Order)
+            .scalar_subquery()
+        )
+        image_url = (
+            select(func.coalesce(ProductImage.card_url, ProductImage.url))
+            .where(ProductImage.product_id == first_product_id)
+            .order_by(ProductImage.is_main.desc(), ProductImage.sort_order, ProductImage.id)
+            .limit(1)
+            .scalar_subquery()
+        )
+        return select(
+            Order.id,
+            Order.status,
+            Order.total_amount,
+            Order.created_at,
+            items_count.label("items_count"),
+            image_url.label("image_url"),
+        )
+
+    async def list_summaries_by_user(
+        self, user_id: int, limit: int = 20, before: tuple[datetime, int] | None = None
+    ) -> list[Row]:
+        """Keyset-страница истории заказов по индексу (user_id, created_at DESC, id DESC)."""
+        query = self._summary_query().where(Order.user_id == user_id)
+        if before is not None:
+            query = query.where(tuple_(Order.created_at, Order.id) < tuple_(*before))
+        result = await self.session.execute(
+            query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit)
+        )
+        return result.all()
+
+    async def get_summary(self, order_id: int) -> Row | None:
+        result = await self.session.execute(self._summary_query().where(Order.id == order_id))
+        return result.first()
+
 
 class OrderItemRepository(BaseRepository[OrderItem]):
     model = OrderItem
@@ -1,5 +1,6 @@
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+
+from sqlalchemy import delete, select, update
 
 from app.db.models import UserSession
 from app.db.repositories.base import BaseRepository
@@ -12,7 +13,34 @@ class SessionRepository(BaseRepository[UserSession]):
         result = await self.session.execute(select(UserSession).where(UserSession.token == token))
         return result.scalars().first()
 
+    async def extend(self, token: str, expires_at: datetime, older_than: datetime) -> None:
+        """Продлевает сессию до ``expires_at``, если её срок раньше ``older_than``."""
+        await self.session.execute(
+            update(UserSession)
+            .where(UserSession.token == token, UserSession.expires_at < older_than)
+            .values(expires_at=expires_at)
+        )
+        await self.session.commit()
+
     async def delete_by_token(self, token: str) -> None:
-        session = await self.get_by_token(token)
-        if session:
-            await self.delete(session)
+        await self.session.execute(delete(UserSession).where(UserSession.token == token))
+        await self.session.commit()
+
+    async def delete_by_user(self, user_id: int) -> int:
+        result = await self.session.execute(delete(UserSession).where(UserSession.user_id == user_id))
+        await self.session.commit()
+        return result.rowcount or 0
+
+    async def delete_expired(self, now: datetime) -> int:
+        result = await self.session.execute(delete(UserSession).where(UserSession.expires_at < now))
+        await self.session.commit()
+        return result.rowcount or 0
+
+    async def list_active_chunk(self, now: datetime, after_id: int = 0, limit: int = 1000) -> list[UserSession]:
+        result = await self.session.execute(
+            select(UserSession)
+            .where(UserSession.id > after_id, UserSession.expires_at >= now)
+            .order_by(UserSession.id)
+            .limit(limit)
+        )
+        return result.scalars().all()
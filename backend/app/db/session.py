@@ -1,11 +1,116 @@
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.core.config import settings
+from app.core.metrics import DB_POOL_WAIT, Gauge
+from app.db.instrumentation import instrument_engine
+
+PRE_PING_STRATEGIES = ("always", "idle", "off")
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул, который замеряет ожидание свободного соединения."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - start)
+
+
+def _connect_args(driver: str) -> dict:
+    if driver == "asyncpg":
+        args: dict = {"prepared_statement_cache_size": settings.db_statement_cache_size}
+        if settings.db_statement_timeout_ms:
+            args["server_settings"] = {"statement_timeout": str(settings.db_statement_timeout_ms)}
+        return args
+    if driver == "psycopg" and settings.db_statement_timeout_ms:
+        return {"options": f"-c statement_timeout={settings.db_statement_timeout_ms}"}
+    return {}
+
+
+def _ping_idle_connections(engine: AsyncEngine, idle_seconds: float) -> None:
+    """Пингует только соединения, простоявшие в пуле дольше idle_seconds.
+
+    ``pool_pre_ping=True`` делает лишний round trip на каждый checkout; под
+    нагрузкой соединения почти не простаивают, и проверка им не нужна.
+    """
+
+    @event.listens_for(engine.sync_engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record) -> None:
+        connection_record.info["checked_in_at"] = time.monotonic()
 
-engine = create_async_engine(settings.database_url, pool_pre_ping=True)
+    @event.listens_for(engine.sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy) -> None:
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        try:
+            engine.dialect.do_ping(dbapi_connection)
+        except Exception as exc:
+            # Пул закроет соединение и повторит checkout с новым.
+            raise DisconnectionError() from exc
+
+
+def create_engine(database_url: str) -> AsyncEngine:
+    if settings.db_pool_pre_ping not in PRE_PING_STRATEGIES:
+        raise ValueError(f"DB_POOL_PRE_PING must be one of {', '.join(PRE_PING_STRATEGIES)}")
+    url = make_url(database_url)
+    if settings.db_driver:
+        url = url.set(drivername=f"postgresql+{settings.db_driver}")
+    new_engine = create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout_seconds,
+        pool_recycle=settings.db_pool_recycle_seconds,
+        pool_pre_ping=settings.db_pool_pre_ping == "always",
+        connect_args=_connect_args(url.get_driver_name()),
+    )
+    if settings.db_pool_pre_ping == "idle":
+        _ping_idle_connections(new_engine, settings.db_pool_pre_ping_idle_seconds)
+    instrument_engine(new_engine, settings.db_slow_query_ms)
+    return new_engine
+
+
+engine = create_engine(settings.database_url)
 SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
 
 
+def pool_stats(target: AsyncEngine = engine) -> dict:
+    pool = target.pool
+    return {
+        "driver": target.dialect.driver,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": settings.db_max_overflow,
+        "timeout_seconds": settings.db_pool_timeout_seconds,
+        "pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def _pool_gauges() -> dict[tuple[str, ...], float]:
+    stats = pool_stats()
+    return {
+        ("size",): stats["size"],
+        ("checked_out",): stats["checked_out"],
+        ("overflow",): stats["overflow"],
+        ("idle",): stats["checked_in"],
+    }
+
+
+Gauge("db_pool_connections", "DB pool connections by state", ("state",), collect=_pool_gauges)
+
+
 async def get_db():
     async with SessionLocal() as db:
         yield db
@@ -1,77 +1,229 @@
+import asyncio
 import logging
 import time
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 
+from app.api.admin import router as admin_router
 from app.api.auth import router as auth_router
 from app.api.cart import router as cart_router
 from app.api.catalog import router as catalog_router
 from app.api.health import router as health_router
+from app.api.metrics import router as metrics_router
 from app.api.orders import router as orders_router
-from app.core.cache import invalidate_prefix
+from app.core.background import register_periodic, start_background_tasks, stop_background_tasks
+from app.core.cart_store import flush_dirty_carts
+from app.core.catalog_cache import refresh_popular, warm_up
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
+from app.core.copurchase import prune_pairs
+from app.core.copurchase import refresh_dirty as refresh_copurchases
+from app.core.embedding_worker import embed_pending
+from app.core.images import shutdown_pool
 from app.core.logging import setup_logging
+from app.core.metrics import HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS, flush
+from app.core.neighbors import refresh_dirty as refresh_neighbors
+from app.core.rate_limit import acquire, classify
+from app.core.rollups import fold_events
+from app.core.stock import expire_reservations, reconcile
 from app.db.base import Base
+from app.db.instrumentation import start_request
+from app.db.migrations import LATEST_VERSION, apply_migrations, schema_version
+from app.db.redis import close_redis, get_redis, get_redis_bytes
+from app.db.replicas import is_write_request, pin_reads_to_primary, replicas
 from app.db.session import engine
 
 setup_logging()
 logger = logging.getLogger("app")
 
-app = FastAPI(title="Take Smart API")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.cors_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def ensure_schema() -> None:
+    async with engine.begin() as conn:
+        version = await schema_version(conn)
+        if version is not None and version >= LATEST_VERSION:
+            return
+        if not settings.enable_db_init:
+            raise RuntimeError(f"database schema version {version} is behind {LATEST_VERSION}, run migrations")
+        await conn.run_sync(Base.metadata.create_all)
+        await apply_migrations(conn)
+    logger.info("database schema migrated from=%s to=%s", version, LATEST_VERSION)
+
+
+async def warm_connections() -> None:
+    """Открывает соединения пула заранее, чтобы первые запросы не ждали connect."""
+
+    async def open_one() -> None:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(open_one() for _ in range(settings.db_pool_warm_connections)))
+    for client in (get_redis(), get_redis_bytes()):
+        try:
+            await client.ping()
+        except Exception as exc:  # pragma: no cover - redis optional
+            logger.warning("redis ping failed on startup error=%s", exc)
+
+
+async def warm_caches(app: FastAPI) -> None:
+    try:
+        await asyncio.wait_for(
+            warm_up(settings.warmup_product_pages, settings.warmup_top_products), settings.warmup_timeout_seconds
+        )
+    except asyncio.TimeoutError:
+        logger.warning("catalog cache warm-up timed out after %ss", settings.warmup_timeout_seconds)
+    except Exception as exc:
+        logger.warning("catalog cache warm-up failed error=%s", exc)
+    finally:
+        app.state.ready = True
+
+
+def register_tasks() -> None:
+    register_periodic("cart-flush", settings.cart_flush_interval_seconds, flush_dirty_carts)
+    if settings.cache_refresh_enabled:
+        register_periodic(
+            "cache-refresh", settings.cache_refresh_interval_seconds, refresh_popular, run_on_shutdown=False
+        )
+    if settings.embedding_worker_enabled:
+        register_periodic("embed-pending", settings.embedding_interval_seconds, embed_pending, run_on_shutdown=False)
+    register_periodic("rollups-fold", settings.rollups_fold_interval_seconds, fold_events)
+    register_periodic("neighbors-refresh", settings.neighbors_refresh_interval_seconds, refresh_neighbors)
+    register_periodic("copurchase-refresh", settings.copurchase_refresh_interval_seconds, refresh_copurchases)
+    register_periodic(
+        "copurchase-prune", settings.copurchase_prune_interval_seconds, prune_pairs, run_on_shutdown=False
+    )
+    register_periodic("stock-reconcile", settings.stock_reconcile_interval_seconds, reconcile)
+    register_periodic(
+        "stock-expire", settings.stock_expire_interval_seconds, expire_reservations, run_on_shutdown=False
+    )
+    if replicas.engines:
+        register_periodic("replica-check", settings.db_replica_check_interval_seconds, replicas.check)
+    if settings.metrics_multiproc_dir:
+        multiproc_dir = settings.metrics_multiproc_dir
+
+        async def flush_metrics() -> None:
+            await flush(multiproc_dir)
+
+        register_periodic("metrics-snapshot", settings.metrics_flush_interval_seconds, flush_metrics)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    await ensure_schema()
+    await warm_connections()
+    register_tasks()
+    start_background_tasks()
+    warmup_task = None
+    if settings.warmup_enabled:
+        warmup_task = asyncio.create_task(warm_caches(app), name="cache-warmup")
+    else:
+        app.state.ready = True
+    try:
+        yield
+    finally:
+        if warmup_task is not None and not warmup_task.done():
+            warmup_task.cancel()
+        await stop_background_tasks()
+        shutdown_pool()
+        await close_redis()
+        for replica_engine in replicas.engines:
+            await replica_engine.dispose()
+        await engine.dispose()
+
+
+app = FastAPI(title="Take Smart API", default_response_class=ORJSONResponse, lifespan=lifespan)
+
+app.add_middleware(CompressionMiddleware)
+
+if settings.media_serve:
+    # В продакшене MEDIA_ROOT отдаёт nginx, тогда MEDIA_SERVE=false.
+    app.mount(settings.media_url_prefix, StaticFiles(directory=settings.media_root, check_dir=False), name="media")
+
+
+@app.middleware("http")
+async def rate_limit(request: Request, call_next):
+    route_class = classify(request.method, request.url.path) if settings.rate_limit_enabled else None
+    if route_class is None:
+        return await call_next(request)
+    decision = await acquire(request, route_class)
+    if not decision.allowed:
+        return JSONResponse(status_code=429, content={"detail": "Too many requests"}, headers=decision.headers)
+    request.state.rate_limit = decision
+    response = await call_next(request)
+    # charge_miss мог списать доплату: в заголовках — последнее решение.
+    response.headers.update(request.state.rate_limit.headers)
+    return response
 
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    start = time.time()
+    start = time.perf_counter()
+    status_code = 500
+    HTTP_IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        HTTP_IN_FLIGHT.dec()
+        duration = time.perf_counter() - start
+        # Шаблон маршрута (/api/products/{product_id}), а не сырой путь — иначе метки не ограничены.
+        route = request.scope.get("route")
+        labels = {
+            "method": request.method,
+            "route": getattr(route, "path", "unmatched"),
+            "status": status_code,
+        }
+        HTTP_REQUESTS.inc(**labels)
+        HTTP_LATENCY.observe(duration, **labels)
+    logger.info("%s %s %s %sms", request.method, request.url.path, status_code, int(duration * 1000))
+    return response
+
+
+@app.middleware("http")
+async def track_queries(request: Request, call_next):
+    stats = start_request()
     response = await call_next(request)
-    duration_ms = int((time.time() - start) * 1000)
-    logger.info("%s %s %s %sms", request.method, request.url.path, response.status_code, duration_ms)
+    for shape, count in stats.repeated(settings.db_n_plus_one_threshold):
+        logger.warning("possible N+1 %s %s: %sx %s", request.method, request.url.path, count, shape)
+    if settings.server_timing_enabled:
+        response.headers.append("Server-Timing", stats.server_timing())
     return response
 
 
 @app.middleware("http")
-async def invalidate_cache_after_write(request: Request, call_next):
+async def pin_reads_after_write(request: Request, call_next):
     response = await call_next(request)
-    if request.method in {"POST", "PATCH", "PUT", "DELETE"}:
-        path = request.url.path
-        if path.startswith("/api/categories"):
-            await invalidate_prefix("catalog:categories:")
-        if path.startswith("/api/brands"):
-            await invalidate_prefix("catalog:brands:")
-        if path.startswith("/api/products"):
-            await invalidate_prefix("catalog:products:")
-            await invalidate_prefix("catalog:product:")
-            await invalidate_prefix("catalog:search:tsv:")
+    if replicas.engines and is_write_request(request) and response.status_code < 400:
+        pin_reads_to_primary(response)
     return response
 
 
+# Добавляется последним, то есть снаружи остальных: заголовки CORS есть и у ответов 429.
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=settings.cors_origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
 @app.exception_handler(SQLAlchemyError)
 async def db_exception_handler(_request: Request, exc: SQLAlchemyError):
     logger.exception("database error: %s", exc)
     return JSONResponse(status_code=500, content={"detail": "Database error"})
 
 
-@app.on_event("startup")
-async def on_startup():
-    if settings.enable_db_init:
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-        logger.info("database schema ensured")
-
-
 app.include_router(health_router)
+app.include_router(metrics_router)
 app.include_router(auth_router)
 app.include_router(catalog_router)
 app.include_router(cart_router)
-app.include_router(orders_router)
\ No newline at end of file
+app.include_router(orders_router)
+app.include_router(admin_router)
\ No newline at end of file
@@ -1,5 +1,15 @@
+from app.schemas.admin import DbPoolStats
+from app.schemas.analytics import AnalyticsSummary, DailySalesRead, SegmentSalesRead, TopProductRead
 from app.schemas.auth import AuthResponse, LoginRequest, LogoutResponse, RegisterRequest
-from app.schemas.cart import CartItemCreate, CartItemRead, CartItemUpdate, CartRead
+from app.schemas.cart import (
+    CartItemCreate,
+    CartItemRead,
+    CartItemUpdate,
+    CartLineRead,
+    CartMerge,
+    CartRead,
+    CartReplace,
+)
 from app.schemas.catalog import (
     BrandCreate,
     BrandRead,
@@ -7,16 +17,29 @@ from app.schemas.catalog import (
     CategoryCreate,
     CategoryRead,
     CategoryUpdate,
+    ProductCardRead,
     ProductCreate,
+    ProductDetailRead,
     ProductImageCreate,
     ProductImageRead,
+    ProductImageVariant,
     ProductRead,
+    ProductRecommendationRead,
     ProductSearchVector,
+    ProductSimilarRead,
     ProductSpecCreate,
     ProductSpecRead,
     ProductUpdate,
 )
-from app.schemas.order import OrderCreate, OrderItemCreate, OrderItemRead, OrderRead
+from app.schemas.order import (
+    OrderCreate,
+    OrderItemCreate,
+    OrderItemRead,
+    OrderPage,
+    OrderRead,
+    OrderStatusUpdate,
+    OrderSummaryRead,
+)
 from app.schemas.user import UserCreate, UserRead
 
 __all__ = [
@@ -34,19 +57,35 @@ __all__ = [
     "BrandUpdate",
     "ProductCreate",
     "ProductRead",
+    "ProductCardRead",
+    "ProductDetailRead",
+    "ProductSimilarRead",
+    "ProductRecommendationRead",
     "ProductUpdate",
     "ProductImageCreate",
     "ProductImageRead",
+    "ProductImageVariant",
     "ProductSpecCreate",
     "ProductSpecRead",
     "ProductSearchVector",
     "CartItemCreate",
     "CartItemRead",
     "CartItemUpdate",
+    "CartLineRead",
     "CartRead",
+    "CartReplace",
+    "CartMerge",
     "OrderCreate",
     "OrderItemCreate",
     "OrderItemRead",
     "OrderRead",
+    "OrderSummaryRead",
+    "OrderStatusUpdate",
+    "OrderPage",
+    "AnalyticsSummary",
+    "DailySalesRead",
+    "SegmentSalesRead",
+    "TopProductRead",
+    "DbPoolStats",
 ]
 
@@ -0,0 +1,20 @@
+from pydantic import BaseModel, Field
+
+
+class HotStockRead(BaseModel):
+    product_id: int = Field(..., description="ID товара")
+    hot: bool = Field(..., description="Остаток ведётся в Redis")
+    stock: int = Field(..., description="Доступный остаток")
+
+
+class DbPoolStats(BaseModel):
+    driver: str = Field(..., description="Драйвер БД")
+    size: int = Field(..., description="Размер пула")
+    checked_in: int = Field(..., description="Свободные соединения")
+    checked_out: int = Field(..., description="Занятые соединения")
+    overflow: int = Field(..., description="Соединения сверх размера пула")
+    max_overflow: int = Field(..., description="Максимум соединений сверх пула")
+    timeout_seconds: float = Field(..., description="Таймаут ожидания соединения")
+    pre_ping: str = Field(..., description="Стратегия проверки соединений")
+    checkout_count: int = Field(..., description="Выдано соединений (этот процесс)")
+    checkout_wait_avg_ms: float = Field(..., description="Среднее ожидание соединения, мс")
@@ -0,0 +1,44 @@
+from datetime import date
+
+from pydantic import BaseModel, Field
+from pydantic.config import ConfigDict
+
+
+class DailySalesRead(BaseModel):
+    day: date = Field(..., description="День")
+    orders_count: int = Field(..., description="Количество заказов")
+    units: int = Field(..., description="Продано единиц")
+    revenue: float = Field(..., description="Выручка")
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class SegmentSalesRead(BaseModel):
+    id: int = Field(..., description="ID категории или бренда (0 — не указан)")
+    units: int = Field(..., description="Продано единиц")
+    revenue: float = Field(..., description="Выручка")
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class TopProductRead(BaseModel):
+    product_id: int = Field(..., description="ID товара")
+    name: str | None = Field(None, description="Название товара")
+    orders_count: int = Field(..., description="Количество заказов")
+    units_sold: int = Field(..., description="Продано единиц")
+    revenue: float = Field(..., description="Выручка")
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class AnalyticsSummary(BaseModel):
+    total_orders: int = Field(..., description="Всего заказов")
+    today_orders: int = Field(..., description="Заказов сегодня")
+    week_orders: int = Field(..., description="Заказов за 7 дней")
+    month_orders: int = Field(..., description="Заказов за 30 дней")
+    status_counts: dict[str, int] = Field(default_factory=dict, description="Заказы по статусам")
+    total_revenue: float = Field(..., description="Выручка за всё время")
+    today_revenue: float = Field(..., description="Выручка сегодня")
+    week_revenue: float = Field(..., description="Выручка за 7 дней")
+    avg_order_value: float = Field(..., description="Средний чек")
+    daily_orders: list[DailySalesRead] = Field(default_factory=list, description="Продажи по дням за 30 дней")
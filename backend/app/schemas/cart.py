@@ -3,7 +3,7 @@ from datetime import datetime
 from pydantic import BaseModel, Field
 from pydantic.config import ConfigDict
 
-from app.schemas.catalog import ProductRead
+from app.schemas.catalog import ProductCardRead
 
 
 class CartItemBase(BaseModel):
@@ -19,20 +19,39 @@ class CartItemUpdate(BaseModel):
     quantity: int = Field(..., ge=1, description="Количество")
 
 
+class CartReplace(BaseModel):
+    items: list[CartItemCreate] = Field(default_factory=list, max_length=200, description="Позиции корзины")
+
+
+class CartMerge(BaseModel):
+    items: list[CartItemCreate] = Field(
+        default_factory=list, max_length=200, description="Локальные позиции для слияния"
+    )
+
+
 class CartItemRead(CartItemBase):
-    id: int = Field(..., description="ID позиции")
     price_snapshot: float = Field(..., description="Цена на момент добавления")
-    product: ProductRead | None = Field(None, description="Товар")
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class CartLineRead(CartItemRead):
+    product: ProductCardRead | None = Field(None, description="Товар (краткая карточка)")
+    line_total: float = Field(0, description="Стоимость позиции по текущей цене")
+    price_changed: bool = Field(False, description="Цена изменилась с момента добавления")
+    in_stock: bool = Field(False, description="Достаточно остатка и товар активен")
+
+
 class CartRead(BaseModel):
-    id: int = Field(..., description="ID корзины")
-    status: str = Field(..., description="Статус корзины")
+    status: str = Field("active", description="Статус корзины")
     created_at: datetime = Field(..., description="Дата создания")
     updated_at: datetime = Field(..., description="Дата обновления")
-    items: list[CartItemRead] = Field(default_factory=list, description="Позиции")
+    items: list[CartLineRead] = Field(default_factory=list, description="Позиции")
+    items_count: int = Field(0, description="Количество товаров")
+    subtotal: float = Field(0, description="Сумма по ценам на момент добавления")
+    total: float = Field(0, description="Сумма по текущим ценам")
+    has_price_changes: bool = Field(False, description="Есть позиции с изменившейся ценой")
+    all_in_stock: bool = Field(True, description="Все позиции в наличии")
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from pydantic.config import ConfigDict
 
 
@@ -56,11 +56,28 @@ class ProductImageCreate(ProductImageBase):
     pass
 
 
+class ProductImageVariant(BaseModel):
+    width: int = Field(..., description="Ширина, px")
+    height: int = Field(..., description="Высота, px")
+    url: str = Field(..., description="URL WebP-варианта")
+
+
 class ProductImageRead(ProductImageBase):
     id: int = Field(..., description="ID изображения")
+    width: int | None = Field(None, description="Ширина оригинала, px")
+    height: int | None = Field(None, description="Высота оригинала, px")
+    variants: list[ProductImageVariant] = Field(
+        default_factory=list, description="Уменьшенные WebP-варианты по возрастанию ширины"
+    )
 
     model_config = ConfigDict(from_attributes=True)
 
+    @field_validator("variants", mode="before")
+    @classmethod
+    def _variants_or_empty(cls, value: list | None) -> list:
+        # У ещё не записанного в БД ProductImage серверный default не применён.
+        return [] if value is None else value
+
 
 class ProductSpecBase(BaseModel):
     key: str = Field(..., description="Название характеристики")
@@ -120,6 +137,31 @@ class ProductRead(ProductBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ProductCardRead(BaseModel):
+    id: int = Field(..., description="ID товара")
+    name: str = Field(..., description="Название товара")
+    slug: str = Field(..., description="Слаг товара")
+    price: float = Field(..., description="Цена")
+    currency: str = Field("RUB", description="Валюта")
+    stock: int = Field(0, description="Остаток")
+    is_active: bool = Field(True, description="Товар активен")
+    image_url: str | None = Field(None, description="Главное изображение (вариант для карточки, если есть)")
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ProductSimilarRead(ProductCardRead):
+    score: float = Field(..., description="Косинусная близость названий")
+
+
+class ProductRecommendationRead(ProductCardRead):
+    score: float = Field(..., description="Вес совместных покупок")
+
+
+class ProductDetailRead(ProductRead):
+    similar: list[ProductSimilarRead] = Field(default_factory=list, description="Похожие товары")
+
+
 class ProductSearchVector(BaseModel):
     vector: list[float] = Field(..., description="Вектор для поиска")
     limit: int = Field(20, ge=1, le=100, description="Лимит результатов")
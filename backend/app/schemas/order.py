@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Literal
 
 from pydantic import BaseModel, EmailStr, Field
 from pydantic.config import ConfigDict
@@ -31,6 +32,10 @@ class OrderCreate(BaseModel):
     items: list[OrderItemCreate] = Field(default_factory=list, description="Позиции заказа")
 
 
+class OrderStatusUpdate(BaseModel):
+    status: Literal["new", "processing", "ready", "completed", "cancelled"] = Field(..., description="Статус")
+
+
 class OrderRead(BaseModel):
     id: int = Field(..., description="ID заказа")
     name: str = Field(..., description="Имя покупателя")
@@ -43,3 +48,19 @@ class OrderRead(BaseModel):
     items: list[OrderItemRead] = Field(default_factory=list, description="Позиции")
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class OrderSummaryRead(BaseModel):
+    id: int = Field(..., description="ID заказа")
+    status: str = Field(..., description="Статус")
+    total_amount: float = Field(..., description="Сумма заказа")
+    created_at: datetime = Field(..., description="Дата создания")
+    items_count: int = Field(..., description="Количество товаров")
+    image_url: str | None = Field(None, description="Изображение первого товара")
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class OrderPage(BaseModel):
+    items: list[OrderSummaryRead] = Field(default_factory=list, description="Заказы")
+    next_cursor: str | None = Field(None, description="Курсор следующей страницы")
@@ -0,0 +1,5 @@
+"""Нагрузочные сценарии и генератор синтетического каталога.
+
+    python3 -m benchmarks.generator --products 10000 --truncate
+    python3 -m benchmarks.run --target asgi --baseline benchmarks/baseline.json
+"""
@@ -0,0 +1,58 @@
+import math
+import random
+from dataclasses import dataclass
+
+BENCH_PASSWORD = "benchmark-password"
+
+WORDS_RU = [
+    "смартфон", "ноутбук", "планшет", "наушники", "колонка", "часы", "камера", "монитор",
+    "клавиатура", "мышь", "роутер", "зарядка", "чехол", "кабель", "телевизор", "пылесос",
+]
+WORDS_EN = [
+    "pro", "max", "mini", "ultra", "lite", "air", "plus", "neo", "edge", "prime", "go", "one",
+]
+COLORS = ["черный", "белый", "серый", "синий", "красный", "зеленый"]
+SPEC_KEYS = ["Цвет", "Память", "Экран", "Вес", "Гарантия", "Материал", "Мощность"]
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    """Размеры синтетического набора; все производные от числа товаров."""
+
+    products: int = 10_000
+    seed: int = 42
+    embedding_dim: int = 128
+
+    @property
+    def categories(self) -> int:
+        return max(10, self.products // 200)
+
+    @property
+    def brands(self) -> int:
+        return max(10, self.products // 100)
+
+    @property
+    def users(self) -> int:
+        return max(50, self.products // 10)
+
+    @property
+    def orders(self) -> int:
+        return self.users * 5
+
+    def rng(self, stream: str) -> random.Random:
+        # Отдельный поток на таблицу: размер одной не сдвигает данные другой.
+        return random.Random(f"{self.seed}:{stream}")
+
+    def user_email(self, user_id: int) -> str:
+        return f"bench{user_id}@example.com"
+
+    def product_name(self, rng: random.Random) -> str:
+        return f"{rng.choice(WORDS_RU).capitalize()} {rng.choice(WORDS_EN)} {rng.randint(1, 99)}"
+
+    def search_terms(self) -> list[str]:
+        return WORDS_RU + WORDS_EN
+
+    def embedding(self, rng: random.Random) -> list[float]:
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.embedding_dim)]
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
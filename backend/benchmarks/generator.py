@@ -0,0 +1,257 @@
+"""Детерминированный синтетический каталог для бенчмарков (загрузка через COPY).
+
+    python3 -m benchmarks.generator --products 10000 [--seed 42] [--truncate]
+
+Идентификаторы начинаются с 1, поэтому таблицы должны быть пустыми —
+``--truncate`` очищает их (RESTART IDENTITY) вместе с производными таблицами
+(агрегаты, журналы событий, пары товаров) и удаляет из Redis ключи кэша,
+корзин, сессий и фоновых задач: иначе они ссылались бы на новые строки со
+старыми id. Не запускайте на рабочей базе.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import asyncpg
+from pgvector.asyncpg import register_vector
+from sqlalchemy.engine import make_url
+
+from app.core.config import settings
+from app.core.logging import setup_logging
+from app.core.security import hash_password
+from app.db.base import Base
+from app.db.migrations import apply_migrations
+from app.db.redis import close_redis, get_redis
+from app.db.repositories import AnalyticsRepository
+from app.db.session import SessionLocal, engine
+from benchmarks.dataset import BENCH_PASSWORD, COLORS, SPEC_KEYS, WORDS_RU, DatasetSpec
+
+logger = logging.getLogger("benchmarks.generator")
+
+BASE_TIME = datetime(2026, 1, 1)
+ORDER_STATUSES = ["new"] * 2 + ["processing"] * 2 + ["ready"] + ["completed"] * 4 + ["cancelled"]
+TABLES = [
+    "order_items",
+    "orders",
+    "cart_items",
+    "carts",
+    "user_sessions",
+    "users",
+    "product_specs",
+    "product_images",
+    "products",
+    "brands",
+    "categories",
+]
+# Без внешних ключей на TABLES: CASCADE их не очистит.
+DERIVED_TABLES = [
+    "sales_daily",
+    "sales_daily_segments",
+    "product_sales",
+    "order_status_counts",
+    "order_rollup_events",
+    "product_pair_counts",
+    "product_recommendations",
+    "copurchase_events",
+    "stock_reconcile_batches",
+]
+REDIS_PATTERNS = ["catalog:*", "cache:*", "cart:*", "session:*", "stock:*", "neighbors:*", "copurchase:*"]
+
+
+def categories(spec: DatasetSpec) -> Iterator[tuple]:
+    rng = spec.rng("categories")
+    roots = max(1, spec.categories // 5)
+    for category_id in range(1, spec.categories + 1):
+        parent_id = None if category_id <= roots else rng.randint(1, roots)
+        name = f"{WORDS_RU[category_id % len(WORDS_RU)].capitalize()} {category_id}"
+        yield category_id, name, f"category-{category_id}", parent_id
+
+
+def brands(spec: DatasetSpec) -> Iterator[tuple]:
+    for brand_id in range(1, spec.brands + 1):
+        yield brand_id, f"Brand {brand_id}", f"brand-{brand_id}"
+
+
+def products(spec: DatasetSpec) -> Iterator[tuple]:
+    rng = spec.rng("products")
+    for product_id in range(1, spec.products + 1):
+        name = spec.product_name(rng)
+        created_at = BASE_TIME + timedelta(minutes=product_id)
+        yield (
+            product_id,
+            name,
+            f"product-{product_id}",
+            f"{name}, цвет {rng.choice(COLORS)}. {' '.join(rng.sample(WORDS_RU, 5))}",
+            Decimal(f"{rng.uniform(100, 200_000):.2f}"),
+            "RUB",
+            rng.randint(0, 500),
+            rng.random() < 0.95,
+            created_at,
+            created_at,
+            rng.randint(1, spec.brands),
+            rng.randint(1, spec.categories),
+            spec.embedding(rng),
+        )
+
+
+def product_images(spec: DatasetSpec) -> Iterator[tuple]:
+    rng = spec.rng("images")
+    image_id = 0
+    for product_id in range(1, spec.products + 1):
+        for sort_order in range(rng.randint(1, 4)):
+            image_id += 1
+            url = f"/static/products/{product_id}/{sort_order}.jpg"
+            yield image_id, product_id, url, sort_order == 0, sort_order
+
+
+def product_specs(spec: DatasetSpec) -> Iterator[tuple]:
+    rng = spec.rng("specs")
+    spec_id = 0
+    for product_id in range(1, spec.products + 1):
+        for key in rng.sample(SPEC_KEYS, rng.randint(3, 6)):
+            spec_id += 1
+            yield spec_id, product_id, key, str(rng.randint(1, 1000))
+
+
+def users(spec: DatasetSpec) -> Iterator[tuple]:
+    # Один bcrypt-хеш на всех: иначе генерация упирается в хеширование.
+    hashed = hash_password(BENCH_PASSWORD)
+    for user_id in range(1, spec.users + 1):
+        yield user_id, spec.user_email(user_id), hashed, True, user_id == 1, BASE_TIME
+
+
+def orders(spec: DatasetSpec, prices: list[Decimal]) -> tuple[list[tuple], list[tuple]]:
+    rng = spec.rng("orders")
+    order_rows: list[tuple] = []
+    item_rows: list[tuple] = []
+    for order_id in range(1, spec.orders + 1):
+        user_id = rng.randint(1, spec.users)
+        total = Decimal(0)
+        for product_id in rng.sample(range(1, spec.products + 1), rng.randint(1, 4)):
+            quantity = rng.randint(1, 3)
+            price = prices[product_id - 1]
+            total += price * quantity
+            item_rows.append((len(item_rows) + 1, order_id, product_id, quantity, price))
+        created_at = BASE_TIME + timedelta(minutes=rng.randint(0, 180 * 24 * 60))
+        order_rows.append(
+            (
+                order_id,
+                user_id,
+                f"User {user_id}",
+                "+70000000000",
+                spec.user_email(user_id),
+                None,
+                rng.choice(ORDER_STATUSES),
+                total,
+                created_at,
+            )
+        )
+    return order_rows, item_rows
+
+
+def _dsn() -> str:
+    return make_url(settings.database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+async def _copy(conn: asyncpg.Connection, table: str, columns: list[str], records) -> None:
+    start = time.perf_counter()
+    records = list(records)
+    await conn.copy_records_to_table(table, records=records, columns=columns)
+    logger.info("copied table=%s rows=%s %.1fs", table, len(records), time.perf_counter() - start)
+
+
+async def _flush_redis() -> int:
+    client = get_redis()
+    removed = 0
+    try:
+        for pattern in REDIS_PATTERNS:
+            keys = [key async for key in client.scan_iter(match=pattern, count=1000)]
+            for start in range(0, len(keys), 500):
+                removed += await client.delete(*keys[start : start + 500])
+    finally:
+        await close_redis()
+    return removed
+
+
+async def generate(spec: DatasetSpec, truncate: bool = False) -> None:
+    async with engine.begin() as sa_conn:
+        await sa_conn.run_sync(Base.metadata.create_all)
+        await apply_migrations(sa_conn)
+
+    conn = await asyncpg.connect(_dsn())
+    try:
+        await register_vector(conn)
+        async with conn.transaction():
+            if truncate:
+                await conn.execute(f"TRUNCATE {', '.join(TABLES + DERIVED_TABLES)} RESTART IDENTITY CASCADE")
+            elif await conn.fetchval("SELECT EXISTS (SELECT 1 FROM products)"):
+                raise SystemExit("products table is not empty, use --truncate")
+
+            await _copy(conn, "categories", ["id", "name", "slug", "parent_id"], categories(spec))
+            await _copy(conn, "brands", ["id", "name", "slug"], brands(spec))
+            product_rows = list(products(spec))
+            await _copy(
+                conn,
+                "products",
+                [
+                    "id", "name", "slug", "description", "price", "currency", "stock", "is_active",
+                    "created_at", "updated_at", "brand_id", "category_id", "name_embedding",
+                ],
+                product_rows,
+            )
+            await _copy(
+                conn, "product_images", ["id", "product_id", "url", "is_main", "sort_order"], product_images(spec)
+            )
+            await _copy(conn, "product_specs", ["id", "product_id", "key", "value"], product_specs(spec))
+            await _copy(
+                conn,
+                "users",
+                ["id", "email", "hashed_password", "is_active", "is_admin", "created_at"],
+                users(spec),
+            )
+            order_rows, item_rows = orders(spec, [row[4] for row in product_rows])
+            await _copy(
+                conn,
+                "orders",
+                ["id", "user_id", "name", "phone", "email", "comment", "status", "total_amount", "created_at"],
+                order_rows,
+            )
+            await _copy(
+                conn, "order_items", ["id", "order_id", "product_id", "quantity", "price_snapshot"], item_rows
+            )
+
+            # COPY с явными id не двигает последовательности.
+            for table in TABLES:
+                await conn.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"coalesce((SELECT max(id) FROM {table}), 0) + 1, false)"
+                )
+        await conn.execute("ANALYZE")
+    finally:
+        await conn.close()
+
+    async with SessionLocal() as db:
+        await AnalyticsRepository(db).rebuild()
+    if truncate:
+        logger.info("redis keys flushed=%s", await _flush_redis())
+    logger.info("dataset ready products=%s users=%s orders=%s", spec.products, spec.users, spec.orders)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=DatasetSpec.products)
+    parser.add_argument("--seed", type=int, default=DatasetSpec.seed)
+    parser.add_argument("--truncate", action="store_true")
+    args = parser.parse_args()
+    setup_logging()
+    spec = DatasetSpec(products=args.products, seed=args.seed, embedding_dim=settings.product_embedding_dim)
+    asyncio.run(generate(spec, truncate=args.truncate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Прогон нагрузочных сценариев и сравнение с сохранённым baseline.
+
+    python3 -m benchmarks.run --target asgi --iterations 500 --concurrency 10
+    python3 -m benchmarks.run --target http://localhost:8000 --baseline benchmarks/baseline.json
+    python3 -m benchmarks.run --target asgi --baseline benchmarks/baseline.json --save-baseline
+
+``asgi`` запускает приложение в этом же процессе (httpx.ASGITransport),
+URL — ходит по HTTP в уже запущенный сервер. Данные должны быть
+сгенерированы ``benchmarks.generator`` с теми же --products/--seed.
+Код выхода 1, если p95 или число запросов к БД ухудшились сильнее допуска.
+В режиме ``asgi`` ограничение частоты запросов отключается; для HTTP-прогона
+запустите сервер с ``RATE_LIMIT_ENABLED=false``.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import platform
+import statistics
+import sys
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from app.core.config import settings
+from app.core.logging import setup_logging
+from benchmarks.dataset import DatasetSpec
+from benchmarks.scenarios import SCENARIOS, Sample, VirtualUser
+
+logger = logging.getLogger("benchmarks.run")
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples: list[Sample], wall_seconds: float) -> dict[str, dict[str, Any]]:
+    groups: dict[str, list[Sample]] = {}
+    for sample in samples:
+        groups.setdefault(sample.name, []).append(sample)
+    groups["total"] = samples
+    report = {}
+    for name, group in sorted(groups.items()):
+        latencies = [sample.seconds * 1000 for sample in group]
+        queries = [sample.queries for sample in group if sample.queries is not None]
+        db_ms = [sample.db_ms for sample in group if sample.db_ms is not None]
+        report[name] = {
+            "requests": len(group),
+            "errors": sum(1 for sample in group if sample.status >= 400),
+            "rps": round(len(group) / wall_seconds, 1) if wall_seconds else 0.0,
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "queries": round(statistics.fmean(queries), 2) if queries else None,
+            "db_ms": round(statistics.fmean(db_ms), 2) if db_ms else None,
+        }
+    return report
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, current in report.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        # Число запросов детерминировано: любой рост — это регрессия, а не шум.
+        if previous.get("queries") is not None and current["queries"] is not None:
+            if current["queries"] > previous["queries"] + 0.01:
+                regressions.append(f"{name}: queries {previous['queries']} -> {current['queries']}")
+    return regressions
+
+
+def print_report(report: dict, baseline: dict | None) -> None:
+    header = f"{'scenario':<20}{'req':>7}{'err':>6}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}{'db ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, row in report.items():
+        line = (
+            f"{name:<20}{row['requests']:>7}{row['errors']:>6}{row['rps']:>8}"
+            f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}"
+            f"{row['queries'] if row['queries'] is not None else '-':>9}"
+            f"{row['db_ms'] if row['db_ms'] is not None else '-':>8}"
+        )
+        previous = (baseline or {}).get(name)
+        if previous and previous["p95_ms"]:
+            line += f"  p95 {(row['p95_ms'] / previous['p95_ms'] - 1) * 100:+.0f}%"
+        print(line)
+
+
+def plan(spec: DatasetSpec, names: list[str], iterations: int) -> list[str]:
+    rng = spec.rng("plan")
+    weights = [SCENARIOS[name][1] for name in names]
+    return rng.choices(names, weights=weights, k=iterations)
+
+
+async def _worker(user: VirtualUser, queue: asyncio.Queue) -> None:
+    while True:
+        try:
+            name = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        await SCENARIOS[name][0](user)
+
+
+async def run(args: argparse.Namespace, spec: DatasetSpec) -> tuple[list[Sample], float]:
+    async with AsyncExitStack() as stack:
+        if args.target == "asgi":
+            from app.main import app
+
+            # Все виртуальные пользователи приходят с одного адреса.
+            settings.rate_limit_enabled = False
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            transport = httpx.ASGITransport(app=app)
+            base_url = "http://benchmark"
+        else:
+            transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=args.concurrency))
+            base_url = args.target
+
+        users = []
+        for index in range(args.concurrency):
+            client = await stack.enter_async_context(
+                httpx.AsyncClient(transport=transport, base_url=base_url, timeout=30)
+            )
+            # user 1 — администратор, нагрузку дают обычные пользователи.
+            user_id = 2 + index % (spec.users - 1)
+            users.append(VirtualUser(client=client, spec=spec, rng=spec.rng(f"user:{index}"), user_id=user_id))
+
+        names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+        for stage, iterations in (("warmup", args.warmup), ("measure", args.iterations)):
+            for user in users:
+                user.samples.clear()
+            queue: asyncio.Queue = asyncio.Queue()
+            for name in plan(spec, names, iterations):
+                queue.put_nowait(name)
+            start = time.perf_counter()
+            await asyncio.gather(*(_worker(user, queue) for user in users))
+            wall = time.perf_counter() - start
+            logger.info("%s done iterations=%s %.1fs", stage, iterations, wall)
+        return [sample for user in users for sample in user.samples], wall
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="asgi", help="asgi или базовый URL сервера")
+    parser.add_argument("--products", type=int, default=DatasetSpec.products)
+    parser.add_argument("--seed", type=int, default=DatasetSpec.seed)
+    parser.add_argument("--scenarios", default="", help=f"через запятую из: {', '.join(SCENARIOS)}")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимый рост p95 (доля)")
+    args = parser.parse_args()
+    setup_logging()
+
+    spec = DatasetSpec(products=args.products, seed=args.seed, embedding_dim=settings.product_embedding_dim)
+    samples, wall = asyncio.run(run(args, spec))
+    report = summarize(samples, wall)
+
+    baseline = None
+    if args.baseline and args.baseline.exists() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text())["results"]
+    print_report(report, baseline)
+
+    if args.baseline and args.save_baseline:
+        meta = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "target": args.target,
+            "products": spec.products,
+            "seed": spec.seed,
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+        }
+        args.baseline.write_text(json.dumps({"meta": meta, "results": report}, indent=2, ensure_ascii=False))
+        logger.info("baseline saved path=%s", args.baseline)
+    elif baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
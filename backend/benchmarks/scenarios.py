@@ -0,0 +1,117 @@
+import random
+import re
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+import httpx
+
+from benchmarks.dataset import BENCH_PASSWORD, DatasetSpec
+
+_SERVER_TIMING_DB = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+@dataclass
+class Sample:
+    name: str
+    status: int
+    seconds: float
+    queries: int | None
+    db_ms: float | None
+
+
+@dataclass
+class VirtualUser:
+    """Один «пользователь» нагрузки: свой клиент (cookies) и свой генератор случайных чисел."""
+
+    client: httpx.AsyncClient
+    spec: DatasetSpec
+    rng: random.Random
+    user_id: int
+    samples: list[Sample] = field(default_factory=list)
+    logged_in: bool = False
+
+    async def request(self, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - start
+        queries = db_ms = None
+        match = _SERVER_TIMING_DB.search(response.headers.get("server-timing", ""))
+        if match:
+            db_ms, queries = float(match.group(1)), int(match.group(2))
+        self.samples.append(Sample(name, response.status_code, elapsed, queries, db_ms))
+        return response
+
+    def product_id(self) -> int:
+        return self.rng.randint(1, self.spec.products)
+
+    async def login(self) -> None:
+        if self.logged_in:
+            return
+        await self.request(
+            "login",
+            "POST",
+            "/api/auth/login",
+            json={"email": self.spec.user_email(self.user_id), "password": BENCH_PASSWORD},
+        )
+        self.logged_in = True
+
+
+async def browse(user: VirtualUser) -> None:
+    await user.request("browse:categories", "GET", "/api/categories")
+    params = {"offset": user.rng.randint(0, 10) * 20, "limit": 20}
+    if user.rng.random() < 0.5:
+        params["category_id"] = user.rng.randint(1, user.spec.categories)
+    await user.request("browse:products", "GET", "/api/products", params=params)
+    await user.request("browse:product", "GET", f"/api/products/{user.product_id()}")
+
+
+async def search(user: VirtualUser) -> None:
+    query = user.rng.choice(user.spec.search_terms())
+    await user.request("search:tsv", "GET", "/api/products/search", params={"q": query, "limit": 20})
+
+
+async def vector_search(user: VirtualUser) -> None:
+    vector = user.spec.embedding(user.rng)
+    await user.request("search:vector", "POST", "/api/products/search/vector", json={"vector": vector, "limit": 20})
+
+
+async def cart(user: VirtualUser) -> None:
+    product_id = user.product_id()
+    await user.request("cart:add", "POST", "/api/cart/items", json={"product_id": product_id, "quantity": 1})
+    await user.request(
+        "cart:update", "PATCH", f"/api/cart/items/{product_id}", json={"quantity": user.rng.randint(1, 3)}
+    )
+    await user.request("cart:get", "GET", "/api/cart")
+
+
+async def checkout(user: VirtualUser) -> None:
+    await user.login()
+    items = [
+        {"product_id": user.product_id(), "quantity": user.rng.randint(1, 2)}
+        for _ in range(user.rng.randint(1, 3))
+    ]
+    await user.request(
+        "checkout:order",
+        "POST",
+        "/api/orders",
+        json={
+            "name": f"User {user.user_id}",
+            "phone": "+70000000000",
+            "email": user.spec.user_email(user.user_id),
+            "items": items,
+        },
+    )
+    await user.request("checkout:history", "GET", "/api/orders", params={"limit": 20})
+
+
+Scenario = Callable[[VirtualUser], Awaitable[None]]
+
+# Веса: как часто сценарий выбирается в смешанной нагрузке.
+SCENARIOS: dict[str, tuple[Scenario, int]] = {
+    "browse": (browse, 50),
+    "search": (search, 20),
+    "vector_search": (vector_search, 10),
+    "cart": (cart, 15),
+    "checkout": (checkout, 5),
+}
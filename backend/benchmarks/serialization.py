@@ -0,0 +1,116 @@
+"""Микробенчмарк сериализации списка товаров (без БД и Redis).
+
+    python3 -m benchmarks.serialization [--products 20] [--repeat 200]
+
+Сравнивает прежний путь (model_validate → model_dump → json.dumps, на
+попадании в кэш — json.loads → валидация response_model → jsonable_encoder)
+с TypeAdapter.dump_json и отдачей готовых байтов.
+"""
+
+import argparse
+import json
+import statistics
+import timeit
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app.core.config import settings
+from app.core.serialization import PRODUCT_LIST_ADAPTER, dump_products
+from app.db.models import Product, ProductImage, ProductSpec
+from app.schemas.catalog import ProductRead
+from benchmarks.dataset import SPEC_KEYS, DatasetSpec
+
+
+def build_products(count: int, spec: DatasetSpec) -> list[Product]:
+    rng = spec.rng("serialization")
+    created_at = datetime(2026, 1, 1)
+    products = []
+    for product_id in range(1, count + 1):
+        product = Product(
+            id=product_id,
+            name=spec.product_name(rng),
+            slug=f"product-{product_id}",
+            description="Описание товара " * 10,
+            price=Decimal(f"{rng.uniform(100, 200_000):.2f}"),
+            currency="RUB",
+            stock=rng.randint(0, 500),
+            is_active=True,
+            brand_id=rng.randint(1, 50),
+            category_id=rng.randint(1, 50),
+            name_embedding=None,
+            created_at=created_at,
+            updated_at=created_at + timedelta(days=product_id),
+        )
+        product.images = [
+            ProductImage(id=product_id * 10 + i, url=f"/static/{product_id}/{i}.jpg", is_main=i == 0, sort_order=i)
+            for i in range(3)
+        ]
+        product.specs = [
+            ProductSpec(id=product_id * 10 + i, key=key, value=str(rng.randint(1, 1000)))
+            for i, key in enumerate(SPEC_KEYS[:5])
+        ]
+        products.append(product)
+    return products
+
+
+def legacy_miss(products: list[Product]) -> bytes:
+    payload = [ProductRead.model_validate(p).model_dump() for p in products]
+    cached = json.dumps(payload, default=str)
+    JSONResponse(jsonable_encoder(PRODUCT_LIST_ADAPTER.validate_python(payload))).body
+    return cached.encode()
+
+
+def legacy_hit(cached: bytes) -> bytes:
+    payload = json.loads(cached)
+    return JSONResponse(jsonable_encoder(PRODUCT_LIST_ADAPTER.validate_python(payload))).body
+
+
+def fast_miss(products: list[Product]) -> bytes:
+    return dump_products(products)
+
+
+def fast_hit(cached: bytes) -> bytes:
+    return cached
+
+
+def response_model_orjson(products: list[Product]) -> bytes:
+    """Обычные эндпоинты с response_model после смены default_response_class."""
+    return ORJSONResponse(jsonable_encoder(PRODUCT_LIST_ADAPTER.validate_python(products, from_attributes=True))).body
+
+
+def measure(func: Callable[[], object], repeat: int) -> tuple[float, float]:
+    timer = timeit.Timer(func)
+    runs = [timer.timeit(number=repeat) / repeat * 1e6 for _ in range(5)]
+    return statistics.median(runs), min(runs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=20, help="товаров в одном ответе")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    products = build_products(args.products, DatasetSpec(embedding_dim=settings.product_embedding_dim))
+    legacy_cached = legacy_miss(products)
+    fast_cached = fast_miss(products)
+    assert json.loads(legacy_hit(legacy_cached)) == json.loads(fast_cached)
+
+    cases = {
+        "legacy miss": lambda: legacy_miss(products),
+        "fast miss": lambda: fast_miss(products),
+        "legacy hit": lambda: legacy_hit(legacy_cached),
+        "fast hit": lambda: fast_hit(fast_cached),
+        "response_model+orjson": lambda: response_model_orjson(products),
+    }
+    print(f"{'path':<24}{'median us':>12}{'best us':>12}   ({args.products} products, {len(fast_cached)} bytes)")
+    for name, func in cases.items():
+        median, best = measure(func, args.repeat)
+        print(f"{name:<24}{median:>12.1f}{best:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()